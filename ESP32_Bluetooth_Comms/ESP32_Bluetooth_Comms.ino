@@ -4,7 +4,13 @@
 
 // Author: Max Chen
 // Date: 2025-03-04
-// v0.1.3
+// v0.2.1
+
+// Serial protocol: the GUI sends "<seq> <command>" (e.g. "17 unlock") and gets
+// "ACK <seq> <LOCKED|UNLOCKED>" back once the lock pin is set, or "NAK <seq> <reason>".
+// Lock and unlock are idempotent, so a retransmitted command is only acknowledged again.
+// A bare "lock" / "unlock" from a serial terminal still works and replies "Message sent!".
+// "ping" answers "PONG PPE-GATE", the GUI uses it to find the gate among the USB serial ports.
 
 // Wiring: ESP32 Pin D2 -- Onboard LED
 // Wiring: ESP32 Pin D5 -- Green LED -- GND
@@ -60,11 +66,54 @@ void loop()
   {
     String input = Serial.readStringUntil('\n');  // Read the serial input until a newline character
     
-    // Trim any leading/trailing whitespace and convert to lowercase
+    // Trim any leading/trailing whitespace
     input.trim();
-    
-    // Check if the input matches the word "unlock"
-    if (input == "unlock" && currentState != UNLOCKED) 
+
+    // Discovery handshake from the GUI
+    if (input == "ping")
+    {
+      Serial.println("PONG PPE-GATE");
+      return;
+    }
+
+    // Split off the sequence number, if the GUI sent one
+    long seq = -1;
+    String command = input;
+    int space = input.indexOf(' ');
+    if (space > 0)
+    {
+      seq = input.substring(0, space).toInt();
+      command = input.substring(space + 1);
+      command.trim();
+    }
+
+    bool known = applyCommand(command);
+
+    if (seq > 0)
+    {
+      if (known)
+      {
+        Serial.print("ACK ");
+        Serial.print(seq);
+        Serial.println(currentState == LOCKED ? " LOCKED" : " UNLOCKED");
+      }
+      else
+      {
+        Serial.print("NAK ");
+        Serial.print(seq);
+        Serial.println(" unknown-command");
+      }
+    }
+  }
+}
+
+// Moves the gate to the requested state, returns false for unknown commands
+bool applyCommand(String command)
+{
+  // Check if the input matches the word "unlock"
+  if (command == "unlock")
+  {
+    if (currentState != UNLOCKED)
     {
       // Send Bluetooth message
       ESP_BT.println("OPEN THE GATE!");
@@ -79,9 +128,13 @@ void loop()
       // Set lock to unlock
       digitalWrite(lock, LOW);
     }
+    return true;
+  }
 
-    // Check if the input matches the word "lock"
-    if (input == "lock" && currentState != LOCKED) 
+  // Check if the input matches the word "lock"
+  if (command == "lock")
+  {
+    if (currentState != LOCKED)
     {
       // Send Bluetooth message
       ESP_BT.println("LOCK THE GATE!");
@@ -96,7 +149,10 @@ void loop()
       // Set lock to lock
       digitalWrite(lock, HIGH);
     }
+    return true;
   }
+
+  return false;
 }
 
 // Blink the Onboard LED for -.
@@ -0,0 +1,292 @@
+# ESP32 gate controller simulator for testing the GUI without hardware.
+# Speaks the same serial line protocol as ESP32_Bluetooth_Comms.ino (v0.2.1) over a pseudo-terminal.
+#
+#   python ESP32_Bluetooth_Comms/esp32_simulator.py --link /tmp/ttyESP32
+#   ESP32_PORT=/tmp/ttyESP32 python vending_gui/main_gui.py
+#
+#   python ESP32_Bluetooth_Comms/esp32_simulator.py --bench 200 --time-scale 0 --drop-rate 0.05
+
+import argparse
+import logging
+import os
+import random
+import select
+import signal
+import sys
+import threading
+import time
+import tty
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("esp32_simulator")
+
+LOCKED = "LOCKED"
+UNLOCKED = "UNLOCKED"
+
+# LED blink patterns from the sketch, (on ms, off ms) per blink
+DASH_DOT = ((175, 75), (75, 75))  # dashDot(), shown when locking
+DOT_DOT_DOT = ((75, 75),) * 4     # dotdotdot(), shown when unlocking, the loop runs for i = 0..3
+BOOT_DELAY_MS = 1000              # delay(1000) in setup() before the initial lock message
+
+
+class ESP32Simulator:
+    """
+    Simulated gate controller behind a pty.
+
+    Commands are handled one at a time on a single thread, like the sketch's loop(),
+    so a command arriving during a blink waits for it to finish. Faults:
+      latency_ms / jitter_ms  extra delay before each reply, on top of the blinks
+      drop_rate               fraction of received lines ignored entirely
+      ack_drop_rate           fraction of ACKs not sent, the command is still applied
+      time_scale              multiplies the blink and boot delays, 0 for none
+      legacy                  behave like a sketch before v0.2.1 (no ping, no sequence numbers)
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, drop_rate=0.0, ack_drop_rate=0.0, time_scale=1.0, legacy=False, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.drop_rate = drop_rate
+        self.ack_drop_rate = ack_drop_rate
+        self.time_scale = time_scale
+        self.legacy = legacy
+        self.random = random.Random(seed)
+        self.state = LOCKED
+        self.stats = {'lines': 0, 'dropped': 0, 'acks': 0, 'acks_dropped': 0, 'naks': 0, 'pings': 0, 'state_changes': 0}
+        self.master_fd = None
+        self.slave_fd = None
+        self.port = None
+        self.link_path = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self, link_path=None):
+        """Opens the pty and starts the firmware loop, returns the port path for the GUI."""
+        self.master_fd, self.slave_fd = os.openpty()  # Keeping slave_fd open stops reads failing while no client is attached
+        tty.setraw(self.master_fd)
+        tty.setraw(self.slave_fd)
+        self.port = os.ttyname(self.slave_fd)
+        if link_path:
+            if os.path.lexists(link_path):
+                os.remove(link_path)
+            os.symlink(self.port, link_path)
+            self.link_path = link_path
+        self._thread = threading.Thread(target=self._run, name="esp32-simulator", daemon=True)
+        self._thread.start()
+        logger.info(f"Simulated ESP32 on {link_path or self.port}")
+        return link_path or self.port
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                os.close(fd)
+        if self.link_path and os.path.islink(self.link_path):
+            os.remove(self.link_path)
+
+    # --- Firmware ---
+
+    def _delay(self, ms):
+        if ms and self.time_scale:
+            time.sleep(ms * self.time_scale / 1000.0)
+
+    def _blink(self, pattern):
+        for on_ms, off_ms in pattern:
+            self._delay(on_ms)
+            self._delay(off_ms)
+
+    def _println(self, line):
+        os.write(self.master_fd, f"{line}\r\n".encode('utf-8'))  # Serial.println() ends lines with CRLF
+
+    def _setup(self):
+        self._println("Bluetooth device is ready to pair.")
+        self._println("Enter 'send' to send a message over Bluetooth.")
+        self._delay(BOOT_DELAY_MS)
+        self._println("Initial lock message sent!")
+        self._blink(DASH_DOT)
+
+    def _run(self):
+        self._setup()
+        buffer = b""
+        while not self._stop_event.is_set():
+            readable, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if not readable:
+                continue
+            try:
+                buffer += os.read(self.master_fd, 1024)
+            except OSError:
+                continue
+            while b"\n" in buffer:
+                raw, buffer = buffer.split(b"\n", 1)
+                self._handle_line(raw.decode('utf-8', errors='replace').strip())
+
+    def _handle_line(self, line):
+        if not line:
+            return
+        self.stats['lines'] += 1
+        if self.random.random() < self.drop_rate:
+            self.stats['dropped'] += 1
+            logger.info(f"Dropped: {line}")
+            return
+
+        if line == "ping" and not self.legacy:
+            self.stats['pings'] += 1
+            self._reply_delay()
+            self._println("PONG PPE-GATE")
+            return
+
+        seq = None
+        command = line
+        parts = line.split(" ", 1)
+        if len(parts) == 2 and not self.legacy:
+            try:
+                seq = int(parts[0])
+                command = parts[1].strip()
+            except ValueError:
+                seq = None
+
+        known = self._apply_command(command)
+        if seq is None or seq <= 0:
+            return
+        self._reply_delay()
+        if not known:
+            self.stats['naks'] += 1
+            self._println(f"NAK {seq} unknown-command")
+        elif self.random.random() < self.ack_drop_rate:
+            self.stats['acks_dropped'] += 1
+            logger.info(f"Dropped ACK {seq}")
+        else:
+            self.stats['acks'] += 1
+            self._println(f"ACK {seq} {self.state}")
+
+    def _reply_delay(self):
+        if self.latency_ms or self.jitter_ms:
+            time.sleep(max(0.0, self.random.gauss(self.latency_ms, self.jitter_ms)) / 1000.0)
+
+    def _apply_command(self, command):
+        """Same state machine as applyCommand() in the sketch, returns False for unknown commands."""
+        if command == "unlock":
+            if self.state != UNLOCKED:
+                self._println("Message sent!")
+                self.state = UNLOCKED
+                self.stats['state_changes'] += 1
+                self._blink(DOT_DOT_DOT)
+                logger.info("Gate UNLOCKED")
+            return True
+        if command == "lock":
+            if self.state != LOCKED:
+                self._println("Message sent!")
+                self.state = LOCKED
+                self.stats['state_changes'] += 1
+                self._blink(DASH_DOT)
+                logger.info("Gate LOCKED")
+            return True
+        return False
+
+
+def run_bench(simulator, commands):
+    """
+    Drives the GUI's ESP32Link against the simulator with alternating unlock/lock
+    commands, one at a time like the override button, and reports round-trip times.
+    """
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from PySide6.QtCore import QCoreApplication, Qt
+    from vending_gui.esp32_link import ESP32Link
+    from vending_gui.metrics import latency_summary
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    port = simulator.start()
+    link = ESP32Link(port, settle_time=0.1)
+    done = threading.Event()
+    connected = threading.Event()
+    results = []  # (command, rtt or None)
+    unacked = []  # Commands sent to a legacy sketch, which never acknowledges
+
+    # Called directly on the link thread, no event loop needed
+    def on_state(state):
+        if state == "connected":
+            connected.set()
+
+    def on_unacked(command):
+        unacked.append(command)
+        done.set()
+
+    def on_result(command, rtt):
+        results.append((command, rtt))
+        done.set()
+
+    link.state_changed.connect(on_state, Qt.DirectConnection)
+    link.command_acked.connect(lambda command, rtt, state: on_result(command, rtt), Qt.DirectConnection)
+    link.command_failed.connect(lambda command, reason: on_result(command, None), Qt.DirectConnection)
+    link.command_sent_unacked.connect(on_unacked, Qt.DirectConnection)
+    link.start()
+    if not connected.wait(10):
+        raise SystemExit("Link did not connect to the simulator")
+    done.wait(10)  # The link's own initial lock
+    results.clear()
+    unacked.clear()
+
+    started = time.perf_counter()
+    for i in range(commands):
+        done.clear()
+        link.send("unlock" if i % 2 == 0 else "lock")
+        done.wait(30)
+    elapsed = time.perf_counter() - started
+    legacy = link.legacy  # Reset when the link closes the port
+    link.stop()
+    link.wait()
+    simulator.stop()
+    retransmits = link.retransmit_counter.value
+    link.deleteLater()  # Release the QThread now, PySide can abort when it is collected at interpreter exit
+    del link
+
+    rtt = latency_summary([rtt for _, rtt in results if rtt is not None], digits=1)
+    print(f"\n=== ESP32 Gate Benchmark ===")
+    if legacy:
+        print(f"Legacy sketch detected, {len(unacked)} commands sent without ACKs in {elapsed:.2f}s, simulator: {simulator.stats}")
+        return 0 if len(unacked) == commands else 1
+    print(f"Commands: {len(results)} in {elapsed:.2f}s ({len(results) / elapsed:.1f}/s), "
+          f"acknowledged: {rtt['count']}, failed: {len(results) - rtt['count']}")
+    if rtt['count']:
+        print(f"Round trip: mean {rtt['mean_ms']} ms, p50 {rtt['p50_ms']} ms, p95 {rtt['p95_ms']} ms, max {rtt['max_ms']} ms")
+    print(f"Retransmits: {retransmits}, simulator: {simulator.stats}")
+    return 0 if rtt['count'] == len(results) else 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulated ESP32 gate controller on a pseudo-terminal")
+    parser.add_argument('--link', help="Also expose the port under this path, e.g. /tmp/ttyESP32")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Extra delay before each reply")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Standard deviation of the extra delay")
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="Fraction of received lines ignored, 0.05 is 5%%")
+    parser.add_argument('--ack-drop-rate', type=float, default=0.0, help="Fraction of ACKs not sent although the command is applied")
+    parser.add_argument('--time-scale', type=float, default=1.0, help="Multiplier for the blink and boot delays, 0 disables them")
+    parser.add_argument('--legacy', action='store_true', help="Behave like a sketch before v0.2.1, without ACKs or the ping handshake")
+    parser.add_argument('--seed', type=int, help="Random seed for reproducible drops and jitter")
+    parser.add_argument('--bench', type=int, metavar='N', help="Send N unlock/lock commands through the GUI's ESP32Link and report round trips")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    simulator = ESP32Simulator(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, drop_rate=args.drop_rate,
+                               ack_drop_rate=args.ack_drop_rate, time_scale=args.time_scale, legacy=args.legacy, seed=args.seed)
+    if args.bench:
+        sys.exit(run_bench(simulator, args.bench))
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # Clean up the link when stopped by a test harness too
+    port = simulator.start(args.link)
+    print(f"Point the GUI at {port} (Settings > COM Port, or ESP32_PORT in .env). Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+        logger.info(f"Stats: {simulator.stats}")
@@ -0,0 +1,197 @@
+# Tests for the GUI's ESP32Link against the ESP32 simulator on a pty.
+# Run from the repository root with: python -m unittest discover ESP32_Bluetooth_Comms
+
+import os
+import queue
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PySide6.QtCore import QCoreApplication, Qt
+
+from esp32_simulator import ESP32Simulator, LOCKED, UNLOCKED
+from vending_gui import esp32_link
+from vending_gui.esp32_link import ESP32Link, CONNECTED
+
+app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+EVENT_TIMEOUT_S = 5.0
+
+
+class LinkTestCase(unittest.TestCase):
+    def start_simulator(self, **kwargs):
+        simulator = ESP32Simulator(time_scale=0, seed=1, **kwargs)
+        port = simulator.start()
+        self.addCleanup(simulator.stop)
+        return simulator, port
+
+    def start_link(self, port, **kwargs):
+        """Starts a link whose signals are collected on self.events, called directly on the link thread"""
+        link = ESP32Link(port, settle_time=0, reconnect_interval=0.1, ack_timeout=0.2, **kwargs)
+        self.events = queue.Queue()
+        link.state_changed.connect(lambda state: self.events.put(('state', state)), Qt.DirectConnection)
+        link.command_acked.connect(lambda command, rtt, state: self.events.put(('acked', command, state)), Qt.DirectConnection)
+        link.command_failed.connect(lambda command, reason: self.events.put(('failed', command, reason)), Qt.DirectConnection)
+        link.command_sent_unacked.connect(lambda command: self.events.put(('unacked', command)), Qt.DirectConnection)
+        link.start()
+        self.addCleanup(self.stop_link, link)
+        return link
+
+    @staticmethod
+    def stop_link(link):
+        link.stop()
+        link.wait()
+        link.deleteLater()
+
+    def expect(self, *event, timeout=EVENT_TIMEOUT_S):
+        """Waits for the first event starting with the given values, returns it"""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.fail(f"No {event} within {timeout}s")
+            try:
+                received = self.events.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if received[:len(event)] == event:
+                return received
+
+    def assertNoEvent(self, *event, wait=0.5):
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            try:
+                received = self.events.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                return
+            self.assertNotEqual(received[:len(event)], event)
+
+
+class ESP32LinkTest(LinkTestCase):
+    def test_connects_locked_and_switches_the_gate(self):
+        simulator, port = self.start_simulator()
+        link = self.start_link(port)
+        self.expect('state', CONNECTED)
+        self.expect('acked', 'lock', LOCKED)  # Every connection starts locked
+        link.send('unlock')
+        self.expect('acked', 'unlock', UNLOCKED)
+        self.assertEqual(simulator.state, UNLOCKED)
+
+    def test_commands_sent_while_disconnected_are_dropped(self):
+        simulator, port = self.start_simulator()
+        link = self.start_link(os.path.join(os.path.dirname(port), 'no-such-port'))
+        link.send('unlock')
+        link.set_port(port)
+        self.expect('acked', 'lock', LOCKED)
+        self.assertNoEvent('acked', 'unlock')
+        self.assertEqual(simulator.state, LOCKED)
+
+
+class AckProtocolTest(LinkTestCase):
+    def test_retransmits_after_a_dropped_ack(self):
+        simulator, port = self.start_simulator()
+        link = self.start_link(port)
+        self.expect('acked', 'lock')
+        retransmits = link.retransmit_counter.value
+        simulator.ack_drop_rate = 1.0
+        link.send('unlock')
+        deadline = time.monotonic() + EVENT_TIMEOUT_S
+        while simulator.stats['acks_dropped'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        simulator.ack_drop_rate = 0.0  # The retransmit, ack_timeout later, is acknowledged
+        self.expect('acked', 'unlock', UNLOCKED)
+        self.assertEqual(link.retransmit_counter.value - retransmits, 1)
+
+    def test_fails_after_max_attempts_without_ack(self):
+        simulator, port = self.start_simulator(ack_drop_rate=1.0)
+        self.start_link(port, max_attempts=3)
+        _, _, reason = self.expect('failed', 'lock')
+        self.assertEqual(reason, "no ACK after 3 attempts")
+        self.assertEqual(simulator.stats['acks_dropped'], 3)
+        self.assertEqual(simulator.state, LOCKED)  # Applied although never acknowledged
+
+    def test_nak_fails_the_command(self):
+        simulator, port = self.start_simulator()
+        link = self.start_link(port)
+        self.expect('acked', 'lock')
+        link.send('open-sesame')
+        _, _, reason = self.expect('failed', 'open-sesame')
+        self.assertEqual(reason, "rejected: unknown-command")
+        self.assertEqual(simulator.stats['naks'], 1)
+
+    def test_legacy_sketch_gets_plain_commands(self):
+        simulator, port = self.start_simulator(legacy=True)
+        link = self.start_link(port)
+        self.expect('unacked', 'lock')  # No PONG, so no sequence numbers or ACK waits
+        self.assertTrue(link.legacy)
+        link.send('unlock')
+        self.expect('unacked', 'unlock')
+        deadline = time.monotonic() + EVENT_TIMEOUT_S
+        while simulator.state != UNLOCKED and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(simulator.state, UNLOCKED)
+        self.assertNoEvent('failed', wait=1.0)  # Longer than max_attempts * ack_timeout
+
+
+class DiscoveryTest(LinkTestCase):
+    """Runs _discover() on the test thread against a fake USB port list"""
+
+    def silent_port(self):
+        """A pty nothing answers on, like an unrelated USB serial device"""
+        master, slave = os.openpty()
+        self.addCleanup(os.close, master)
+        self.addCleanup(os.close, slave)
+        return os.ttyname(slave)
+
+    def discovery_link(self, ports, **kwargs):
+        patcher = mock.patch.object(esp32_link, 'list_candidate_ports', lambda: list(ports))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        link = ESP32Link(None, settle_time=0, **kwargs)
+        self.addCleanup(link._close)
+        return link
+
+    def test_finds_the_simulator_and_backs_off_the_silent_port(self):
+        _, port = self.start_simulator()
+        silent = self.silent_port()
+        link = self.discovery_link([(silent, 'CP2102', True), (port, 'CH340', True)])
+        self.assertTrue(link._discover())
+        self.assertEqual(link.connected_port, port)
+        self.assertFalse(link.legacy)
+        self.assertIn(silent, link._probe_backoff)
+
+    @mock.patch.object(esp32_link, 'PROBE_BACKOFF_S', 0.2)
+    def test_silent_port_is_probed_again_after_the_back_off(self):
+        silent = self.silent_port()
+        link = self.discovery_link([(silent, 'CP2102', True)])
+        with mock.patch.object(link, '_open', wraps=link._open) as probe:
+            self.assertFalse(link._discover())
+            self.assertFalse(link._discover())  # Still backing off
+            self.assertEqual(probe.call_count, 1)
+            time.sleep(0.25)
+            self.assertFalse(link._discover())
+            self.assertEqual(probe.call_count, 2)
+        retry_at, misses = link._probe_backoff[silent]
+        self.assertEqual(misses, 2)
+        self.assertAlmostEqual(retry_at - time.monotonic(), 0.4, delta=0.1)  # Doubled
+
+    def test_unknown_usb_ids_are_only_probed_when_asked(self):
+        _, port = self.start_simulator()
+        link = self.discovery_link([(port, 'USB serial', False)])
+        self.assertFalse(link._discover())
+        link = self.discovery_link([(port, 'USB serial', False)], probe_all_ports=True)
+        self.assertTrue(link._discover())
+        self.assertEqual(link.connected_port, port)
+
+    def test_legacy_sketch_is_only_taken_by_usb_id_when_asked(self):
+        _, port = self.start_simulator(legacy=True)
+        link = self.discovery_link([(port, 'CP2102', True)])
+        self.assertFalse(link._discover())
+        link = self.discovery_link([(port, 'CP2102', True)], legacy_fallback=True)
+        self.assertTrue(link._discover())
+        self.assertTrue(link.legacy)
+
+
+if __name__ == '__main__':
+    unittest.main()
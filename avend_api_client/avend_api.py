@@ -4,25 +4,294 @@ Implements AVend Local Dispense API Guide v1.2.2
 Max Chen
 """
 
-import requests
+import collections
+import heapq
+import itertools
+import logging
+import random
 import threading
 import time
+import uuid
+
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+logger = logging.getLogger(__name__)
+
+MIN_CONNECT_TIMEOUT = 0.1  # Seconds, a retry with less time left before the dispense deadline is not attempted
+
+class PeriodicScheduler:
+    """
+    Runs periodic jobs (H1 keep-alive, health probes, polling) on a single daemon thread.
+
+    Jobs are kept in a heap ordered by due time and rescheduled from their previous
+    due time, so request latency does not make them drift. Ticks missed while a job
+    overran are skipped rather than run back to back. Removing a job or stopping the
+    scheduler takes effect immediately without waiting for a sleep to finish.
+    """
+    def __init__(self, name="avend-scheduler"):
+        self.name = name
+        self._jobs = {}  # Job name -> job dict
+        self._heap = []  # (due, generation, name), stale entries are skipped
+        self._generation = itertools.count()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()  # Stop event of the current thread, a restart gets a new one
+        self._thread = None
+
+    def add_job(self, name, func, interval, delay=0.0):
+        """
+        Schedule func to run every interval seconds, replacing any job with the same name
+
+        Args:
+            name (str): Unique job name
+            func (callable): Called with no arguments on the scheduler thread
+            interval (float): Seconds between runs
+            delay (float): Seconds before the first run
+        """
+        with self._cond:
+            job = {"func": func, "interval": interval, "due": time.monotonic() + delay,
+                   "generation": next(self._generation)}
+            self._jobs[name] = job
+            heapq.heappush(self._heap, (job["due"], job["generation"], name))
+            self._cond.notify()
+            # A thread told to stop may still be exiting, it keeps its own event and a new thread takes over
+            if self._thread is None or not self._thread.is_alive() or self._stop.is_set():
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._stop,), name=self.name, daemon=True)
+                self._thread.start()
+
+    def remove_job(self, name):
+        """Remove a job, returns True if it was scheduled"""
+        with self._cond:
+            removed = self._jobs.pop(name, None) is not None
+            self._cond.notify()
+        return removed
+
+    def has_job(self, name):
+        with self._cond:
+            return name in self._jobs
+
+    def stop(self):
+        """Stop the scheduler thread and drop all jobs"""
+        with self._cond:
+            self._jobs.clear()
+            self._heap.clear()
+            self._stop.set()
+            self._cond.notify()
+
+    def _run(self, stop):
+        while not stop.is_set():
+            with self._cond:
+                if stop.is_set():
+                    break
+                # Drop heap entries of removed or replaced jobs
+                while self._heap:
+                    due, generation, name = self._heap[0]
+                    job = self._jobs.get(name)
+                    if job is not None and job["generation"] == generation:
+                        break
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+
+            try:
+                job["func"]()
+            except Exception as e:
+                logger.error("Scheduled job %s failed: %s", name, e)
+
+            with self._cond:
+                if self._jobs.get(name) is job:  # Not removed or replaced while running
+                    interval = job["interval"]
+                    job["due"] += interval
+                    now = time.monotonic()
+                    if job["due"] <= now:
+                        job["due"] += interval * ((now - job["due"]) // interval + 1)
+                    heapq.heappush(self._heap, (job["due"], job["generation"], name))
+
+
+# Shared by every AvendAPI instance unless one is passed in explicitly
+default_scheduler = PeriodicScheduler()
+
+
+class DispenseQueue:
+    """
+    Serializes hardware-affecting AVend calls on a single worker thread.
+
+    A request whose key is already queued or running, or was accepted less than
+    debounce seconds ago, is coalesced into that request instead of being sent
+    again. At most max_in_flight requests (queued plus running) are accepted.
+    """
+    QUEUED = "queued"
+    COALESCED = "coalesced"
+    REJECTED = "rejected"
+
+    def __init__(self, debounce=1.0, max_in_flight=4, name="avend-dispense-queue"):
+        self.debounce = debounce
+        self.max_in_flight = max_in_flight
+        self.name = name
+        self._queue = collections.deque()  # (key, func, callback)
+        self._pending = set()  # Keys queued or running
+        self._last_accepted = {}  # Key -> monotonic time of the last accepted submit
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def submit(self, key, func, callback=None):
+        """
+        Queue func to run on the worker thread
+
+        Args:
+            key (hashable): Identifies duplicate requests, e.g. ("item", "8D1")
+            func (callable): Performs the API calls and returns a result dict
+            callback (callable): Called as callback(key, result) on the worker thread
+        Returns:
+            str: QUEUED, COALESCED or REJECTED
+        """
+        now = time.monotonic()
+        with self._cond:
+            if self._stopped:
+                return self.REJECTED
+            last = self._last_accepted.get(key)
+            if key in self._pending or (last is not None and now - last < self.debounce):
+                logger.info("Dispense request %s coalesced", key)
+                return self.COALESCED
+            if len(self._pending) >= self.max_in_flight:
+                logger.warning("Dispense request %s rejected, %d already in flight", key, len(self._pending))
+                return self.REJECTED
+            self._pending.add(key)
+            self._last_accepted[key] = now
+            self._queue.append((key, func, callback))
+            self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return self.QUEUED
+
+    def depth(self):
+        """Number of requests queued or running"""
+        with self._cond:
+            return len(self._pending)
+
+    def stop(self):
+        """Drop queued requests and stop the worker after the running one finishes"""
+        with self._cond:
+            self._stopped = True
+            for key, _, _ in self._queue:
+                self._pending.discard(key)
+            self._queue.clear()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                key, func, callback = self._queue.popleft()
+
+            try:
+                result = func()
+            except Exception as e:
+                logger.error("Dispense request %s failed: %s", key, e)
+                result = {"success": False, "error": str(e)}
+
+            with self._cond:
+                self._pending.discard(key)
+            if callback:
+                try:
+                    callback(key, result)
+                except Exception as e:
+                    logger.error("Dispense callback for %s failed: %s", key, e)
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive connection failures to the AVend kit.
+
+    CLOSED lets every call through. After failure_threshold consecutive failures the
+    breaker trips to OPEN and calls fail fast until a background health probe
+    succeeds and closes it again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+
+    def __init__(self, failure_threshold=3, on_state_change=None):
+        self.failure_threshold = failure_threshold
+        self.on_state_change = on_state_change  # Called with the new state on every transition
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a call may be sent to the kit"""
+        with self._lock:
+            return self.state == self.CLOSED
+
+    def record_success(self):
+        """Reset the failure count and close the breaker"""
+        with self._lock:
+            self.consecutive_failures = 0
+            changed = self.state != self.CLOSED
+            self.state = self.CLOSED
+            self.opened_at = None
+        if changed:
+            self._notify(self.CLOSED)
+
+    def record_failure(self):
+        """Count a connection failure, returns True if this failure tripped the breaker"""
+        with self._lock:
+            self.consecutive_failures += 1
+            tripped = self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+            if tripped:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+        if tripped:
+            self._notify(self.OPEN)
+        return tripped
+
+    def _notify(self, state):
+        logger.warning("AVend circuit breaker %s", state.upper())
+        if self.on_state_change:
+            try:
+                self.on_state_change(state)
+            except Exception as e:
+                logger.error("Circuit breaker state callback failed: %s", e)
+
 
 class AvendAPI:
-    def __init__(self, host="127.0.0.1", port=8080): # Defaults with the set LocalHost and Port
+    def __init__(self, host="127.0.0.1", port=8080, on_state_change=None, scheduler=None): # Defaults with the set LocalHost and Port
         self.base_url = f"http://{host}:{port}/avend"
         self.session = requests.Session()  # Keeps cookie between calls
-        self.service_thread = None
+        self.scheduler = scheduler or default_scheduler  # Runs the H1 routine and health probe
+        self._job_prefix = f"{self.base_url}#{id(self)}"  # Keeps job names unique on a shared scheduler
         self.service_running = False
         self.service_interval = 20  # Default H1 Request Interval is 20s
+        self.hardware_lock = threading.RLock()  # Keeps session/dispense pairs from interleaving across threads
+
+        # Dispense retry policy, only applied to failures that never reached the kit
+        self.connect_timeout = 3.0  # Seconds allowed to establish the TCP connection
+        self.read_timeout = 30.0  # Seconds to wait for the kit's answer, covers the motor run, never retried
+        self.max_retries = 3  # Extra attempts after the first one
+        self.backoff_base = 0.25  # Seconds, doubled on every attempt
+        self.backoff_cap = 2.0  # Upper bound of a single backoff sleep
+        self.retry_deadline = 8.0  # Total time budget for one dispense including retries
+
+        # Circuit breaker, fails fast while the kit is unreachable and probes get_info() to recover
+        self.breaker = CircuitBreaker(failure_threshold=3, on_state_change=on_state_change)
+        self.probe_interval = 5.0  # Seconds between health probes while the breaker is open
+        self.probe_session = requests.Session()  # Used only on the scheduler thread, a Session is not thread-safe
 
     def start_session(self): # Start a new session
         params = {"action": "start"}
-        try:
-            response = self.session.get(self.base_url, params=params)
-            return self._format_response(response)
-        except requests.RequestException as e:
-            return {"success": False, "error": str(e)}
+        return self._get(self.base_url, params)
 
     def dispense(self, code=None, mode=None): # Dispense a product by code
         params = {"action": "dispense"}
@@ -30,43 +299,141 @@ class AvendAPI:
             params["code"] = code
         if mode:
             params["mode"] = mode
-        try:
-            response = self.session.get(self.base_url, params=params)
-            return self._format_response(response)
-        except requests.RequestException as e:
-            return {"success": False, "error": str(e)}
+        request_id = uuid.uuid4().hex[:12]  # Logged with every attempt so duplicates can be traced
+        result = self._get_with_retry(self.base_url, params, request_id)
+        result["request_id"] = request_id
+        return result
+
+    def vend(self, code, mode=None): # Start a session and dispense a product in it
+        """Start a session and dispense code, holding hardware_lock so no other vend interleaves"""
+        with self.hardware_lock:
+            session_response = self.start_session()
+            if not session_response.get("success", False):
+                return session_response
+            return self.dispense(code=code, mode=mode)
+
+    def dispense_cart(self, codes, mode=None): # Dispense several products in one session
+        """
+        Start one session, add every code to the cart and dispense the cart.
+
+        This takes N+2 requests instead of 2N separate start/dispense pairs. If any
+        add fails the cart is cleared and nothing is dispensed.
+
+        Args:
+            codes (list): Product codes to dispense
+            mode (str): Optional dispense mode passed to the cart dispense
+        """
+        with self.hardware_lock:
+            session_response = self.start_session()
+            if not session_response.get("success", False):
+                return session_response
+            for code in codes:
+                add_response = self.add_to_cart(code)
+                if not add_response.get("success", False):
+                    self.clear_cart()
+                    add_response["failed_code"] = code
+                    return add_response
+            return self.dispense(mode=mode)
 
     def get_info(self): # Get information about the AVend middleware
         url = f"{self.base_url}/info"
-        try:
-            response = self.session.get(url)
-            return self._format_response(response)
-        except requests.RequestException as e:
-            return {"success": False, "error": str(e)}
+        return self._get(url)
 
     def add_to_cart(self, code): # Add a product to the cart
         params = {"action": "add", "code": code}
-        try:
-            response = self.session.get(self.base_url, params=params)
-            return self._format_response(response)
-        except requests.RequestException as e:
-            return {"success": False, "error": str(e)}
+        return self._get(self.base_url, params)
 
     def remove_from_cart(self, code): # Remove a product from the cart
         params = {"action": "remove", "code": code}
-        try:
-            response = self.session.get(self.base_url, params=params)
-            return self._format_response(response)
-        except requests.RequestException as e:
-            return {"success": False, "error": str(e)}
+        return self._get(self.base_url, params)
 
     def clear_cart(self): # Clear the cart
         params = {"action": "clear"}
+        return self._get(self.base_url, params)
+
+    def close(self):
+        """Stop background work (service routine and health probe) owned by this client"""
+        self.stop_service_routine()
+        self.scheduler.remove_job(f"{self._job_prefix}:probe")
+        self.probe_session.close()
+
+    def _get(self, url, params=None):
+        """Send a single GET request through the circuit breaker"""
+        if not self.breaker.allow_request():
+            return self._circuit_open_response()
         try:
-            response = self.session.get(self.base_url, params=params)
-            return self._format_response(response)
+            response = self.session.get(url, params=params, timeout=(self.connect_timeout, self.read_timeout))
         except requests.RequestException as e:
+            self._record_failure()
             return {"success": False, "error": str(e)}
+        self.breaker.record_success()  # Any HTTP answer means the middleware is reachable
+        return self._format_response(response)
+
+    def _circuit_open_response(self):
+        return {"success": False, "circuit_open": True,
+                "error": "AVend kit unreachable, waiting for it to come back online"}
+
+    def _record_failure(self):
+        """Count a failed call and start the health probe if the breaker just tripped"""
+        if self.breaker.record_failure():
+            self._start_health_probe()
+
+    def _start_health_probe(self):
+        self.scheduler.add_job(f"{self._job_prefix}:probe", self._health_probe,
+                               self.probe_interval, delay=self.probe_interval)
+
+    def _health_probe(self):
+        """Probe get_info() until the kit answers, then close the breaker and stop probing"""
+        try:
+            self.probe_session.get(f"{self.base_url}/info", timeout=(self.connect_timeout, self.probe_interval))
+        except requests.RequestException as e:
+            logger.info("AVend health probe failed: %s", e)
+            return
+        self.scheduler.remove_job(f"{self._job_prefix}:probe")
+        self.breaker.record_success()
+
+    def _get_with_retry(self, url, params, request_id):
+        """
+        Send a GET request, retrying only when the connection could not be established.
+
+        A failure after the request may have reached the kit (read timeout, dropped
+        connection, HTTP error) is never retried, so a dispense cannot be doubled.
+        Connect attempts and backoff sleeps together stay within retry_deadline.
+
+        Args:
+            url (str): Request URL
+            params (dict): Query parameters
+            request_id (str): Identifier sent as X-Request-ID and used in the log
+        """
+        if not self.breaker.allow_request():
+            logger.warning("AVend %s [%s] rejected, circuit open", params.get("action"), request_id)
+            return self._circuit_open_response()
+        headers = {"X-Request-ID": request_id}
+        deadline = time.monotonic() + self.retry_deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            connect_timeout = min(self.connect_timeout, max(deadline - time.monotonic(), MIN_CONNECT_TIMEOUT))
+            try:
+                response = self.session.get(url, params=params, headers=headers,
+                                            timeout=(connect_timeout, self.read_timeout))
+                logger.info("AVend %s [%s] attempt %d -> HTTP %d",
+                            params.get("action"), request_id, attempt, response.status_code)
+                self.breaker.record_success()
+                return self._format_response(response)
+            except requests.RequestException as e:
+                remaining = deadline - time.monotonic()
+                if not _is_connect_failure(e) or attempt > self.max_retries or remaining <= MIN_CONNECT_TIMEOUT:
+                    logger.warning("AVend %s [%s] attempt %d failed, giving up: %s",
+                                   params.get("action"), request_id, attempt, e)
+                    self._record_failure()
+                    return {"success": False, "error": str(e), "attempts": attempt}
+                # Full jitter backoff, leaving time for one more connect attempt before the deadline
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** (attempt - 1))))
+                delay = min(delay, remaining - MIN_CONNECT_TIMEOUT)
+                logger.warning("AVend %s [%s] attempt %d could not connect, retrying in %.2fs: %s",
+                               params.get("action"), request_id, attempt, delay, e)
+                time.sleep(delay)
 
     # The _post method is removed as the AVend API uses GET requests with query parameters
 
@@ -94,37 +461,37 @@ class AvendAPI:
         if interval is not None:
             self.service_interval = interval
             
-        # Stop any existing service routine
-        self.stop_service_routine()
-        
-        # Start a new service routine
+        # Schedule the routine, replacing any existing one, first H1 is sent right away
         self.service_running = True
-        self.service_thread = threading.Thread(target=self._service_routine_worker)
-        self.service_thread.daemon = True  # Thread will exit when main program exits
-        self.service_thread.start()
+        self.scheduler.add_job(f"{self._job_prefix}:h1", self._service_routine_tick, self.service_interval)
         
         return {"success": True, "message": f"Service routine started with interval {self.service_interval}s (running indefinitely)"}
     
     def stop_service_routine(self):
-        """Stop the service routine if it's running"""
+        """Stop the service routine if it's running, returns without waiting"""
         if self.service_running:
             self.service_running = False
-            if self.service_thread and self.service_thread.is_alive():
-                self.service_thread.join(timeout=1.0)  # Wait for thread to finish
+            self.scheduler.remove_job(f"{self._job_prefix}:h1")
             return {"success": True, "message": "Service routine stopped"}
         return {"success": True, "message": "No service routine was running"}
     
-    def _service_routine_worker(self):
-        """Worker function for the service routine thread that runs indefinitely"""
-        
-        while self.service_running:
+    def _service_routine_tick(self):
+        """One H1 call of the service routine, run on the scheduler thread"""
+        with self.hardware_lock:
             # Start a new session for each dispense
             self.start_session()
             
-            # Dispense H1
-            self.dispense(code="8H1")
-            
-            # Wait for the specified interval before next dispense
-            time.sleep(self.service_interval)
-        
-        # This will only be reached when stop_service_routine is called
\ No newline at end of file
+            # Dispense H1, unless the routine was stopped while the session was starting
+            if self.service_running:
+                self.dispense(code="8H1")
+
+
+def _is_connect_failure(exc):
+    """Return True if the request provably never reached the server (connect phase failed)."""
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError):
+        # requests wraps urllib3's MaxRetryError, whose reason tells us which phase failed
+        reason = getattr(exc.args[0], "reason", None) if exc.args else None
+        return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+    return False
@@ -0,0 +1,205 @@
+"""
+Load Generator for the AVend Local Dispense API
+Simulates a fleet of kiosks with AvendAPI clients and reports throughput, latency and errors per action
+Max Chen
+"""
+
+import argparse
+import functools
+import json
+import logging
+import random
+import threading
+import time
+
+from avend_api import AvendAPI
+
+# Kiosk slots (hardhat, glasses, vest, earplugs, gloves)
+SLOT_CODES = ["8D1", "8C2", "8A4", "8E7", "8B3"]
+SERVICE_CODE = "8H1"  # Non-existent product the service routine dispenses to keep the machine out of service mode
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list, same as vending_gui.metrics so reports compare"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def latency_summary(seconds, digits=2):
+    """Count, mean, p50/p95/p99 and max in milliseconds (rounded to digits) of a list of durations in seconds"""
+    values = sorted(seconds)
+    summary = {"count": len(values)}
+    summary["mean_ms"] = round(sum(values) / len(values) * 1000, digits) if values else None
+    for pct in (50, 95, 99):
+        value = percentile(values, pct)
+        summary[f"p{pct}_ms"] = round(value * 1000, digits) if value is not None else None
+    summary["max_ms"] = round(values[-1] * 1000, digits) if values else None
+    return summary
+
+
+class KioskStats:
+    """Latencies and errors recorded by one kiosk, merged after the run so kiosks never share a lock"""
+
+    def __init__(self):
+        self.latencies = {}  # Action -> list of seconds for successful calls
+        self.errors = {}  # Action -> {reason: count}
+        self.requests = 0  # HTTP requests sent, one action can take several
+
+    def record(self, action, seconds, result):
+        if result.get("success", False):
+            self.latencies.setdefault(action, []).append(seconds)
+        else:
+            reasons = self.errors.setdefault(action, {})
+            reason = error_reason(result)
+            reasons[reason] = reasons.get(reason, 0) + 1
+
+    def merge(self, other):
+        for action, values in other.latencies.items():
+            self.latencies.setdefault(action, []).extend(values)
+        for action, reasons in other.errors.items():
+            merged = self.errors.setdefault(action, {})
+            for reason, count in reasons.items():
+                merged[reason] = merged.get(reason, 0) + count
+        self.requests += other.requests
+
+
+def error_reason(result):
+    """Short label for a failed AvendAPI result"""
+    if result.get("circuit_open"):
+        return "circuit open"
+    if "status_code" in result:
+        return f"HTTP {result['status_code']}"
+    return "no response"
+
+
+class Kiosk(threading.Thread):
+    """
+    One simulated kiosk with its own AvendAPI client.
+
+    Between actions it waits an exponentially distributed think time, so the fleet
+    produces Poisson-like arrivals. Each action is a single item vend, a cart of
+    several items or a get_info() poll, picked by weight. Every h1_interval seconds
+    it also sends the H1 keep-alive (start session + dispense 8H1) like the GUI's
+    service routine.
+    """
+
+    def __init__(self, index, args, deadline):
+        super().__init__(name=f"kiosk-{index}", daemon=True)
+        self.args = args
+        self.deadline = deadline
+        self.stats = KioskStats()
+        self.rng = random.Random(args.seed + index if args.seed is not None else None)
+        self.api = AvendAPI(host=args.host, port=args.port)
+        # Count every HTTP request, and don't follow the mock server's redirect to its dashboard page
+        self.api.session.get = functools.partial(self._counted_get, self.api.session.get)
+
+    def _counted_get(self, get, url, **kwargs):
+        self.stats.requests += 1
+        kwargs.setdefault("allow_redirects", self.args.follow_redirects)
+        return get(url, **kwargs)
+
+    def run(self):
+        actions = ["vend", "cart", "info"]
+        weights = [self.args.vend_weight, self.args.cart_weight, self.args.info_weight]
+        next_h1 = time.monotonic() + self.rng.uniform(0, self.args.h1_interval) if self.args.h1_interval else None
+        time.sleep(self.rng.uniform(0, self.args.think_time))  # Spread the kiosks' first actions
+
+        while time.monotonic() < self.deadline:
+            if next_h1 is not None and time.monotonic() >= next_h1:
+                self._timed("h1", self.api.vend, SERVICE_CODE)
+                next_h1 += self.args.h1_interval
+            action = self.rng.choices(actions, weights)[0]
+            if action == "vend":
+                self._timed("vend", self.api.vend, self.rng.choice(SLOT_CODES))
+            elif action == "cart":
+                codes = self.rng.sample(SLOT_CODES, self.rng.randint(2, self.args.max_cart))
+                self._timed("cart", self.api.dispense_cart, codes)
+            else:
+                self._timed("info", self.api.get_info)
+            if self.args.think_time:
+                time.sleep(min(self.rng.expovariate(1.0 / self.args.think_time),
+                               max(0.0, self.deadline - time.monotonic())))
+        self.api.close()
+
+    def _timed(self, action, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.stats.record(action, time.perf_counter() - start, result)
+
+
+def run_load_test(args):
+    """Run the kiosks for args.duration seconds, returns (merged stats, elapsed seconds)"""
+    start = time.monotonic()
+    kiosks = [Kiosk(i, args, start + args.duration) for i in range(args.kiosks)]
+    for kiosk in kiosks:
+        kiosk.start()
+    for kiosk in kiosks:
+        kiosk.join()
+    elapsed = time.monotonic() - start
+
+    stats = KioskStats()
+    for kiosk in kiosks:
+        stats.merge(kiosk.stats)
+    return stats, elapsed
+
+
+def summarize(stats, elapsed):
+    """Per-action throughput, latency percentiles (ms) and error counts as a dict"""
+    summary = {"elapsed_s": round(elapsed, 2), "requests": stats.requests,
+               "requests_per_s": round(stats.requests / elapsed, 1) if elapsed else 0.0, "actions": {}}
+    for action in sorted(set(stats.latencies) | set(stats.errors)):
+        latency = latency_summary(stats.latencies.get(action, []), digits=1)
+        errors = stats.errors.get(action, {})
+        total = latency["count"] + sum(errors.values())
+        entry = {"count": total, "ok": latency["count"], "per_s": round(total / elapsed, 2) if elapsed else 0.0,
+                 "errors": errors}
+        for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms"):
+            entry[key] = latency[key]
+        summary["actions"][action] = entry
+    return summary
+
+
+def print_summary(summary, args):
+    print(f"\n{args.kiosks} kiosks for {summary['elapsed_s']}s against {args.host}:{args.port}")
+    print(f"HTTP requests: {summary['requests']} ({summary['requests_per_s']}/s)\n")
+    print(f"{'action':<8}{'count':>8}{'ok':>8}{'per s':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}  errors")
+    for action, entry in summary["actions"].items():
+        latencies = [entry[key] for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        latencies = "".join(f"{'-' if value is None else value:>10}" for value in latencies)
+        errors = ", ".join(f"{reason}: {count}" for reason, count in entry["errors"].items()) or "-"
+        print(f"{action:<8}{entry['count']:>8}{entry['ok']:>8}{entry['per_s']:>8}{latencies}  {errors}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulate a fleet of kiosks against the AVend API")
+    parser.add_argument("--host", default="127.0.0.1", help="AVend middleware or mock server host")
+    parser.add_argument("--port", type=int, default=8080, help="AVend middleware or mock server port")
+    parser.add_argument("--kiosks", type=int, default=10, help="Number of simulated kiosks (one thread each)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds a kiosk waits between actions, 0 for back-to-back")
+    parser.add_argument("--vend-weight", type=float, default=0.7, help="Share of single item vends")
+    parser.add_argument("--cart-weight", type=float, default=0.2, help="Share of multi item cart dispenses")
+    parser.add_argument("--info-weight", type=float, default=0.1, help="Share of get_info() polls")
+    parser.add_argument("--max-cart", type=int, default=3, help="Most items in one cart (at least 2)")
+    parser.add_argument("--h1-interval", type=float, default=20.0, help="Seconds between H1 keep-alives per kiosk, 0 to disable")
+    parser.add_argument("--follow-redirects", action="store_true",
+                        help="Follow redirects like the GUI does (the mock server redirects every action to its dashboard)")
+    parser.add_argument("--seed", type=int, help="Random seed for a repeatable action sequence")
+    parser.add_argument("--json", help="Also write the summary to this JSON file")
+    args = parser.parse_args()
+    args.max_cart = max(2, min(args.max_cart, len(SLOT_CODES)))
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    logging.basicConfig(level=logging.ERROR)  # AvendAPI warns on every failed call, the summary counts them instead
+    stats, elapsed = run_load_test(args)
+    summary = summarize(stats, elapsed)
+    print_summary(summary, args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nSummary written to {args.json}")
@@ -1,12 +1,20 @@
 # Avend Mock Server to simulate the Avend Vending Machine kit.
 # Max Chen
 
+import argparse
+import copy
+import itertools
+import json
+import queue
+import random
 import time
 import datetime
 import logging
+import os
+import threading
 import uuid
-from collections import deque
-from flask import Flask, request, jsonify, make_response
+from collections import OrderedDict, deque
+from flask import Flask, Response, g, request, jsonify, make_response
 
 # Configure logging
 logging.basicConfig(
@@ -19,11 +27,259 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 
 # Global variables
-sessions = {}  # Dictionary to store active sessions
+sessions = OrderedDict()  # Session ID -> Session, ordered by last activity (oldest first)
+sessions_lock = threading.RLock()  # Guards sessions against the request handlers and the sweeper
 request_history = deque(maxlen=50)  # Store the last 50 requests
+history_lock = threading.Lock()  # Guards request_history when served by multiple threads
+request_seq = itertools.count(1)  # Sequence number given to every logged request
+event_subscribers = set()  # One queue per open /events stream
+subscribers_lock = threading.Lock()  # Guards event_subscribers and open_event_streams
+open_event_streams = 0  # /events responses still running, each holds a server thread
+event_stream_limit = None  # Most open /events streams before new ones get 503, None for no limit
+dashboard_version = 0  # Bumped on every dashboard-visible change, used as the /dashboard-data ETag
+version_lock = threading.Lock()
+journal = None  # RequestJournal keeping every request on disk, set up in main
+inventory = {}  # Slot code -> {'stock': items left, 'capacity': items when full}, codes not listed are unlimited
+inventory_lock = threading.Lock()  # Guards inventory, held for whole carts so they are taken all-or-nothing
 
 # Session timeout in seconds (5 minutes)
 SESSION_TIMEOUT = 300
+# How often expired sessions are removed from memory
+SESSION_SWEEP_INTERVAL = 30
+# Seconds between keep-alive comments on idle event streams
+EVENT_KEEPALIVE_INTERVAL = 15
+# Events buffered per dashboard before it is considered too slow and dropped
+EVENT_QUEUE_SIZE = 500
+
+# AVend Local Dispense API version the mock follows
+API_VERSION = '1.2.2'
+
+# Slots stocked on the kiosk (hardhat, glasses, vest, earplugs, gloves) when --capacity is given,
+# without it stock is unlimited, other codes like the 8H1 service code never run out
+SLOT_CODES = ('8D1', '8C2', '8A4', '8E7', '8B3')
+
+# Request journal defaults
+JOURNAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'journal')
+JOURNAL_MAX_BYTES = 50 * 1024 * 1024  # Rotate the journal file at this size
+JOURNAL_BACKUPS = 10  # Rotated files kept, the oldest is deleted
+JOURNAL_QUEUE_SIZE = 10000  # Requests waiting for the writer before handlers block
+JOURNAL_QUERY_LIMIT = 1000  # Most entries returned by one /journal query
+JOURNAL_QUERY_ATTEMPTS = 3  # Scans of one /journal query when the journal rotates during them
+
+# Fault injection, changed at runtime through /admin/faults
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'exponential')
+DEFAULT_ACTION_FAULTS = {
+    'latency': {'distribution': 'fixed', 'ms': 0},  # fixed: ms, uniform: min_ms/max_ms, normal: mean_ms/stddev_ms, exponential: mean_ms
+    'error_rate': 0.0,  # Fraction of requests answered with error_status
+    'error_status': 503,
+    'drop_rate': 0.0  # Fraction of requests whose connection is cut off mid-response
+}
+DEFAULT_FAULTS = {
+    'default': DEFAULT_ACTION_FAULTS,  # Applies to every action
+    'actions': {},  # Per-action overrides, e.g. {"dispense": {"error_rate": 0.1}}
+    'vend_duration_ms': 0  # Motor run time per dispensed item, dispenses are rejected while it runs
+}
+fault_config = copy.deepcopy(DEFAULT_FAULTS)
+faults_lock = threading.Lock()
+motor_lock = threading.Lock()  # Held while the simulated vend motor runs
+
+class RequestJournal:
+    """
+    Append-only JSON Lines journal of every request, with size based rotation.
+
+    Handlers only put entries on a bounded queue, a single writer thread appends
+    them to requests.jsonl and flushes once the queue is drained. Requests finish
+    out of order under injected latency, so the writer gives every entry its
+    journal seq as it writes it and keeps the request's own seq as request_seq,
+    which keeps each file in seq order for the /journal cursor. Full files are
+    renamed to requests.jsonl.1, .2, ... and the oldest is deleted, so disk use is
+    bounded by max_bytes * (backups + 1).
+    """
+
+    def __init__(self, directory=JOURNAL_DIR, max_bytes=JOURNAL_MAX_BYTES, backups=JOURNAL_BACKUPS):
+        self.directory = directory
+        self.path = os.path.join(directory, 'requests.jsonl')
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue = queue.Queue(maxsize=JOURNAL_QUEUE_SIZE)
+        self.file_lock = threading.Lock()  # Held while writing or rotating
+        self.rotations = 0  # Bumped on every rotation, lets queries notice files shifting under them
+        os.makedirs(directory, exist_ok=True)
+        self._end_partial_line()
+        self.next_seq = self.last_seq() + 1  # Only touched by the writer thread once it runs
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.writer = threading.Thread(target=self._write_loop, name="journal-writer", daemon=True)
+        self.writer.start()
+
+    def append(self, entry):
+        """Queue an entry for the writer, blocks only if the writer is far behind"""
+        self.queue.put(entry)
+
+    def flush(self):
+        """Wait until every queued entry is on disk"""
+        self.queue.join()
+
+    def last_seq(self):
+        """Sequence number of the newest journaled request, 0 for an empty journal"""
+        for path in self.files()[::-1]:
+            for line in self._reverse_lines(path):
+                entry = self._parse(line, path)
+                if entry:
+                    return entry['seq']
+        return 0
+
+    def files(self):
+        """Journal files from oldest to newest"""
+        rotated = [f"{self.path}.{i}" for i in range(self.backups, 0, -1)]
+        return [path for path in rotated if os.path.exists(path)] + [self.path]
+
+    def query(self, since=0, action=None, code=None, limit=100):
+        """Entries with seq greater than since, oldest first, optionally filtered by action and code"""
+        self.flush()
+        # Files are scanned without file_lock so the writer keeps draining the queue meanwhile.
+        # A rotation during the scan shifts the files under their names, the scan is then repeated.
+        for _ in range(JOURNAL_QUERY_ATTEMPTS):
+            with self.file_lock:
+                files = self.files()
+                rotations = self.rotations
+            results = self._scan(files, since, action, code, limit)
+            if self.rotations == rotations:
+                return results
+        logger.warning("Journal rotated during every query attempt, results may be incomplete")
+        return results
+
+    def _scan(self, files, since, action, code, limit):
+        results = []
+        first_seqs = [self._first_seq(path) for path in files]
+        for i, path in enumerate(files):
+            # Skip files that end before the cursor, the next file starts at or below it
+            if i + 1 < len(files) and first_seqs[i + 1] is not None and first_seqs[i + 1] <= since + 1:
+                continue
+            for line in self._lines(path):
+                entry = self._parse(line, path)
+                if entry is None or entry['seq'] <= since:
+                    continue
+                if action and entry.get('action') != action:
+                    continue
+                if code and entry.get('code') != code:
+                    continue
+                results.append(entry)
+                if len(results) >= limit:
+                    return results
+        return results
+
+    def _write_loop(self):
+        while True:
+            entry = self.queue.get()
+            with self.file_lock:
+                self._write(entry)
+                # Drain whatever arrived meanwhile before paying for a flush
+                pending = 1
+                while True:
+                    try:
+                        entry = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._write(entry)
+                    pending += 1
+                self.file.flush()
+            for _ in range(pending):
+                self.queue.task_done()
+
+    def _write(self, entry):
+        try:
+            line = json.dumps(dict(entry, request_seq=entry.get('seq'), seq=self.next_seq), separators=(',', ':'))
+            self.file.write(line + '\n')
+            self.next_seq += 1
+            if self.file.tell() >= self.max_bytes:
+                self._rotate()
+        except (OSError, TypeError, ValueError) as e:
+            logger.error(f"Failed to journal request {entry.get('seq')}: {e}")
+
+    def _rotate(self):
+        self.file.close()
+        oldest = f"{self.path}.{self.backups}"
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.rotations += 1
+        logger.info(f"Rotated request journal {self.path}")
+
+    def _end_partial_line(self):
+        """Terminate a line cut off by a crash mid-write, so the next entry starts on its own line"""
+        try:
+            with open(self.path, 'rb+') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _parse(line, path):
+        """Journal entry of one line, None (logged) for a line that cannot be parsed"""
+        try:
+            entry = json.loads(line)
+            if isinstance(entry, dict) and isinstance(entry.get('seq'), int):
+                return entry
+        except ValueError:
+            pass
+        if line.strip():
+            logger.warning(f"Skipping unreadable journal line in {path}: {line[:80]!r}")
+        return None
+
+    @staticmethod
+    def _lines(path):
+        """Complete lines of a journal file, nothing if it was rotated away, a line still being written is left out"""
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    if line.endswith('\n'):
+                        yield line
+        except FileNotFoundError:
+            return
+
+    @classmethod
+    def _first_seq(cls, path):
+        for line in cls._lines(path):
+            entry = cls._parse(line, path)
+            if entry:
+                return entry['seq']
+        return None
+
+    @staticmethod
+    def _reverse_lines(path, block_size=4096):
+        """Lines of a file from the last to the first, read backwards in blocks"""
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            remainder = b''
+            while position > 0:
+                step = min(block_size, position)
+                position -= step
+                f.seek(position)
+                lines = (f.read(step) + remainder).split(b'\n')
+                remainder = lines.pop(0)  # May continue in the previous block
+                for line in reversed(lines):
+                    if line:
+                        yield line.decode('utf-8', errors='replace')
+            if remainder:
+                yield remainder.decode('utf-8', errors='replace')
+
 
 class Session:
     """Class to represent a session with the AVend API"""
@@ -34,8 +290,11 @@ class Session:
         self.cart = []
     
     def update_activity(self):
-        """Update the last activity time"""
-        self.last_activity = time.time()
+        """Update the last activity time and move the session to the most recent end"""
+        with sessions_lock:
+            self.last_activity = time.time()
+            if self.id in sessions:
+                sessions.move_to_end(self.id)
     
     def is_expired(self):
         """Check if the session has expired"""
@@ -43,47 +302,328 @@ class Session:
     
     def add_to_cart(self, code):
         """Add an item to the cart"""
-        if code not in self.cart:
-            self.cart.append(code)
-        self.update_activity()
+        with sessions_lock:
+            if code not in self.cart:
+                self.cart.append(code)
+            self.update_activity()
+    
+    def remove_from_cart(self, code):
+        """Remove an item from the cart, returns False if it was not in the cart"""
+        with sessions_lock:
+            self.update_activity()
+            if code not in self.cart:
+                return False
+            self.cart.remove(code)
+            return True
     
     def clear_cart(self):
         """Clear the cart"""
-        self.cart = []
-        self.update_activity()
+        with sessions_lock:
+            self.cart = []
+            self.update_activity()
 
 def get_active_session():
     """Get the most recently active non-expired session"""
-    active_sessions = [s for s in sessions.values() if not s.is_expired()]
-    if active_sessions:
-        # Sort by last activity time (most recent first)
-        return sorted(active_sessions, key=lambda s: s.last_activity, reverse=True)[0]
-    return None
+    with sessions_lock:
+        if not sessions:
+            return None
+        # The last entry is the most recently active one, if it expired they all have
+        session = next(reversed(sessions.values()))
+        return None if session.is_expired() else session
+
+def lookup_session(session_id):
+    """Get a non-expired session by ID, or None"""
+    with sessions_lock:
+        session = sessions.get(session_id) if session_id else None
+        if session is None or session.is_expired():
+            return None
+        return session
+
+def sweep_expired_sessions():
+    """Remove expired sessions from the oldest end, returns how many were removed"""
+    removed = 0
+    with sessions_lock:
+        while sessions:
+            oldest = next(iter(sessions.values()))
+            if not oldest.is_expired():
+                break
+            sessions.popitem(last=False)
+            removed += 1
+    if removed:
+        mark_dashboard_changed()
+    return removed
+
+def count_active_sessions():
+    """Number of non-expired sessions"""
+    with sessions_lock:
+        sweep_expired_sessions()
+        return len(sessions)
+
+def start_session_sweeper(interval=SESSION_SWEEP_INTERVAL):
+    """Periodically remove expired sessions so memory stays bounded during soak tests"""
+    def sweep_loop():
+        while True:
+            time.sleep(interval)
+            removed = sweep_expired_sessions()
+            if removed:
+                logger.info(f"Removed {removed} expired session(s)")
+                publish_session_state()
+    thread = threading.Thread(target=sweep_loop, name="session-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+def session_summary(session):
+    """JSON-friendly view of a session for the dashboard"""
+    if session is None:
+        return None
+    with sessions_lock:
+        return {
+            'id': session.id,
+            'created': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(session.created_at)),
+            'last_activity': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(session.last_activity)),
+            'cart': list(session.cart)
+        }
+
+def mark_dashboard_changed():
+    """Invalidate the dashboard ETag"""
+    global dashboard_version
+    with version_lock:
+        dashboard_version += 1
+
+def history_since(since=0, limit=None):
+    """
+    Logged requests newer than sequence number since, newest first.
+    With more than limit newer requests the oldest limit are returned, so a client
+    paging with the highest returned seq as its next cursor never skips one.
+    Returns (requests, whether newer requests were left out).
+    """
+    items = []
+    with history_lock:
+        for req in request_history:
+            if req['seq'] <= since:
+                break
+            items.append(req)
+    if limit is not None and len(items) > limit:
+        return items[len(items) - limit:] if limit > 0 else [], True
+    return items, False
+
+def publish_event(event_type, data):
+    """Push an event to every open dashboard stream, dropping streams that fall behind"""
+    mark_dashboard_changed()
+    with subscribers_lock:
+        for subscriber in list(event_subscribers):
+            try:
+                subscriber.put_nowait((event_type, data))
+            except queue.Full:
+                event_subscribers.discard(subscriber)
+                logger.warning("Dropped a dashboard event stream that fell behind")
+
+def publish_session_state():
+    """Push the active session and session count to the dashboards"""
+    if not event_subscribers:
+        mark_dashboard_changed()
+        return
+    publish_event('session', {
+        'active_sessions_count': count_active_sessions(),
+        'active_session': session_summary(get_active_session())
+    })
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def validate_action_faults(faults):
+    """Raise ValueError if a per-action fault override is malformed"""
+    if not isinstance(faults, dict):
+        raise ValueError("Fault settings must be a JSON object")
+    for key in faults:
+        if key not in DEFAULT_ACTION_FAULTS:
+            raise ValueError(f"Unknown fault setting: {key}")
+    for key in ('error_rate', 'drop_rate'):
+        if key in faults and not (is_number(faults[key]) and 0.0 <= faults[key] <= 1.0):
+            raise ValueError(f"{key} must be a number between 0 and 1")
+    if 'error_status' in faults and not (isinstance(faults['error_status'], int) and 100 <= faults['error_status'] <= 599):
+        raise ValueError("error_status must be an HTTP status code")
+    latency = faults.get('latency', {})
+    if not isinstance(latency, dict):
+        raise ValueError("latency must be a JSON object")
+    if latency.get('distribution', 'fixed') not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Latency distribution must be one of {', '.join(LATENCY_DISTRIBUTIONS)}")
+    for key, value in latency.items():
+        if key != 'distribution' and not (is_number(value) and value >= 0):
+            raise ValueError(f"Latency {key} must be a non-negative number of milliseconds")
+
+def update_faults(changes):
+    """Merge a fault configuration change into fault_config"""
+    if 'vend_duration_ms' in changes and not is_number(changes['vend_duration_ms']):
+        raise ValueError("vend_duration_ms must be a number")
+    validate_action_faults(changes.get('default', {}))
+    for faults in changes.get('actions', {}).values():
+        validate_action_faults(faults)
+    with faults_lock:
+        fault_config['default'].update(changes.get('default', {}))
+        for action, faults in changes.get('actions', {}).items():
+            fault_config['actions'].setdefault(action, {}).update(faults)
+        if 'vend_duration_ms' in changes:
+            fault_config['vend_duration_ms'] = max(0, float(changes['vend_duration_ms']))
+
+def faults_for(action):
+    """Fault settings for an action, the default settings with its overrides applied"""
+    with faults_lock:
+        faults = dict(fault_config['default'])
+        faults.update(fault_config['actions'].get(action, {}))
+    return faults
+
+def sample_latency(latency):
+    """Draw one latency in seconds from a latency setting"""
+    distribution = latency.get('distribution', 'fixed')
+    if distribution == 'uniform':
+        ms = random.uniform(latency.get('min_ms', 0), latency.get('max_ms', 0))
+    elif distribution == 'normal':
+        ms = random.gauss(latency.get('mean_ms', 0), latency.get('stddev_ms', 0))
+    elif distribution == 'exponential':
+        mean_ms = latency.get('mean_ms', 0)
+        ms = random.expovariate(1.0 / mean_ms) if mean_ms > 0 else 0
+    else:
+        ms = latency.get('ms', 0)
+    return max(0.0, ms) / 1000.0
+
+def choose_fault(action):
+    """Decide the injected latency and fault for one request, fault is None, 'error' or 'drop'"""
+    faults = faults_for(action)
+    latency = sample_latency(faults['latency'])
+    roll = random.random()
+    if roll < faults['error_rate']:
+        return latency, 'error', faults['error_status']
+    if roll < faults['error_rate'] + faults['drop_rate']:
+        return latency, 'drop', None
+    return latency, None, None
+
+def dropped_response():
+    """A response that promises a body but cuts the connection off after the first bytes"""
+    def body():
+        yield b'{"status": '
+        raise ConnectionAbortedError("Injected connection drop")
+    return Response(body(), status=200, mimetype='application/json', headers={'Content-Length': '64'})
+
+def run_motor(item_count):
+    """Simulate the vend motor for item_count items, returns False if it is already running"""
+    with faults_lock:
+        duration = fault_config['vend_duration_ms'] / 1000.0
+    if not duration:
+        return True  # Instant vends never overlap
+    if not motor_lock.acquire(blocking=False):
+        return False
+    try:
+        time.sleep(duration * item_count)
+    finally:
+        motor_lock.release()
+    return True
+
+def configure_inventory(capacities):
+    """Fill every slot in capacities (code -> items) to its capacity"""
+    with inventory_lock:
+        inventory.clear()
+        for code, capacity in capacities.items():
+            inventory[code] = {'stock': capacity, 'capacity': capacity}
+
+def take_stock(codes):
+    """
+    Take one item per code from the inventory, all or nothing.
+    Returns the sold out codes, an empty list means the items were taken.
+    """
+    wanted = {}
+    for code in codes:
+        wanted[code] = wanted.get(code, 0) + 1
+    with inventory_lock:
+        sold_out = [code for code, count in wanted.items()
+                    if code in inventory and inventory[code]['stock'] < count]
+        if sold_out:
+            return sold_out
+        for code, count in wanted.items():
+            if code in inventory:
+                inventory[code]['stock'] -= count
+    mark_dashboard_changed()
+    return []
+
+def return_stock(codes):
+    """Put items taken with take_stock back, used when the vend does not happen"""
+    with inventory_lock:
+        for code in codes:
+            if code in inventory:
+                inventory[code]['stock'] += 1
+    mark_dashboard_changed()
+
+def restock(levels=None):
+    """
+    Set the stock of the slots in levels (code -> items), new codes become slots.
+    Without levels every slot is refilled to its capacity.
+    """
+    if levels is not None:
+        for code, stock in levels.items():
+            if not isinstance(stock, int) or isinstance(stock, bool) or stock < 0:
+                raise ValueError(f"Stock for {code} must be a non-negative integer")
+    with inventory_lock:
+        if levels is None:
+            for slot in inventory.values():
+                slot['stock'] = slot['capacity']
+        else:
+            for code, stock in levels.items():
+                slot = inventory.setdefault(code, {'stock': stock, 'capacity': stock})
+                slot['stock'] = stock
+                slot['capacity'] = max(slot['capacity'], stock)
+    mark_dashboard_changed()
+
+def inventory_snapshot():
+    """Copy of the inventory, safe to serialize"""
+    with inventory_lock:
+        return {code: dict(slot) for code, slot in inventory.items()}
+
+def sold_out_response(codes, session):
+    logger.warning(f"Sold out: {', '.join(codes)}, Session: {session.id}")
+    return jsonify({"status": "error", "message": f"Sold out: {', '.join(codes)}", "sold_out": codes}), 409
 
 def create_session():
     """Create a new session"""
     session = Session()
-    sessions[session.id] = session
+    with sessions_lock:
+        sessions[session.id] = session
     return session
 
-@app.route('/avend', methods=['GET'])
-def avend_api():
-    action = request.args.get('action')
+@app.route('/avend', methods=['GET'], defaults={'path_action': None})
+@app.route('/avend/info', methods=['GET'], defaults={'path_action': 'info'})
+def avend_api(path_action):
+    action = path_action or request.args.get('action')
     code = request.args.get('code')
+    latency, fault, error_status = choose_fault(action)
     
     # Log the request
     client_ip = request.remote_addr
     timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     request_data = {
+        'seq': next(request_seq),
         'timestamp': timestamp,
         'client_ip': client_ip,
         'action': action,
         'code': code,
-        'args': dict(request.args)
+        'args': dict(request.args),
+        'fault': fault
     }
-    request_history.appendleft(request_data)
+    with history_lock:
+        request_history.appendleft(request_data)
+    g.request_data = request_data  # Journaled with the response status once the response is ready
+    publish_event('request', request_data)
     logger.info(f"Request: {action}, Code: {code}, IP: {client_ip}")
     
+    # Injected faults
+    if latency:
+        time.sleep(latency)
+    if fault == 'error':
+        logger.info(f"Injected HTTP {error_status} for {action}")
+        return jsonify({"status": "error", "message": "Injected fault"}), error_status
+    if fault == 'drop':
+        logger.info(f"Injected connection drop for {action}")
+        return dropped_response()
+    
     if action == 'start':
         # Create a new session
         session = create_session()
@@ -96,19 +636,18 @@ def avend_api():
         response.status_code = 302
         return response
     
-    elif action == 'dispense':
-        if not code:
-            logger.warning("Dispense action called without a code")
-            return jsonify({"status": "error", "message": "Code is required for dispense action"}), 400
-        
+    elif action == 'dispense' and code:
         # Get or create session
-        session_id = request.cookies.get('session_id')
-        if session_id and session_id in sessions and not sessions[session_id].is_expired():
-            session = sessions[session_id]
-        else:
-            session = create_session()
+        session = lookup_session(request.cookies.get('session_id')) or create_session()
         
         session.update_activity()
+        sold_out = take_stock([code])
+        if sold_out:
+            return sold_out_response(sold_out, session)
+        if not run_motor(1):
+            return_stock([code])
+            logger.warning(f"Dispense rejected, motor busy: {code}, Session: {session.id}")
+            return jsonify({"status": "error", "message": "Motor busy"}), 409
         logger.info(f"Dispensing item: {code}, Session: {session.id}")
         
         # Set a cookie with the session ID and redirect to dashboard
@@ -118,17 +657,14 @@ def avend_api():
         response.status_code = 302
         return response
     
-    elif action == 'add_to_cart':
+    # add_to_cart, dispense_cart and clear_cart are the names older versions of this mock used
+    elif action in ('add', 'add_to_cart'):
         if not code:
             logger.warning("Add to cart action called without a code")
-            return jsonify({"status": "error", "message": "Code is required for add_to_cart action"}), 400
+            return jsonify({"status": "error", "message": "Code is required for add action"}), 400
         
         # Get or create session
-        session_id = request.cookies.get('session_id')
-        if session_id and session_id in sessions and not sessions[session_id].is_expired():
-            session = sessions[session_id]
-        else:
-            session = create_session()
+        session = lookup_session(request.cookies.get('session_id')) or create_session()
         
         session.add_to_cart(code)
         logger.info(f"Added to cart: {code}, Session: {session.id}, Cart: {session.cart}")
@@ -140,19 +676,45 @@ def avend_api():
         response.status_code = 302
         return response
     
-    elif action == 'dispense_cart':
+    elif action == 'remove':
+        if not code:
+            logger.warning("Remove from cart action called without a code")
+            return jsonify({"status": "error", "message": "Code is required for remove action"}), 400
+        
+        session = lookup_session(request.cookies.get('session_id'))
+        if session is None:
+            logger.warning("Remove from cart called without a valid session")
+            return jsonify({"status": "error", "message": "No active session"}), 400
+        
+        if not session.remove_from_cart(code):
+            logger.warning(f"Remove from cart: {code} not in cart, Session: {session.id}")
+            return jsonify({"status": "error", "message": f"{code} is not in the cart"}), 400
+        logger.info(f"Removed from cart: {code}, Session: {session.id}, Cart: {session.cart}")
+        
+        # Redirect to dashboard
+        response = make_response("")
+        response.headers['Location'] = '/'
+        response.status_code = 302
+        return response
+    
+    # dispense without a code vends the whole cart
+    elif action in ('dispense', 'dispense_cart'):
         # Get or create session
-        session_id = request.cookies.get('session_id')
-        if session_id and session_id in sessions and not sessions[session_id].is_expired():
-            session = sessions[session_id]
-        else:
-            session = create_session()
+        session = lookup_session(request.cookies.get('session_id')) or create_session()
         
         if not session.cart:
             logger.warning(f"Dispense cart called with empty cart, Session: {session.id}")
             return jsonify({"status": "error", "message": "Cart is empty"}), 400
         
-        cart_items = session.cart.copy()
+        with sessions_lock:
+            cart_items = session.cart.copy()
+        sold_out = take_stock(cart_items)
+        if sold_out:
+            return sold_out_response(sold_out, session)  # Nothing is vended and the cart is kept
+        if not run_motor(len(cart_items)):
+            return_stock(cart_items)
+            logger.warning(f"Dispense cart rejected, motor busy, Session: {session.id}")
+            return jsonify({"status": "error", "message": "Motor busy"}), 409
         session.clear_cart()
         logger.info(f"Dispensing cart: {cart_items}, Session: {session.id}")
         
@@ -163,14 +725,13 @@ def avend_api():
         response.status_code = 302
         return response
     
-    elif action == 'clear_cart':
+    elif action in ('clear', 'clear_cart'):
         # Get session
-        session_id = request.cookies.get('session_id')
-        if not session_id or session_id not in sessions or sessions[session_id].is_expired():
+        session = lookup_session(request.cookies.get('session_id'))
+        if session is None:
             logger.warning("Clear cart called without a valid session")
             return jsonify({"status": "error", "message": "No active session"}), 400
         
-        session = sessions[session_id]
         session.clear_cart()
         logger.info(f"Cart cleared, Session: {session.id}")
         
@@ -180,17 +741,82 @@ def avend_api():
         response.status_code = 302
         return response
     
+    elif action == 'info':
+        return jsonify({
+            "status": "ok",
+            "api_version": API_VERSION,
+            "session": session_summary(lookup_session(request.cookies.get('session_id'))),
+            "active_sessions_count": count_active_sessions(),
+            "motor_busy": motor_lock.locked(),
+            "inventory": inventory_snapshot()
+        })
+    
     else:
         logger.warning(f"Invalid action or missing required parameters: {action}")
         return jsonify({"status": "error", "message": "Invalid action or missing required parameters"}), 400
 
 
+@app.after_request
+def push_session_changes(response):
+    """Every AVend action can change the sessions, push the new state to the dashboards"""
+    if request.path.startswith('/avend'):
+        publish_session_state()
+    return response
+
+
+@app.after_request
+def journal_request(response):
+    """Append the logged request to the on-disk journal together with its response status"""
+    if journal and 'request_data' in g:
+        # An injected drop goes out with a 200 status line but never completes
+        status = 'dropped' if g.request_data['fault'] == 'drop' else response.status_code
+        journal.append(dict(g.request_data, status=status))
+    return response
+
+
+@app.route('/events')
+def events():
+    """
+    Server-Sent Events stream of dashboard changes (new requests, session changes).
+    Each stream holds a server thread while it is open, so at most event_stream_limit
+    are served at once and the remaining threads stay free for /avend.
+    """
+    global open_event_streams
+    subscriber = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+    with subscribers_lock:
+        if event_stream_limit is not None and open_event_streams >= event_stream_limit:
+            logger.warning(f"Refused a dashboard event stream, {open_event_streams} already open")
+            response = jsonify({"status": "error", "message": "Too many open dashboards, falling back to polling"})
+            response.headers['Retry-After'] = str(EVENT_KEEPALIVE_INTERVAL)
+            return response, 503
+        open_event_streams += 1
+        event_subscribers.add(subscriber)
+
+    def stream():
+        global open_event_streams
+        try:
+            yield ": connected\n\n"  # Flushes headers so the browser fires onopen right away
+            while True:
+                try:
+                    event_type, data = subscriber.get(timeout=EVENT_KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    if subscriber not in event_subscribers:
+                        return  # Dropped for falling behind, free the thread, the browser reconnects and resyncs
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            with subscribers_lock:
+                event_subscribers.discard(subscriber)
+                open_event_streams -= 1
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/')
 def index():
-    """Return a simple HTML page with information about the mock server"""
-    active_session = get_active_session()
-    active_sessions_count = len([s for s in sessions.values() if not s.is_expired()])
-    
+    """Return the dashboard page, its contents are rendered client-side from /dashboard-data"""
     html = """
     <!DOCTYPE html>
     <html>
@@ -198,9 +824,10 @@ def index():
         <title>AVend Server Dashboard (100% Real)</title>
         <meta name="viewport" content="width=device-width, initial-scale=1.0">
         <script>
-            // Use AJAX for real-time updates instead of page refresh
-            function updateDashboard() {
-                // Update server time
+            const MAX_HISTORY_ROWS = 50;
+
+            // Update server time locally, no request needed
+            function updateClock() {
                 const timeElement = document.getElementById('server-time');
                 const dateElement = document.getElementById('server-date');
                 if (timeElement && dateElement) {
@@ -208,39 +835,127 @@ def index():
                     timeElement.textContent = now.toTimeString().split(' ')[0];
                     dateElement.textContent = now.toISOString().split('T')[0];
                 }
-                
-                // Fetch updated data
+            }
+
+            function makeElement(tag, className, text) {
+                const element = document.createElement(tag);
+                if (className) element.className = className;
+                if (text !== undefined) element.textContent = text;
+                return element;
+            }
+
+            function makeStat(label, value, valueStyle) {
+                const stat = makeElement('div', 'stat');
+                stat.appendChild(makeElement('div', 'stat-label', label));
+                const valueElement = makeElement('div', 'stat-value', value);
+                if (valueStyle) valueElement.style.cssText = valueStyle;
+                stat.appendChild(valueElement);
+                return stat;
+            }
+
+            // Render the active session card from a session event
+            function renderSession(session) {
+                const container = document.getElementById('session-container');
+                const card = makeElement('div', 'card');
+                card.appendChild(makeElement('h2', null, 'Active Session'));
+                const content = makeElement('div', 'card-content');
+                if (session) {
+                    const info = makeElement('div', 'session-info');
+                    info.appendChild(makeStat('Session ID:', session.id, 'font-size: 14px; word-break: break-all;'));
+                    info.appendChild(makeStat('Created:', session.created, 'font-size: 14px;'));
+                    info.appendChild(makeStat('Last Activity:', session.last_activity, 'font-size: 14px;'));
+                    info.appendChild(makeStat('Cart Items:', session.cart.length));
+                    content.appendChild(info);
+                    if (session.cart.length) {
+                        const items = makeElement('div', 'cart-items');
+                        session.cart.forEach(item => items.appendChild(makeElement('span', 'cart-item', item)));
+                        content.appendChild(items);
+                    }
+                } else {
+                    content.appendChild(makeElement('p', null, 'No active session. Start a new session to begin.'));
+                    const link = makeElement('a', 'btn', 'Start New Session');
+                    link.href = '/avend?action=start';
+                    content.appendChild(link);
+                }
+                card.appendChild(content);
+                container.replaceChildren(card);
+            }
+
+            function makeRequestRow(req) {
+                const details = Object.entries(req.args || {})
+                    .filter(([key]) => key !== 'action' && key !== 'code')
+                    .map(([key, value]) => `${key}=${value}`).join(', ') || '-';
+                const row = document.createElement('tr');
+                if (req.fault) row.className = 'error';
+                row.appendChild(makeElement('td', 'timestamp', req.timestamp || '-'));
+                row.appendChild(makeElement('td', null, req.client_ip || '-'));
+                row.appendChild(makeElement('td', 'action', req.action || '-'));
+                row.appendChild(makeElement('td', null, req.code || '-'));
+                row.appendChild(makeElement('td', null, req.fault ? `${details} [injected ${req.fault}]` : details));
+                return row;
+            }
+
+            // Insert one request row at the top of the history table
+            function prependRequest(req) {
+                const table = document.querySelector('#request-history table');
+                const placeholder = document.getElementById('no-requests');
+                if (placeholder) placeholder.closest('tr').remove();
+                table.rows[0].after(makeRequestRow(req));
+                while (table.rows.length > MAX_HISTORY_ROWS + 1) {
+                    table.deleteRow(table.rows.length - 1);
+                }
+            }
+
+            // Replace the history table rows, history is newest first
+            function renderHistory(history) {
+                const table = document.querySelector('#request-history table');
+                while (table.rows.length > 1) {
+                    table.deleteRow(1);
+                }
+                if (!history.length) {
+                    const row = document.createElement('tr');
+                    const cell = makeElement('td', null, 'No requests received yet');
+                    cell.id = 'no-requests';
+                    cell.colSpan = 5;
+                    cell.style.textAlign = 'center';
+                    row.appendChild(cell);
+                    table.appendChild(row);
+                }
+                history.forEach(req => table.appendChild(makeRequestRow(req)));
+            }
+
+            // Full snapshot, only used when the event stream (re)connects, 304 when unchanged
+            function syncDashboard() {
                 fetch('/dashboard-data')
                     .then(response => response.json())
                     .then(data => {
-                        // Update active sessions count
-                        const sessionsElement = document.getElementById('active-sessions');
-                        if (sessionsElement) {
-                            sessionsElement.textContent = data.active_sessions_count;
-                        }
-                        
-                        // Update session info if available
-                        if (data.active_session) {
-                            document.getElementById('session-container').innerHTML = data.active_session_html;
-                        }
-                        
-                        // Update request history
-                        document.getElementById('request-history').innerHTML = data.request_history_html;
-                        
-                        // Update server stats
-                        if (data.server_stats_html) {
-                            document.getElementById('server-stats').innerHTML = data.server_stats_html;
-                        }
+                        document.getElementById('active-sessions').textContent = data.active_sessions_count;
+                        renderSession(data.active_session);
+                        renderHistory(data.history);
                     })
                     .catch(error => console.error('Error updating dashboard:', error));
             }
-            
-            // Update every 2 seconds
+
+            // Changes are pushed by the server instead of polled
             document.addEventListener('DOMContentLoaded', function() {
-                // Initial update
-                updateDashboard();
-                // Set interval for continuous updates
-                setInterval(updateDashboard, 1000);
+                updateClock();
+                setInterval(updateClock, 1000);
+
+                const events = new EventSource('/events');
+                events.onopen = syncDashboard;
+                events.addEventListener('request', event => prependRequest(JSON.parse(event.data)));
+                events.addEventListener('session', event => {
+                    const data = JSON.parse(event.data);
+                    document.getElementById('active-sessions').textContent = data.active_sessions_count;
+                    renderSession(data.active_session);
+                });
+                events.addEventListener('history_cleared', syncDashboard);
+                // Refused with 503 when too many dashboards are open, the browser does not retry then
+                events.onerror = () => {
+                    if (events.readyState === EventSource.CLOSED) {
+                        setInterval(syncDashboard, 5000);
+                    }
+                };
             });
         </script>
         <style>
@@ -476,108 +1191,34 @@ def index():
         <div class="container">
     """
     
-    # Add dashboard container
+    # Add dashboard containers, filled in by the page script
     html += """
             <div class="dashboard">
-    """
-    
-    # Add server stats section with ID for updates
-    html += """
                 <div id="server-stats">
-    """
-    
-    # Add server stats card with dynamic content
-    html += f"""
                     <div class="card">
                         <h2>Server Status</h2>
                         <div class="card-content">
                             <div class="session-info">
                                 <div class="stat">
                                     <div class="stat-label">Active Sessions:</div>
-                                    <div class="stat-value" id="active-sessions">{active_sessions_count}</div>
+                                    <div class="stat-value" id="active-sessions">-</div>
                                 </div>
                                 <div class="stat">
                                     <div class="stat-label">Server Time:</div>
-                                    <div class="stat-value" id="server-time">{datetime.datetime.now().strftime('%H:%M:%S')}</div>
+                                    <div class="stat-value" id="server-time">-</div>
                                 </div>
                                 <div class="stat">
                                     <div class="stat-label">Date:</div>
-                                    <div class="stat-value" id="server-date">{datetime.datetime.now().strftime('%Y-%m-%d')}</div>
+                                    <div class="stat-value" id="server-date">-</div>
                                 </div>
                                 <a href="/clear-history" class="btn btn-danger">Clear Request History</a>
                             </div>
                         </div>
                     </div>
                 </div>
-    """
-    
-    # Add session container for active session info
-    html += """
-                <div id="session-container">
-    """
-    
-    if active_session:
-        created_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(active_session.created_at))
-        last_activity_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(active_session.last_activity))
-        cart_empty_text = 'None' if not active_session.cart else ''
-        
-        html += f"""
-                    <div class="card">
-                        <h2>Active Session</h2>
-                        <div class="card-content">
-                            <div class="session-info">
-                                <div class="stat">
-                                    <div class="stat-label">Session ID:</div>
-                                    <div class="stat-value" style="font-size: 14px; word-break: break-all;">{active_session.id}</div>
-                                </div>
-                                <div class="stat">
-                                    <div class="stat-label">Created:</div>
-                                    <div class="stat-value" style="font-size: 14px;">{created_time}</div>
-                                </div>
-                                <div class="stat">
-                                    <div class="stat-label">Last Activity:</div>
-                                    <div class="stat-value" style="font-size: 14px;">{last_activity_time}</div>
-                                </div>
-                                <div class="stat">
-                                    <div class="stat-label">Cart Items:</div>
-                                    <div class="stat-value">{len(active_session.cart) if active_session.cart else 0}</div>
-                                </div>
-                            </div>
-        """
-        
-        if active_session.cart:
-            html += """
-                            <div class="cart-items">
-            """
-            for item in active_session.cart:
-                html += f'<span class="cart-item">{item}</span>'
-            
-            html += """
-                            </div>
-            """
-            
-        html += """
-                        </div>
-                    </div>
-        """
-    else:
-        html += """
-                    <div class="card">
-                        <h2>Active Session</h2>
-                        <div class="card-content">
-                            <p>No active session. Start a new session to begin.</p>
-                            <a href="/avend?action=start" class="btn">Start New Session</a>
-                        </div>
-                    </div>
-        """
-        
-    html += """
-                </div>
+                <div id="session-container"></div>
             </div>
-    """
-    
-    # Add request history section with ID for updates
-    html += """
+
             <div class="card">
                 <h2>Request History</h2>
                 <div class="card-content" id="request-history">
@@ -589,41 +1230,6 @@ def index():
                             <th>Code</th>
                             <th>Details</th>
                         </tr>
-    """
-    
-    # Add each request to the table
-    if request_history:
-        for req in request_history:
-            action = req.get('action', '-')
-            code = req.get('code', '-')
-            timestamp = req.get('timestamp', '-')
-            client_ip = req.get('client_ip', '-')
-            args = req.get('args', {})
-            
-            # Format args as a string, excluding action and code which are already displayed
-            args_str = ', '.join([f"{k}={v}" for k, v in args.items() if k not in ['action', 'code']])
-            if args_str:
-                details = args_str
-            else:
-                details = '-'
-            
-            html += f"""
-                        <tr>
-                            <td class="timestamp">{timestamp}</td>
-                            <td>{client_ip}</td>
-                            <td class="action">{action}</td>
-                            <td>{code}</td>
-                            <td>{details}</td>
-                        </tr>
-            """
-    else:
-        html += """
-                        <tr>
-                            <td colspan="5" style="text-align: center;">No requests received yet</td>
-                        </tr>
-        """
-    
-    html += """
                     </table>
                 </div>
             </div>
@@ -651,22 +1257,36 @@ def index():
                     <div class="endpoint">
                         <h3>Add to Cart</h3>
                         <p>Add an item to the cart</p>
-                        <pre>/avend?action=add_to_cart&code=A1</pre>
-                        <a href="/avend?action=add_to_cart&code=A1" class="btn">Try It</a>
+                        <pre>/avend?action=add&code=A1</pre>
+                        <a href="/avend?action=add&code=A1" class="btn">Try It</a>
+                    </div>
+                    
+                    <div class="endpoint">
+                        <h3>Remove from Cart</h3>
+                        <p>Remove an item from the cart</p>
+                        <pre>/avend?action=remove&code=A1</pre>
+                        <a href="/avend?action=remove&code=A1" class="btn">Try It</a>
                     </div>
                     
                     <div class="endpoint">
                         <h3>Dispense Cart</h3>
-                        <p>Dispense all items in the cart</p>
-                        <pre>/avend?action=dispense_cart</pre>
-                        <a href="/avend?action=dispense_cart" class="btn">Try It</a>
+                        <p>Dispense all items in the cart (dispense without a code)</p>
+                        <pre>/avend?action=dispense</pre>
+                        <a href="/avend?action=dispense" class="btn">Try It</a>
                     </div>
                     
                     <div class="endpoint">
                         <h3>Clear Cart</h3>
                         <p>Clear all items from the cart</p>
-                        <pre>/avend?action=clear_cart</pre>
-                        <a href="/avend?action=clear_cart" class="btn">Try It</a>
+                        <pre>/avend?action=clear</pre>
+                        <a href="/avend?action=clear" class="btn">Try It</a>
+                    </div>
+                    
+                    <div class="endpoint">
+                        <h3>Get Info</h3>
+                        <p>API version, current session, motor state and inventory</p>
+                        <pre>/avend/info</pre>
+                        <a href="/avend/info" class="btn">Try It</a>
                     </div>
                     
                     <div class="endpoint">
@@ -687,144 +1307,116 @@ def index():
 
 @app.route('/dashboard-data', methods=['GET'])
 def dashboard_data():
-    """Return JSON data for dashboard updates"""
-    active_session = get_active_session()
-    active_sessions_count = len([s for s in sessions.values() if not s.is_expired()])
-    
-    # Generate HTML for active session
-    active_session_html = ""
-    if active_session:
-        created_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(active_session.created_at))
-        last_activity_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(active_session.last_activity))
-        
-        active_session_html = f"""
-        <div class="card">
-            <h2>Active Session</h2>
-            <div class="card-content">
-                <div class="session-info">
-                    <div class="stat">
-                        <div class="stat-label">Session ID:</div>
-                        <div class="stat-value" style="font-size: 14px; word-break: break-all;">{active_session.id}</div>
-                    </div>
-                    <div class="stat">
-                        <div class="stat-label">Created:</div>
-                        <div class="stat-value" style="font-size: 14px;">{created_time}</div>
-                    </div>
-                    <div class="stat">
-                        <div class="stat-label">Last Activity:</div>
-                        <div class="stat-value" style="font-size: 14px;">{last_activity_time}</div>
-                    </div>
-                    <div class="stat">
-                        <div class="stat-label">Cart Items:</div>
-                        <div class="stat-value">{len(active_session.cart) if active_session.cart else 0}</div>
-                    </div>
-                </div>
-        """
-        
-        if active_session.cart:
-            active_session_html += "<div class=\"cart-items\">"
-            for item in active_session.cart:
-                active_session_html += f'<span class="cart-item">{item}</span>'
-            active_session_html += "</div>"
-            
-        active_session_html += """
-                </div>
-            </div>
-        """
-    else:
-        active_session_html = """
-        <div class="card">
-            <h2>Active Session</h2>
-            <div class="card-content">
-                <p>No active session. Start a new session to begin.</p>
-                <a href="/avend?action=start" class="btn">Start New Session</a>
-            </div>
-        </div>
-        """
-    
-    # Generate HTML for request history
-    request_history_html = """
-    <table>
-        <tr>
-            <th>Time</th>
-            <th>Client IP</th>
-            <th>Action</th>
-            <th>Code</th>
-            <th>Details</th>
-        </tr>
     """
-    
-    if request_history:
-        for req in request_history:
-            action = req.get('action', '-')
-            code = req.get('code', '-')
-            timestamp = req.get('timestamp', '-')
-            client_ip = req.get('client_ip', '-')
-            args = req.get('args', {})
-            
-            # Format args as a string, excluding action and code which are already displayed
-            args_str = ', '.join([f"{k}={v}" for k, v in args.items() if k not in ['action', 'code']])
-            if args_str:
-                details = args_str
-            else:
-                details = '-'
-            
-            request_history_html += f"""
-            <tr>
-                <td class="timestamp">{timestamp}</td>
-                <td>{client_ip}</td>
-                <td class="action">{action}</td>
-                <td>{code}</td>
-                <td>{details}</td>
-            </tr>
-            """
+    Return the dashboard state as compact JSON.
+
+    Query parameters:
+        since: only include history entries with a larger seq (cursor from latest_seq)
+        limit: maximum number of history entries, the oldest after since are kept and more is set
+    Responds 304 when the If-None-Match ETag still matches.
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', request_history.maxlen, type=int)
+    active_sessions_count = count_active_sessions()  # Sweeps first, so the version below is current
+    etag = f"{dashboard_version}-{since}-{limit}"
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
     else:
-        request_history_html += """
-            <tr>
-                <td colspan="5" style="text-align: center;">No requests received yet</td>
-            </tr>
-        """
-    
-    request_history_html += "</table>"
-    
-    # Generate HTML for server stats
-    server_stats_html = f"""
-        <div class="card">
-            <h2>Server Status</h2>
-            <div class="card-content">
-                <div class="session-info">
-                    <div class="stat">
-                        <div class="stat-label">Active Sessions:</div>
-                        <div class="stat-value" id="active-sessions">{active_sessions_count}</div>
-                    </div>
-                    <div class="stat">
-                        <div class="stat-label">Server Time:</div>
-                        <div class="stat-value" id="server-time">{datetime.datetime.now().strftime('%H:%M:%S')}</div>
-                    </div>
-                    <div class="stat">
-                        <div class="stat-label">Date:</div>
-                        <div class="stat-value" id="server-date">{datetime.datetime.now().strftime('%Y-%m-%d')}</div>
-                    </div>
-                    <a href="/clear-history" class="btn btn-danger">Clear Request History</a>
-                </div>
-            </div>
-        </div>
+        history, more = history_since(since, limit)
+        response = jsonify({
+            "version": dashboard_version,
+            "active_sessions_count": active_sessions_count,
+            "active_session": session_summary(get_active_session()),
+            "history": history,
+            "latest_seq": history[0]['seq'] if history else since,
+            "more": more,
+            "inventory": inventory_snapshot()
+        })
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # Browsers revalidate with If-None-Match every time
+    return response
+
+@app.route('/journal', methods=['GET'])
+def journal_query():
     """
-    
+    Query the on-disk request journal, oldest first.
+
+    Query parameters:
+        since: only include requests with a larger seq (use next_since to page)
+        action, code: only include requests with this action / code
+        limit: maximum number of entries (capped at JOURNAL_QUERY_LIMIT)
+    """
+    if not journal:
+        return jsonify({"status": "error", "message": "Request journal is disabled"}), 404
+    since = request.args.get('since', 0, type=int)
+    limit = min(request.args.get('limit', 100, type=int), JOURNAL_QUERY_LIMIT)
+    entries = journal.query(since, request.args.get('action'), request.args.get('code'), limit)
     return jsonify({
-        "active_sessions_count": active_sessions_count,
-        "active_session": bool(active_session),
-        "active_session_html": active_session_html,
-        "request_history_html": request_history_html,
-        "server_stats_html": server_stats_html
+        "entries": entries,
+        "next_since": entries[-1]['seq'] if entries else since
     })
 
+@app.route('/admin/inventory', methods=['GET'])
+def admin_inventory():
+    """Stock and capacity of every slot"""
+    return jsonify(inventory_snapshot())
+
+
+@app.route('/admin/restock', methods=['POST'])
+def admin_restock():
+    """
+    Restock slots. A JSON body like {"8D1": 5, "8C2": 0} sets those slots to the given stock,
+    an empty body refills every slot to its capacity.
+    """
+    levels = request.get_json(silent=True)
+    try:
+        if levels is not None and not isinstance(levels, dict):
+            raise ValueError("Expected a JSON object of slot code to stock")
+        restock(levels or None)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    logger.info(f"Restocked: {levels or 'all slots'}")
+    return jsonify(inventory_snapshot())
+
+
+@app.route('/admin/faults', methods=['GET', 'POST'])
+def admin_faults():
+    """
+    GET returns the fault injection settings and motor state.
+    POST merges a JSON change, e.g.
+        {"actions": {"dispense": {"latency": {"distribution": "normal", "mean_ms": 800, "stddev_ms": 200},
+                                  "error_rate": 0.05, "drop_rate": 0.02}},
+         "vend_duration_ms": 3000}
+    """
+    if request.method == 'POST':
+        try:
+            update_faults(request.get_json(force=True) or {})
+        except (TypeError, ValueError, AttributeError) as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        logger.info(f"Fault injection updated: {fault_config}")
+    with faults_lock:
+        config = copy.deepcopy(fault_config)
+    config['motor_busy'] = motor_lock.locked()
+    return jsonify(config)
+
+
+@app.route('/admin/faults/reset', methods=['POST'])
+def admin_faults_reset():
+    """Turn all fault injection off"""
+    with faults_lock:
+        fault_config.clear()
+        fault_config.update(copy.deepcopy(DEFAULT_FAULTS))
+    logger.info("Fault injection reset")
+    return jsonify(fault_config)
+
+
 @app.route('/clear-history', methods=['GET'])
 def clear_history():
     """Clear the request history"""
-    global request_history
-    request_history = deque(maxlen=50)  # Create a new empty deque
+    with history_lock:
+        request_history.clear()
     logger.info("Request history cleared via endpoint")
+    publish_event('history_cleared', {})
     
     # Redirect to dashboard
     response = make_response("")
@@ -832,8 +1424,63 @@ def clear_history():
     response.status_code = 302
     return response
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="AVend mock server")
+    parser.add_argument('--host', default='0.0.0.0', help="Interface to listen on")
+    parser.add_argument('--port', type=int, default=8080, help="Port to listen on")
+    parser.add_argument('--server', choices=['dev', 'waitress'], default='dev',
+                        help="dev: Flask debug server with reloader, waitress: multi-threaded WSGI server for load tests")
+    parser.add_argument('--threads', type=int, default=16, help="Worker threads for the waitress server")
+    parser.add_argument('--max-event-streams', type=int,
+                        help="Open dashboard event streams served at once with waitress, each holds a thread (default: a quarter of --threads)")
+    parser.add_argument('--quiet', action='store_true', help="Only log warnings, per-request logging costs throughput")
+    parser.add_argument('--faults', help="JSON file with initial fault injection settings (same format as POST /admin/faults)")
+    parser.add_argument('--capacity', type=int, help="Items each kiosk slot holds when full, stock is unlimited without it")
+    parser.add_argument('--slot', action='append', default=[], metavar='CODE=ITEMS',
+                        help="Capacity of one slot, overrides --capacity (repeatable, new codes become slots)")
+    parser.add_argument('--journal-dir', default=JOURNAL_DIR, help="Directory of the on-disk request journal")
+    parser.add_argument('--journal-max-mb', type=float, default=JOURNAL_MAX_BYTES / (1024 * 1024),
+                        help="Rotate the journal file at this size")
+    parser.add_argument('--journal-backups', type=int, default=JOURNAL_BACKUPS, help="Rotated journal files to keep")
+    parser.add_argument('--no-journal', action='store_true', help="Only keep the in-memory request history")
+    return parser.parse_args()
+
 if __name__ == '__main__':
+    args = parse_args()
+    if args.quiet:
+        logging.getLogger().setLevel(logging.WARNING)
+    if args.faults:
+        with open(args.faults) as f:
+            update_faults(json.load(f))
+        logger.info(f"Loaded fault injection settings from {args.faults}")
+    capacities = {code: args.capacity for code in SLOT_CODES} if args.capacity is not None else {}
+    for slot in args.slot:
+        code, _, items = slot.partition('=')
+        capacities[code] = int(items)
+    configure_inventory(capacities)
+    logger.info(f"Inventory: {capacities or 'unlimited'}")
     # Initialize request history
     logger.info("Request history initialized as empty")
+    # The dev server's reloader runs this twice, only the serving child should own the journal
+    if not args.no_journal and (args.server != 'dev' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        journal = RequestJournal(args.journal_dir, int(args.journal_max_mb * 1024 * 1024), args.journal_backups)
+        # Continue numbering after the previous run, every request is journaled so seqs stay unique
+        request_seq = itertools.count(journal.last_seq() + 1)
+        logger.info(f"Journaling requests to {journal.path}")
+    start_session_sweeper()
     # Run the app
-    app.run(host='0.0.0.0', port=8080, debug=True)
+    if args.server == 'waitress':
+        try:
+            from waitress import serve
+        except ImportError:
+            raise SystemExit("waitress is not installed, run 'pip install waitress' or use --server dev")
+        # Event streams hold a worker thread each, keep most of them free for the API under test
+        event_stream_limit = args.max_event_streams if args.max_event_streams is not None else max(1, args.threads // 4)
+        if event_stream_limit >= args.threads:
+            logger.warning(f"--max-event-streams {event_stream_limit} leaves no waitress thread for /avend while dashboards are open")
+        # All state lives in this process, so scale with threads rather than worker processes
+        logger.info(f"Serving with waitress on {args.host}:{args.port} using {args.threads} threads, "
+                    f"up to {event_stream_limit} for dashboard event streams")
+        serve(app, host=args.host, port=args.port, threads=args.threads)
+    else:
+        app.run(host=args.host, port=args.port, debug=True)
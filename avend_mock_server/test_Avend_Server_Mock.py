@@ -0,0 +1,91 @@
+# Tests for the AVend mock server.
+# Run from the repository root with: python -m unittest discover avend_mock_server
+
+import os
+import tempfile
+import unittest
+
+import Avend_Server_Mock as mock
+
+
+class HistorySinceTest(unittest.TestCase):
+    def setUp(self):
+        with mock.history_lock:
+            mock.request_history.clear()
+            for seq in range(1, 6):
+                mock.request_history.appendleft({'seq': seq})
+
+    def tearDown(self):
+        with mock.history_lock:
+            mock.request_history.clear()
+
+    def test_newest_first_without_limit(self):
+        history, more = mock.history_since(2)
+        self.assertEqual([req['seq'] for req in history], [5, 4, 3])
+        self.assertFalse(more)
+
+    def test_limit_does_not_skip_entries(self):
+        # 3 entries after the cursor with limit=2, paging with latest_seq must return all of them
+        history, more = mock.history_since(2, limit=2)
+        self.assertEqual([req['seq'] for req in history], [4, 3])
+        self.assertTrue(more)
+        history, more = mock.history_since(history[0]['seq'], limit=2)
+        self.assertEqual([req['seq'] for req in history], [5])
+        self.assertFalse(more)
+
+    def test_dashboard_data_cursor(self):
+        client = mock.app.test_client()
+        seen = []
+        since = 2
+        while True:
+            data = client.get(f'/dashboard-data?since={since}&limit=2').get_json()
+            seen.extend(req['seq'] for req in data['history'])
+            since = data['latest_seq']
+            if not data['more']:
+                break
+        self.assertEqual(sorted(seen), [3, 4, 5])
+
+
+class RequestJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'requests.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unreadable_lines_are_skipped(self):
+        # A corrupt line and a last line cut off by a crash mid-write
+        with open(self.path, 'w') as f:
+            f.write('{"seq": 1}\nnot json\n{"seq": 2}\n{"seq": 3, "act')
+        journal = mock.RequestJournal(self.directory.name)
+        self.assertEqual(journal.last_seq(), 2)
+        journal.append({'seq': 3})
+        self.assertEqual([entry['seq'] for entry in journal.query(0)], [1, 2, 3])
+
+    def test_query_across_rotations(self):
+        journal = mock.RequestJournal(self.directory.name, max_bytes=40, backups=10)
+        for seq in range(1, 21):
+            journal.append({'seq': seq})
+        self.assertEqual([entry['seq'] for entry in journal.query(5, limit=100)], list(range(6, 21)))
+        self.assertEqual(journal.last_seq(), 20)
+
+    def test_cursor_with_requests_finishing_out_of_order(self):
+        # Request 4 finishes before request 3, e.g. under injected latency
+        journal = mock.RequestJournal(self.directory.name)
+        for seq in (1, 2, 4, 3):
+            journal.append({'seq': seq, 'action': 'info'})
+        seen = []
+        since = 0
+        while True:
+            entries = journal.query(since, limit=3)
+            if not entries:
+                break
+            seen.extend(entry['request_seq'] for entry in entries)
+            since = entries[-1]['seq']
+        self.assertEqual(seen, [1, 2, 4, 3])
+        self.assertEqual(journal.last_seq(), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,252 @@
+"""
+End-to-end detection benchmark.
+
+Plays fixed video clips through the real DetectionThread (as the headless runner
+does) and times every stage with the thread's own stage timers: capture,
+convert, frame and payload emit, queue wait, inference and post-process. The
+verdict stage is the payload handling on the main thread, where MainWindow runs
+the PPEStateTracker update, it ends the capture-to-verdict span. Reports
+per-stage latency percentiles, capture-to-verdict latency, throughput and peak
+RSS, and compares the results against a stored baseline. Runs on CPU-only Linux,
+no display or camera needed:
+
+    python vending_gui/benchmark.py clips/*.mp4 --save-baseline baseline.json
+    python vending_gui/benchmark.py clips/*.mp4 --baseline baseline.json --threshold 0.10
+
+Exits with status 1 when a metric regressed by more than the threshold.
+"""
+
+# === Imports ===
+# Standard Library
+import os
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen") # Must be set before Qt is imported
+import sys
+import json
+import time
+import platform
+import resource
+import argparse
+
+# Third-Party
+import cv2
+import torch
+from PySide6.QtCore import QCoreApplication, Slot
+from PySide6.QtGui import QImage
+
+# Local Imports
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+from vending_gui import camera_opener
+from vending_gui.headless_runner import HeadlessRunner
+from vending_gui.ppe_state import MISS_THRESHOLD
+from vending_gui.metrics import latency_summary
+
+STAGES = ["capture", "convert", "emit_frame", "emit_payload", "queue_wait", "inference", "postprocess", "verdict"]
+PREDICTION_STAGES = ("queue_wait", "inference", "postprocess") # Timed once per prediction, the rest once per frame
+DEFAULT_THRESHOLD = 0.10 # Allowed relative slowdown before a metric counts as regressed
+NOISE_FLOOR = 0.05 # Latency changes below this fraction of the stage's baseline value are treated as noise
+TIMER_RESOLUTION_MS = 0.005 # Smallest latency change that is reported at all
+WARMUP_PREDICTIONS = 2 # First predictions load kernels, they and the frames timed until the last of them are left out
+
+
+class StageRecorder:
+    """
+    Stands in for one of DetectionThread's stage timers. Keeps every observation
+    with the time it was made, so the warm-up can be cut afterwards, and passes
+    it on to the stage's histogram.
+    """
+
+    def __init__(self, histogram=None):
+        self.histogram = histogram
+        self.samples = [] # (time.perf_counter() when observed, seconds)
+
+    def observe(self, value):
+        self.samples.append((time.perf_counter(), value))
+        if self.histogram is not None:
+            self.histogram.observe(value)
+
+    def values(self, since):
+        return [value for observed_at, value in self.samples if observed_at > since]
+
+    def values_after(self, count):
+        return [value for _, value in self.samples[count:]]
+
+
+class BenchmarkRunner(HeadlessRunner):
+    """HeadlessRunner whose DetectionThread reports every stage timing to a StageRecorder."""
+
+    def __init__(self, args):
+        super().__init__(args)
+        self.recorders = {stage: StageRecorder(timer) for stage, timer in self.detection_thread.stage_timers.items()}
+        self.detection_thread.stage_timers = self.recorders
+        self.recorders["verdict"] = StageRecorder()
+        self.frames_seen = StageRecorder() # Capture to main thread, timestamps give the FPS
+        self.capture_to_verdict = StageRecorder()
+
+    @Slot(QImage, int, float)
+    def on_frame(self, q_image, frame_seq, captured_at):
+        super().on_frame(q_image, frame_seq, captured_at)
+        self.frames_seen.observe(self.frame_latencies[-1])
+        if self.args.max_frames and self.frame_count >= self.args.max_frames:
+            self.stop()
+
+    @Slot(dict)
+    def on_detection(self, detection_payload):
+        verdicts_before = len(self.verdict_latencies)
+        start = time.perf_counter()
+        super().on_detection(detection_payload)
+        self.recorders["verdict"].observe(time.perf_counter() - start)
+        if len(self.verdict_latencies) > verdicts_before:
+            self.capture_to_verdict.observe(self.verdict_latencies[-1])
+
+    def results(self):
+        inference = self.recorders["inference"].samples
+        if len(inference) <= WARMUP_PREDICTIONS:
+            print(f"Only {len(inference)} prediction(s), fewer than the {WARMUP_PREDICTIONS} warm-up ones, nothing measured")
+            warm_from = float("inf")
+        else:
+            warm_from = inference[WARMUP_PREDICTIONS - 1][0]
+        frame_times = [observed_at for observed_at, _ in self.frames_seen.samples if observed_at > warm_from]
+        elapsed = frame_times[-1] - frame_times[0] if len(frame_times) > 1 else 0.0
+        return {
+            "frames": self.frame_count,
+            "measured_frames": len(frame_times),
+            "detection_interval": camera_opener.DETECTION_INTERVAL,
+            "fps": round((len(frame_times) - 1) / elapsed, 2) if elapsed else None,
+            "predictions_per_s": round(len(self.recorders["inference"].values(warm_from)) / elapsed, 2) if elapsed else None,
+            "stages": {stage: latency_summary(self._stage_values(stage, warm_from), digits=3) for stage in STAGES},
+            "capture_to_verdict": latency_summary(self.capture_to_verdict.values_after(WARMUP_PREDICTIONS), digits=3),
+        }
+
+
+    def _stage_values(self, stage, warm_from):
+        if stage in PREDICTION_STAGES:
+            return self.recorders[stage].values_after(WARMUP_PREDICTIONS)
+        return self.recorders[stage].values(warm_from)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024, 1)
+
+
+def benchmark_clip(app, path, args):
+    """
+    Plays one clip as fast as DetectionThread takes the frames and returns its results.
+    Predictions run on their own thread and frames arriving meanwhile are not
+    predicted, like on the kiosk.
+    """
+    runner_args = argparse.Namespace(video=path, loop=False, fps=None, asap=True, duration=0,
+                                     miss_threshold=MISS_THRESHOLD, auto_dispense=False, max_frames=args.max_frames)
+    rss_before = peak_rss_mb()
+    runner = BenchmarkRunner(runner_args)
+    runner.start()
+    app.exec()
+    runner.shutdown()
+    error = runner.failure()
+    if error:
+        raise SystemExit(f"{path}: {error}")
+    results = runner.results()
+    results["peak_rss_growth_mb"] = round(peak_rss_mb() - rss_before, 1) # The process peak is only known for the whole run
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """
+    Lists regressions of results against baseline, each as (clip, metric, baseline value, current value).
+    Latencies and memory regress when they grow, FPS when it drops.
+    """
+    regressions = []
+
+    def check(clip, metric, old, new, higher_is_better=False, is_latency=False):
+        if old is None or new is None:
+            return
+        # Relative to the stage, so sub-millisecond stages can regress too
+        if is_latency and abs(new - old) < max(old * NOISE_FLOOR, TIMER_RESOLUTION_MS):
+            return
+        worse = new < old * (1 - threshold) if higher_is_better else new > old * (1 + threshold)
+        if worse:
+            regressions.append((clip, metric, old, new))
+
+    for clip, current in results["clips"].items():
+        old = baseline.get("clips", {}).get(clip)
+        if old is None:
+            print(f"No baseline for clip {clip}, skipping comparison")
+            continue
+        check(clip, "fps", old.get("fps"), current["fps"], higher_is_better=True)
+        for stage in STAGES:
+            for pct in ("p50_ms", "p95_ms"):
+                check(clip, f"{stage} {pct}", old.get("stages", {}).get(stage, {}).get(pct),
+                      current["stages"][stage][pct], is_latency=True)
+        for pct in ("p50_ms", "p95_ms"):
+            check(clip, f"capture_to_verdict {pct}", old.get("capture_to_verdict", {}).get(pct),
+                  current["capture_to_verdict"][pct], is_latency=True)
+    check("all", "peak_rss_mb", baseline.get("peak_rss_mb"), results["peak_rss_mb"])
+    return regressions
+
+
+def print_results(results):
+    print(f"\n=== Detection Benchmark ({results['device']}) ===")
+    for clip, clip_results in results["clips"].items():
+        print(f"\n{clip}: {clip_results['measured_frames']} frames, {clip_results['fps']} FPS, "
+              f"{clip_results['predictions_per_s']} predictions/s (every {clip_results['detection_interval']} frames)")
+        print(f"  {'stage':<20}{'count':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        rows = list(clip_results["stages"].items()) + [("capture_to_verdict", clip_results["capture_to_verdict"])]
+        for stage, summary in rows:
+            values = "".join(f"{'-' if summary[key] is None else summary[key]:>10}" for key in ("mean_ms", "p50_ms", "p95_ms", "p99_ms"))
+            print(f"  {stage:<20}{summary['count']:>8}{values}")
+        print(f"  Process peak RSS grew by {clip_results['peak_rss_growth_mb']} MB during this clip")
+    print(f"\nProcess peak RSS: {results['peak_rss_mb']} MB")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the PPE detection pipeline on fixed video clips")
+    parser.add_argument("clips", nargs="+", help="Video clips to run, compared by file name against the baseline")
+    parser.add_argument("--interval", type=int, help="Predict every N frames, defaults to the GUI's detection interval")
+    parser.add_argument("--max-frames", type=int, help="Stop each clip after this many frames")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed relative regression, 0.10 is 10%%")
+    parser.add_argument("--save-baseline", help="Write these results as the new baseline")
+    parser.add_argument("--json", help="Write the results to this JSON file")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    app = QCoreApplication(sys.argv) # Receives DetectionThread's signals like the GUI thread
+    if camera_opener.model is None:
+        raise SystemExit("No detection model loaded, set MODEL_PATH in .env")
+    if args.interval:
+        camera_opener.DETECTION_INTERVAL = args.interval # run_detection() hands it to DetectionThread
+
+    results = {
+        "device": "cuda:0" if torch.cuda.is_available() else "cpu", # DetectionThread picks the device
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "clips": {},
+    }
+    for path in args.clips:
+        print(f"Benchmarking {path}...")
+        results["clips"][os.path.basename(path)] = benchmark_clip(app, path, args)
+    results["peak_rss_mb"] = peak_rss_mb()
+    print_results(results)
+
+    for output in (args.json, args.save_baseline):
+        if output:
+            with open(output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+            for clip, metric, old, new in regressions:
+                print(f"  {clip} {metric}: {old} -> {new}")
+            sys.exit(1)
+        print(f"\nNo regressions over {args.threshold:.0%} against {args.baseline}")
@@ -12,6 +12,9 @@ import re
 import torch
 from dotenv import load_dotenv
 import os
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Load the trained model
 load_dotenv()
@@ -47,6 +50,143 @@ FRAME_WIDTH = 640
 FRAME_HEIGHT = 480
 DETECTION_INTERVAL = 5
 DISPLAY_FPS = 60
+CONFIDENCE_THRESHOLD = 0.15 # Minimum confidence for a detection to count
+
+def predict_frame(model, frame, device='cpu', verbose=True):
+    """Runs the model on one frame and returns its result, or None if there is none"""
+    results = model.predict(frame, conf=CONFIDENCE_THRESHOLD, stream=True, device=device, verbose=verbose)
+    for result in results:
+        return result
+    return None
+
+def postprocess_result(result, class_names, class_map, state_keys):
+    """
+    Turns one YOLO result into button states and drawable boxes.
+
+    Args:
+        result: A YOLO result from predict_frame(), or None.
+        class_names (dict): The model's class index -> name map.
+        class_map (dict): Lowercase class name -> GUI button key.
+        state_keys (iterable): Button keys to report, all start as not detected.
+    Returns:
+        tuple: (states, boxes, summary) where states maps button key -> detected,
+        boxes is a list of {'coords', 'label', 'conf'} and summary lists "name (conf)".
+    """
+    states = {key: False for key in state_keys}
+    boxes = []
+    summary = []
+    if result is None or not result.boxes or not class_names:
+        return states, boxes, summary
+    for box in result.boxes:
+        class_index = int(box.cls)
+        confidence = float(box.conf)
+        class_name = class_names[class_index].lower()
+        if class_name in class_map:
+            states[class_map[class_name]] = True
+            try:
+                coords = box.xyxy[0].cpu().numpy().astype(int)
+                boxes.append({'coords': coords.tolist(), 'label': class_name, 'conf': confidence})
+                summary.append(f"{class_name} ({confidence:.2f})")
+            except Exception as e:
+                logger.error("Error processing box data: %s", e) # Rate limited per call site, this runs on every prediction
+    return states, boxes, summary
+
+class VideoFileSource:
+    """
+    Plays a recorded clip through the same interface as cv2.VideoCapture
+    (read, isOpened, get, set, release), so DetectionThread runs it through the
+    exact capture/convert/infer path used for a live camera.
+
+    In real-time mode frames are released at the clip's native frame rate (or a
+    forced one), and frames the consumer was too slow for are skipped, like a
+    camera with a one frame buffer. In asap mode every frame is returned
+    immediately, for throughput measurements.
+    """
+    controls_rate = True # DetectionThread leaves frame pacing to this source
+
+    def __init__(self, path, loop=True, fps=None, asap=False, size=(FRAME_WIDTH, FRAME_HEIGHT)):
+        """
+        Args:
+            path (str): Video file to play.
+            loop (bool): Restart from the first frame at the end of the clip.
+            fps (float): Forced frame rate, None uses the clip's native rate.
+            asap (bool): Return frames as fast as they are read, without pacing or skipping.
+            size (tuple): (width, height) frames are resized to, None keeps the clip's size.
+        """
+        self.path = path
+        self.loop = loop
+        self.asap = asap
+        self.size = tuple(size) if size else None
+        self.cap = cv2.VideoCapture(path)
+        native_fps = self.cap.get(cv2.CAP_PROP_FPS) if self.cap.isOpened() else 0
+        self.fps = fps or (native_fps if native_fps and native_fps > 0 else DISPLAY_FPS)
+        self.frames_returned = 0
+        self.frames_skipped = 0
+        self.loops = 0
+        self._position = 0 # Frames consumed from the clip, returned or skipped
+        self._start_time = None
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        """Returns (ret, frame) like cv2.VideoCapture.read(), ret is False once a non-looping clip ends."""
+        if not self.asap:
+            now = time.perf_counter()
+            if self._start_time is None:
+                self._start_time = now
+            # Skip the frames whose time has already passed
+            due_index = int((now - self._start_time) * self.fps)
+            while self._position < due_index:
+                if not self._grab():
+                    return False, None
+                self.frames_skipped += 1
+            # Wait for the next frame's time
+            due_time = self._start_time + self._position / self.fps
+            if due_time > now:
+                time.sleep(due_time - now)
+
+        if not self._grab():
+            return False, None
+        ret, frame = self.cap.retrieve()
+        if not ret or frame is None:
+            return False, None
+        if self.size and (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        self.frames_returned += 1
+        return True, frame
+
+    def _grab(self):
+        """Advances one frame, rewinding at the end of the clip when looping."""
+        if self.cap.grab():
+            self._position += 1
+            return True
+        if not self.loop or self._position == 0:
+            return False
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.loops += 1
+        if not self.cap.grab():
+            return False
+        self._position += 1
+        return True
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if self.size and prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.size[0]
+        if self.size and prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.size[1]
+        return self.cap.get(prop)
+
+    def set(self, prop, value):
+        return False # Properties of a recording are fixed
+
+    def getBackendName(self):
+        return f"VideoFile({self.cap.getBackendName()})" if self.cap.isOpened() else "VideoFile"
+
+    def release(self):
+        self.cap.release()
 
 def print_camera_info(cap, camera_index):
     """Print detailed information about the camera"""
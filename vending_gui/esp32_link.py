@@ -0,0 +1,424 @@
+"""
+Serial link to the ESP32 safety gate controller.
+
+ESP32Link is a QThread that owns the serial port: the GUI queues commands with
+send() and never touches the port itself, so opening, the ESP32's post-reset
+settle time, writes and reconnects all happen off the GUI thread. Link state and
+every line the ESP32 prints are reported through signals.
+
+Commands are acknowledged: each goes out as "<seq> <command>" and the sketch
+answers "ACK <seq> <LOCKED|UNLOCKED>" once the lock pin is set (or
+"NAK <seq> <reason>"). Unacknowledged commands are retransmitted after
+ACK_TIMEOUT_S, and the round-trip time of every acknowledged command is
+recorded in the ppe_gate_command_rtt_seconds histogram. Lock and unlock are
+idempotent on the ESP32, so a retransmit never toggles the gate twice.
+
+Every connection starts with a "ping". Sketches from v0.2.1 answer
+"PONG PPE-GATE" and get the acknowledged protocol. An older sketch does not
+answer, so the link marks the connection as legacy and sends it plain commands
+without waiting for ACKs.
+
+Without a configured port the link finds the ESP32 itself: it probes the USB
+serial ports with a known USB-UART VID/PID (every USB serial port with
+probe_all_ports) and picks the one that answers the ping. Opening a port resets
+most boards, so a port that did not answer is only probed again after a back-off.
+An older sketch never answers the ping, so it is only found this way with
+legacy_fallback, which takes the first known-VID/PID port as the gate when no
+port answered. Otherwise configure its port.
+The port list is re-read every HOTPLUG_CHECK_S seconds on the worker thread, so
+an unplugged cable is noticed and the ESP32 is found again when it is plugged
+back in, on whatever port it gets.
+
+Works with any port pyserial can open, including one side of a pseudo-terminal
+pair, so the link can be exercised without hardware.
+"""
+
+import time
+import queue
+import logging
+import threading
+
+import serial
+import serial.tools.list_ports
+from PySide6.QtCore import QThread, Signal
+
+from vending_gui.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+BAUDRATE = 115200 # Matches Serial.begin() in ESP32_Bluetooth_Comms.ino
+SETTLE_TIME_S = 2.0 # Opening the port resets the ESP32, its setup() takes about a second
+RECONNECT_INTERVAL_S = 2.0 # Wait between connection attempts
+READ_TIMEOUT_S = 0.05 # Bounds how long the worker blocks in read() before checking for queued commands
+WRITE_TIMEOUT_S = 1.0
+ACK_TIMEOUT_S = 1.5 # The sketch blinks for up to 600 ms before it switches the lock and acknowledges
+MAX_ATTEMPTS = 3 # Sends of one command, including the first, before it counts as failed
+MAX_SEQ = 65535 # Sequence numbers wrap back to 1 after this
+
+HANDSHAKE_TIMEOUT_S = 1.0 # Wait for the PONG after "ping"
+HOTPLUG_CHECK_S = 1.0 # Interval between port list scans
+PROBE_BACKOFF_S = 10.0 # Wait before probing a port that did not answer again, doubled on every miss
+PROBE_BACKOFF_MAX_S = 300.0
+HANDSHAKE_VERSION = "v0.2.1" # First sketch version answering the ping, older ones get plain commands without ACKs
+
+# USB-UART bridges found on ESP32 dev boards, (VID, PID), PID None for any
+KNOWN_USB_IDS = (
+    (0x10C4, 0xEA60), # Silicon Labs CP210x
+    (0x1A86, 0x7523), # WCH CH340
+    (0x1A86, 0x55D4), # WCH CH9102
+    (0x0403, 0x6001), # FTDI FT232R
+    (0x303A, None),   # Espressif native USB (ESP32-S2/S3/C3)
+)
+
+# Gate state the ESP32 reports in its ACK for each command
+EXPECTED_STATES = {"lock": "LOCKED", "unlock": "UNLOCKED"}
+
+# Link states emitted by state_changed
+DISCONNECTED = "disconnected"
+CONNECTING = "connecting"
+CONNECTED = "connected"
+
+
+def is_known_usb_id(vid, pid):
+    return any(vid == known_vid and known_pid in (None, pid) for known_vid, known_pid in KNOWN_USB_IDS)
+
+
+def list_candidate_ports():
+    """
+    USB serial ports that could be the ESP32, known VID/PIDs first.
+    Returns a list of (device, description, matches a known USB ID).
+    """
+    candidates = []
+    for info in serial.tools.list_ports.comports():
+        if info.vid is None:
+            continue # Built-in UARTs and Bluetooth ports
+        candidates.append((info.device, info.description, is_known_usb_id(info.vid, info.pid)))
+    return sorted(candidates, key=lambda candidate: not candidate[2])
+
+
+class ESP32Link(QThread):
+    """
+    Background serial worker for the gate controller.
+
+    Commands sent while the link is down are dropped rather than replayed later,
+    so a stale "unlock" can never open the gate after a reconnect. Every new
+    connection starts by sending "lock". A new command also supersedes one still
+    waiting for its ACK, which is then no longer retransmitted.
+
+    With port None the ESP32 is discovered automatically (see module docstring).
+    legacy is True while connected to a sketch older than HANDSHAKE_VERSION.
+    """
+    state_changed = Signal(str) # Emits DISCONNECTED, CONNECTING or CONNECTED
+    line_received = Signal(str) # Emits each line printed by the ESP32
+    error_signal = Signal(str) # Emits a description of connection and write errors
+    command_acked = Signal(str, float, str) # Emits (command, round-trip seconds, gate state reported by the ESP32)
+    command_failed = Signal(str, str) # Emits (command, reason) when a command was never acknowledged
+    command_sent_unacked = Signal(str) # Emits each command sent to a legacy sketch, which never acknowledges
+
+    def __init__(self, port=None, baudrate=BAUDRATE, settle_time=SETTLE_TIME_S, reconnect_interval=RECONNECT_INTERVAL_S,
+                 ack_timeout=ACK_TIMEOUT_S, max_attempts=MAX_ATTEMPTS, probe_all_ports=False, legacy_fallback=False):
+        super().__init__()
+        self.port = port
+        self.baudrate = baudrate
+        self.settle_time = settle_time
+        self.reconnect_interval = reconnect_interval
+        self.ack_timeout = ack_timeout
+        self.max_attempts = max_attempts
+        self.probe_all_ports = probe_all_ports
+        self.legacy_fallback = legacy_fallback
+        self.next_seq = 1
+        self.pending = {} # seq -> {'command', 'first_sent', 'last_sent', 'attempts'}, only touched by the worker
+        self.retransmit_counter = registry.counter("ppe_gate_command_retransmits_total", "Gate commands sent again after no ACK")
+        self.failure_counter = registry.counter("ppe_gate_command_failures_total", "Gate commands never acknowledged by the ESP32")
+        self.state = DISCONNECTED
+        self.legacy = False
+        self.serial = None
+        self.connected_port = None # Port currently open, the discovered one in auto mode
+        self._probe_backoff = {} # Port -> (monotonic time it may be probed again, misses in a row)
+        self._next_hotplug_check = 0.0
+        self._rx_buffer = b""
+        self._handshake_lines = []
+        self.commands = queue.Queue()
+        self._stop_event = threading.Event()
+        self._port_changed = threading.Event()
+        self._port_lock = threading.Lock()
+
+    # --- Called from the GUI thread ---
+
+    def send(self, command):
+        """Queues a command line for the ESP32, returns immediately."""
+        self.commands.put(command)
+
+    def set_port(self, port):
+        """Switches to another port (or None to auto-discover), the worker reconnects in the background."""
+        with self._port_lock:
+            self.port = port or None
+        self._port_changed.set()
+
+    def is_connected(self):
+        return self.state == CONNECTED
+
+    def stop(self):
+        """Signals the worker to close the port and exit."""
+        self._stop_event.set()
+
+    # --- Worker thread ---
+
+    def run(self):
+        threading.current_thread().name = "ESP32Link" # Names its stacks in profiles
+        next_attempt = 0.0
+        while not self._stop_event.is_set():
+            if self._port_changed.is_set():
+                self._port_changed.clear()
+                self._close()
+                next_attempt = 0.0
+
+            if self.serial is None:
+                with self._port_lock:
+                    port = self.port
+                if time.monotonic() < next_attempt:
+                    self._drop_queued_commands()
+                    self._stop_event.wait(0.1)
+                    continue
+                connected = self._discover() if port is None else self._open(port)
+                if not connected:
+                    next_attempt = time.monotonic() + (HOTPLUG_CHECK_S if port is None else self.reconnect_interval)
+                continue
+
+            try:
+                self._write_queued_commands()
+                self._retransmit_overdue()
+                self._read_lines()
+                self._check_unplugged()
+            except (serial.SerialException, OSError) as e:
+                logger.error("ESP32 link on %s lost: %s", self.connected_port, e)
+                self.error_signal.emit(f"Connection to {self.connected_port} lost: {e}")
+                self._close()
+                next_attempt = time.monotonic() + self.reconnect_interval
+        self._close()
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self.state_changed.emit(state)
+
+    def _discover(self):
+        """Probes the candidate USB serial ports for the ESP32, returns True once connected to it."""
+        candidates = list_candidate_ports()
+        if not self.probe_all_ports:
+            candidates = [candidate for candidate in candidates if candidate[2]]
+        devices = {device for device, _, _ in candidates}
+        self._probe_backoff = {device: entry for device, entry in self._probe_backoff.items() if device in devices} # Unplugged ports are probed again on replug
+        now = time.monotonic()
+        due = [candidate for candidate in candidates if self._probe_backoff.get(candidate[0], (0.0, 0))[0] <= now]
+        if not due:
+            return False
+
+        for device, description, known_id in due:
+            logger.info("Probing %s (%s) for the ESP32...", device, description)
+            if self._open(device, require_handshake=True):
+                self._probe_backoff.pop(device, None)
+                return True
+            if self._stop_event.is_set() or self._port_changed.is_set():
+                return False
+            misses = self._probe_backoff.get(device, (0.0, 0))[1] + 1
+            backoff = min(PROBE_BACKOFF_MAX_S, PROBE_BACKOFF_S * 2 ** (misses - 1))
+            self._probe_backoff[device] = (time.monotonic() + backoff, misses)
+            logger.info("No ESP32 on %s, probing it again in %.0fs", device, backoff)
+
+        # Sketches older than HANDSHAKE_VERSION do not answer the ping, only take a port by its USB ID when asked to
+        if not self.legacy_fallback:
+            logger.info("No ESP32 answered the handshake on %d serial port(s)", len(due))
+            return False
+        for device, description, known_id in due:
+            if known_id:
+                logger.warning("No ESP32 answered the handshake, taking %s (%s) as the gate by its USB ID", device, description)
+                if self._open(device):
+                    self._probe_backoff.pop(device, None)
+                    return True
+                return False
+        logger.info("No ESP32 found on %d serial port(s)", len(due))
+        return False
+
+    def _handshake(self):
+        """Pings the sketch, returns True if it answered (HANDSHAKE_VERSION or later)."""
+        self._handshake_lines = []
+        self.serial.write(b"ping\n")
+        self.serial.flush()
+        deadline = time.monotonic() + HANDSHAKE_TIMEOUT_S
+        while time.monotonic() < deadline:
+            self._read_lines(handle=False)
+            if any(line.startswith("PONG PPE-GATE") for line in self._handshake_lines):
+                return True
+        return False
+
+    def _open(self, port, require_handshake=False):
+        self._set_state(CONNECTING)
+        logger.info("Attempting to connect to ESP32 on %s...", port)
+        try:
+            self.serial = serial.Serial(port=port, baudrate=self.baudrate, timeout=READ_TIMEOUT_S, write_timeout=WRITE_TIMEOUT_S)
+        except (serial.SerialException, OSError, ValueError) as e:
+            logger.warning("Could not connect to ESP32 on %s: %s. Retrying in %ss", port, e, self.reconnect_interval)
+            self.error_signal.emit(f"Could not connect to {port}: {e}")
+            self.serial = None
+            self._set_state(DISCONNECTED)
+            return False
+
+        # Wait for the ESP32 to boot after the reset, without blocking anyone but this thread
+        if self._stop_event.wait(self.settle_time) or self._port_changed.is_set():
+            self._close()
+            return False
+        try:
+            self.serial.reset_input_buffer() # Drop the boot banner
+            self._rx_buffer = b""
+            answered = self._handshake()
+        except (serial.SerialException, OSError) as e:
+            logger.warning("Lost %s while connecting: %s", port, e)
+            self._close()
+            return False
+        if not answered and require_handshake:
+            logger.info("No handshake reply on %s", port)
+            self._close()
+            return False
+        self.legacy = not answered
+        if self.legacy:
+            logger.warning("ESP32 on %s did not answer the ping, treating it as a sketch older than %s: "
+                           "commands are sent without sequence numbers and not acknowledged", port, HANDSHAKE_VERSION)
+        self._drop_queued_commands()
+        self.connected_port = port
+        self._next_hotplug_check = time.monotonic() + HOTPLUG_CHECK_S
+        logger.info("Successfully connected to ESP32 on %s.", port)
+        self._set_state(CONNECTED)
+        self.send("lock") # Every connection starts locked
+        return True
+
+    def _check_unplugged(self):
+        """In auto mode, closes the link when its port disappears from the port list."""
+        if self.port is not None or time.monotonic() < self._next_hotplug_check:
+            return
+        self._next_hotplug_check = time.monotonic() + HOTPLUG_CHECK_S
+        if self.connected_port not in {device for device, _, _ in list_candidate_ports()}:
+            raise serial.SerialException("port was unplugged")
+
+    def _close(self):
+        self._fail_pending("link lost")
+        if self.serial is not None:
+            try:
+                self.serial.close()
+            except (serial.SerialException, OSError) as e:
+                logger.error("Error closing ESP32 serial port: %s", e)
+            self.serial = None
+            logger.info("ESP32 serial port closed.")
+        self._probe_backoff.pop(self.connected_port, None) # Probe it again right away if it comes back
+        self.connected_port = None
+        self.legacy = False
+        self._set_state(DISCONNECTED)
+
+    def _drop_queued_commands(self):
+        while True:
+            try:
+                command = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            logger.warning("ESP32 not connected. Dropping command: '%s'", command)
+
+    def _write_queued_commands(self):
+        while True:
+            try:
+                command = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            if self.legacy:
+                logger.info("Sending to ESP32 (no ACK): %s", command)
+                self._write_line(command)
+                self.command_sent_unacked.emit(command)
+                continue
+            for seq, superseded in self.pending.items():
+                logger.info("ESP32 command %s '%s' superseded by '%s'", seq, superseded['command'], command)
+            self.pending.clear()
+            seq = self.next_seq
+            self.next_seq = seq % MAX_SEQ + 1
+            now = time.monotonic()
+            self.pending[seq] = {'command': command, 'first_sent': now, 'last_sent': now, 'attempts': 1}
+            logger.info("Sending to ESP32: %s %s", seq, command)
+            self._write_line(f"{seq} {command}")
+
+    def _write_line(self, line):
+        try:
+            self.serial.write(f"{line}\n".encode('utf-8'))
+            self.serial.flush()
+        except serial.SerialTimeoutException:
+            logger.error("Error sending '%s' to ESP32: Write timeout.", line)
+            self.error_signal.emit(f"Write timed out sending '{line}'")
+
+    def _retransmit_overdue(self):
+        now = time.monotonic()
+        for seq, entry in list(self.pending.items()):
+            if now - entry['last_sent'] < self.ack_timeout:
+                continue
+            if entry['attempts'] < self.max_attempts:
+                entry['attempts'] += 1
+                entry['last_sent'] = now
+                self.retransmit_counter.inc()
+                logger.warning("No ACK for ESP32 command %s '%s', retransmitting (attempt %d/%d)",
+                               seq, entry['command'], entry['attempts'], self.max_attempts)
+                self._write_line(f"{seq} {entry['command']}")
+                continue
+            del self.pending[seq]
+            self.failure_counter.inc()
+            reason = f"no ACK after {self.max_attempts} attempts"
+            logger.error("ESP32 command %s '%s' failed: %s", seq, entry['command'], reason)
+            self.command_failed.emit(entry['command'], reason)
+
+    def _fail_pending(self, reason):
+        for seq, entry in self.pending.items():
+            self.failure_counter.inc()
+            logger.error("ESP32 command %s '%s' failed: %s", seq, entry['command'], reason)
+            self.command_failed.emit(entry['command'], reason)
+        self.pending.clear()
+
+    def _handle_reply(self, line):
+        """Matches ACK/NAK lines to pending commands."""
+        parts = line.split()
+        if len(parts) < 2 or parts[0] not in ("ACK", "NAK"):
+            return
+        try:
+            seq = int(parts[1])
+        except ValueError:
+            return
+        entry = self.pending.pop(seq, None)
+        if entry is None:
+            logger.debug("Ignoring %s for command %s, no longer pending", parts[0], seq)
+            return
+        command = entry['command']
+        detail = parts[2] if len(parts) > 2 else ""
+        if parts[0] == "NAK":
+            self.failure_counter.inc()
+            logger.error("ESP32 rejected command %s '%s': %s", seq, command, detail)
+            self.command_failed.emit(command, f"rejected: {detail}")
+            return
+        rtt = time.monotonic() - entry['first_sent']
+        registry.histogram("ppe_gate_command_rtt_seconds", "Seconds from sending a gate command until the ESP32 acknowledged it",
+                           command=command).observe(rtt)
+        expected = EXPECTED_STATES.get(command)
+        if expected and detail != expected:
+            logger.warning("ESP32 acknowledged '%s' but reports the gate %s", command, detail or "in an unknown state")
+        logger.info("ESP32 acknowledged %s '%s' in %.0f ms (attempt %d), gate %s", seq, command, rtt * 1000, entry['attempts'], detail)
+        self.command_acked.emit(command, rtt, detail)
+
+    def _read_lines(self, handle=True):
+        data = self.serial.read(self.serial.in_waiting or 1) # Returns after READ_TIMEOUT_S when the ESP32 is quiet
+        if not data:
+            return
+        self._rx_buffer += data
+        *lines, self._rx_buffer = self._rx_buffer.split(b"\n") # Keep a partial line for the next read
+        for raw in lines:
+            line = raw.decode('utf-8', errors='replace').strip()
+            if not line:
+                continue
+            logger.debug("ESP32: %s", line)
+            if not handle:
+                self._handshake_lines.append(line)
+                continue
+            self._handle_reply(line)
+            self.line_received.emit(line)
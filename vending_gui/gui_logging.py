@@ -0,0 +1,138 @@
+"""
+Non-blocking, leveled logging for the PPE vending GUI.
+
+Log calls only put the record on an in-memory queue; a listener thread writes
+them to the console and to a rotating log file, so slow eMMC or a stalled
+journald never holds up the capture loop or the GUI thread. Repetitive
+messages (read failures, per-inference detections) are rate limited per call
+site, with a count of what was suppressed.
+
+Configured from the environment (or the .env file next to MODEL_PATH):
+    LOG_LEVEL        DEBUG, INFO (default), WARNING or ERROR
+    LOG_FILE         Log file path, defaults to vending_gui/logs/ppe_gui.log, empty to disable
+    LOG_MAX_MB       Size before the file is rotated, default 10
+    LOG_BACKUPS      Rotated files kept, default 5
+    LOG_RATE_LIMIT   Messages per call site per LOG_RATE_WINDOW seconds, default 5 per 10s, 0 to disable
+"""
+
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+DEFAULT_LOG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "ppe_gui.log")
+LOG_FORMAT = "%(asctime)s %(levelname)-7s [%(threadName)s] %(name)s: %(message)s"
+QUEUE_SIZE = 10000 # Records waiting for the listener before new ones are dropped
+DEFAULT_RATE_LIMIT = 5
+DEFAULT_RATE_WINDOW = 10.0
+
+_listener = None
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most `limit` records per call site (logger, file and line) in
+    each `window` seconds. The first record after a window with suppressed records
+    carries the number that were dropped.
+    """
+
+    def __init__(self, limit=DEFAULT_RATE_LIMIT, window=DEFAULT_RATE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.sites = {} # (name, pathname, lineno) -> [window start, count, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if self.limit <= 0:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            site = self.sites.get(key)
+            if site is None or now - site[0] >= self.window:
+                suppressed = site[2] if site else 0
+                self.sites[key] = [now, 1, 0]
+            elif site[1] < self.limit:
+                site[1] += 1
+                suppressed = 0
+            else:
+                site[2] += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking or raising when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level=None, log_file=None, max_mb=None, backups=None, rate_limit=None, rate_window=None):
+    """
+    Routes the root logger through a queue to the console and a rotating file.
+    Arguments left as None are read from the environment. Safe to call more than
+    once, later calls are ignored. Returns the QueueListener.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = (level or os.getenv('LOG_LEVEL', "INFO")).upper()
+    log_file = log_file if log_file is not None else os.getenv('LOG_FILE', DEFAULT_LOG_FILE)
+    max_mb = max_mb if max_mb is not None else float(os.getenv('LOG_MAX_MB', 10))
+    backups = backups if backups is not None else int(os.getenv('LOG_BACKUPS', 5))
+    rate_limit = rate_limit if rate_limit is not None else int(os.getenv('LOG_RATE_LIMIT', DEFAULT_RATE_LIMIT))
+    rate_window = rate_window if rate_window is not None else float(os.getenv('LOG_RATE_WINDOW', DEFAULT_RATE_WINDOW))
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = []
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatter)
+    handlers.append(console_handler)
+    if log_file:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+            file_handler = RotatingFileHandler(log_file, maxBytes=int(max_mb * 1024 * 1024), backupCount=backups, encoding="utf-8")
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        except OSError as e:
+            print(f"Could not open log file {log_file}, logging to the console only: {e}")
+
+    log_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(rate_limit, rate_window))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(getattr(logging, level, logging.INFO))
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def stop_logging():
+    """Flushes the queued records and stops the listener thread."""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
@@ -0,0 +1,250 @@
+"""
+Headless runner for the PPE vending pipeline.
+
+Drives DetectionThread's capture/inference loop and the PPE state machine from a
+video file (camera_opener.VideoFileSource) without creating any widgets (Qt runs on the offscreen platform), then
+reports FPS and latency. Runs on a plain Linux box with no display, camera or GPU:
+
+    python vending_gui/headless_runner.py clip.mp4 --duration 60 --json results.json
+"""
+
+# === Imports ===
+# Standard Library
+import os
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen") # Must be set before Qt is imported
+import sys
+import time
+import json
+import argparse
+import threading
+
+# Third-Party
+from PySide6.QtCore import QCoreApplication, QObject, QTimer, Slot
+from PySide6.QtGui import QImage
+
+# Local Imports
+parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+from vending_gui.main_gui import (
+    DetectionThread, AvendAPI, DispenseQueue, DISPENSE_DEBOUNCE_S, MAX_DISPENSES_IN_FLIGHT, STALE_VERDICT_S
+)
+from vending_gui.camera_opener import VideoFileSource
+from vending_gui.ppe_state import PPEStateTracker, MISSING, MISS_THRESHOLD
+from vending_gui.metrics import registry, start_exporters_from_env, latency_summary
+from vending_gui.gui_logging import setup_logging
+
+PPE_KEYS = ["hardhat", "glasses", "vest", "earplugs", "gloves"]
+AVEND_CODES = {"hardhat": "8D1", "glasses": "8C2", "vest": "8A4", "earplugs": "8E7", "gloves": "8B3"}
+
+
+class HeadlessRunner(QObject):
+    """
+    Receives DetectionThread's signals on the main thread, like MainWindow does,
+    and feeds the detection payloads through the same PPEStateTracker.
+    """
+
+    def __init__(self, args):
+        super().__init__()
+        self.args = args
+        self.ppe_state = PPEStateTracker(PPE_KEYS, miss_threshold=args.miss_threshold)
+        self.frame_count = 0
+        self.payload_count = 0
+        self.first_frame_time = None
+        self.last_frame_time = None
+        self.inference_times = []
+        self.frame_latencies = [] # Capture until the frame reaches the main thread
+        self.verdict_latencies = [] # Capture until the frame's verdict reaches the main thread
+        self.last_verdict_seq = None
+        self.verdict_stale = False
+        self.stale_verdicts = 0
+        self.verdict_changes = [] # (seconds since first frame, item key, DETECTED/MISSING)
+        self.current_verdicts = {key: None for key in PPE_KEYS}
+        self.camera_status = None
+
+        # Optional dispensing of items that turn red, through the same queue as the GUI
+        self.api = None
+        self.dispense_queue = None
+        self.dispense_started = {}
+        self.dispense_results = [] # (seconds from submit to result, success)
+        self.dispense_lock = threading.Lock() # dispense_started and dispense_results are also used by the queue's worker thread
+        if args.auto_dispense:
+            host, _, port = args.avend.partition(":")
+            self.api = AvendAPI(host=host, port=port or 8080)
+            self.dispense_queue = DispenseQueue(debounce=DISPENSE_DEBOUNCE_S, max_in_flight=MAX_DISPENSES_IN_FLIGHT)
+
+        self.source = VideoFileSource(args.video, loop=args.loop, fps=args.fps, asap=args.asap)
+        if not self.source.isOpened():
+            raise SystemExit(f"Could not open video file {args.video}")
+        self.detection_thread = DetectionThread(source=self.source)
+        self.detection_thread.frame_signal.connect(self.on_frame)
+        self.detection_thread.detection_signal.connect(self.on_detection)
+        self.detection_thread.inference_time_signal.connect(self.on_inference_time)
+        self.detection_thread.camera_status_signal.connect(self.on_camera_status)
+        # Delivered through the main thread's event queue, so a thread that ends before app.exec() still quits it
+        self.detection_thread.finished.connect(self.on_thread_finished)
+
+    def start(self):
+        self.detection_thread.start()
+        if self.args.duration:
+            QTimer.singleShot(int(self.args.duration * 1000), self.stop)
+
+    def stop(self):
+        self.detection_thread.stop() # The thread finishes its current frame, then quits the app
+
+    @Slot()
+    def on_thread_finished(self):
+        QCoreApplication.quit()
+
+    def failure(self):
+        """Why the run produced no results, or None if it did"""
+        if self.frame_count == 0:
+            return "No frames were processed, check that the model loaded and the video is not empty"
+        return None
+
+    @Slot(QImage, int, float)
+    def on_frame(self, q_image, frame_seq, captured_at):
+        now = time.perf_counter()
+        self.frame_latencies.append(now - captured_at)
+        if self.first_frame_time is None:
+            self.first_frame_time = now
+        self.last_frame_time = now
+        self.frame_count += 1
+
+    @Slot(dict)
+    def on_detection(self, detection_payload):
+        self.payload_count += 1
+        verdict_captured_at = detection_payload.get('verdict_captured_at')
+        if verdict_captured_at is not None:
+            now = time.perf_counter()
+            if detection_payload.get('verdict_seq') != self.last_verdict_seq:
+                self.last_verdict_seq = detection_payload.get('verdict_seq')
+                self.verdict_latencies.append(now - verdict_captured_at)
+            stale = now - verdict_captured_at > STALE_VERDICT_S
+            if stale and not self.verdict_stale:
+                self.stale_verdicts += 1
+            self.verdict_stale = stale
+        verdicts = self.ppe_state.update(detection_payload.get('states', {}))
+        elapsed = time.perf_counter() - (self.first_frame_time or time.perf_counter())
+        for key, verdict in verdicts.items():
+            if verdict is not None and verdict != self.current_verdicts[key]:
+                self.current_verdicts[key] = verdict
+                self.verdict_changes.append((round(elapsed, 3), key, verdict))
+                if verdict == MISSING and self.dispense_queue:
+                    self._dispense(key)
+
+    @Slot(float)
+    def on_inference_time(self, seconds):
+        self.inference_times.append(seconds)
+
+    @Slot(object)
+    def on_camera_status(self, is_connected):
+        self.camera_status = is_connected
+
+    def _dispense(self, key):
+        code = AVEND_CODES[key]
+        api = self.api
+        with self.dispense_lock:
+            self.dispense_started[code] = time.perf_counter()
+        self.dispense_queue.submit(("item", code), lambda: api.vend(code), self._on_dispense_result)
+
+    def _on_dispense_result(self, key, response):
+        # Runs on the dispense queue's worker thread
+        _, code = key
+        with self.dispense_lock:
+            self.dispense_results.append((time.perf_counter() - self.dispense_started[code], response.get("success", False)))
+
+    def summary(self):
+        elapsed = (self.last_frame_time - self.first_frame_time) if self.frame_count > 1 else 0.0
+        summary = {
+            "video": self.args.video,
+            "frames": self.frame_count,
+            "detection_payloads": self.payload_count,
+            "source_fps": None if self.args.asap else round(self.source.fps, 2),
+            "frames_skipped": self.source.frames_skipped,
+            "loops": self.source.loops,
+            "elapsed_s": round(elapsed, 2),
+            "fps": round((self.frame_count - 1) / elapsed, 2) if elapsed else None,
+            "inference": latency_summary(self.inference_times),
+            "capture_to_frame": latency_summary(self.frame_latencies),
+            "capture_to_verdict": latency_summary(self.verdict_latencies),
+            "stale_verdicts": self.stale_verdicts,
+            "predictions_per_s": round(len(self.inference_times) / elapsed, 2) if elapsed else None,
+            "verdict_changes": self.verdict_changes,
+            "missing_at_end": self.ppe_state.missing_keys(),
+            "error": self.failure(),
+        }
+        if self.dispense_queue:
+            with self.dispense_lock:
+                results = list(self.dispense_results)
+            summary["dispense"] = latency_summary([seconds for seconds, _ in results])
+            summary["dispense"]["failed"] = sum(1 for _, success in results if not success)
+        return summary
+
+    def shutdown(self):
+        self.detection_thread.stop()
+        self.detection_thread.wait()
+        if self.dispense_queue:
+            self.dispense_queue.stop()
+            self.api.close()
+
+
+def print_summary(summary):
+    print("\n=== Headless Run Summary ===")
+    print(f"Video: {summary['video']}")
+    if summary["error"]:
+        print(f"Error: {summary['error']}")
+    print(f"Frames: {summary['frames']} in {summary['elapsed_s']}s ({summary['fps']} FPS, source {summary['source_fps'] or 'as fast as possible'}), "
+          f"skipped: {summary['frames_skipped']}, loops: {summary['loops']}, detection payloads: {summary['detection_payloads']}")
+    inference = summary["inference"]
+    print(f"Inference: {inference['count']} predictions ({summary['predictions_per_s']}/s), "
+          f"mean {inference['mean_ms']} ms, p50 {inference['p50_ms']} ms, p95 {inference['p95_ms']} ms, p99 {inference['p99_ms']} ms")
+    for name in ("capture_to_frame", "capture_to_verdict"):
+        latency = summary[name]
+        print(f"{name.replace('_', ' ').capitalize()}: mean {latency['mean_ms']} ms, p50 {latency['p50_ms']} ms, p95 {latency['p95_ms']} ms, max {latency['max_ms']} ms")
+    print(f"Stale verdicts (over {STALE_VERDICT_S}s): {summary['stale_verdicts']}")
+    print(f"Button changes: {len(summary['verdict_changes'])}, missing at end: {', '.join(summary['missing_at_end']) or 'none'}")
+    if "dispense" in summary:
+        dispense = summary["dispense"]
+        print(f"Dispenses: {dispense['count']} ({dispense['failed']} failed), p50 {dispense['p50_ms']} ms, p95 {dispense['p95_ms']} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the PPE detection pipeline headless on a video file")
+    parser.add_argument("video", help="Video file fed through DetectionThread instead of a camera")
+    parser.add_argument("--duration", type=float, default=0, help="Stop after this many seconds, 0 to run until the video ends")
+    parser.add_argument("--loop", action="store_true", help="Restart the video at its end (needs --duration)")
+    parser.add_argument("--fps", type=float, help="Play the video at this frame rate instead of its native one")
+    parser.add_argument("--asap", action="store_true", help="Read frames as fast as the pipeline takes them, no pacing or skipped frames")
+    parser.add_argument("--miss-threshold", type=int, default=MISS_THRESHOLD,
+                        help="Consecutive misses before an item counts as missing")
+    parser.add_argument("--auto-dispense", action="store_true", help="Dispense items as they turn missing, like a user tapping the red button")
+    parser.add_argument("--avend", default="127.0.0.1:8080", help="AVend host:port for --auto-dispense, e.g. the mock server")
+    parser.add_argument("--json", help="Also write the summary to this JSON file")
+    parser.add_argument("--metrics-file", help="Write the pipeline stage metrics in Prometheus text format to this file at the end")
+    args = parser.parse_args()
+    if args.loop and not args.duration:
+        parser.error("--loop needs --duration, otherwise the run never ends")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    setup_logging()
+    start_exporters_from_env()
+    app = QCoreApplication(sys.argv)
+    runner = HeadlessRunner(args)
+    runner.start()
+    app.exec()
+    runner.shutdown()
+
+    summary = runner.summary()
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nSummary written to {args.json}")
+    if args.metrics_file:
+        registry.write_file(args.metrics_file)
+        print(f"Metrics written to {args.metrics_file}")
+    sys.exit(1 if summary["error"] else 0)
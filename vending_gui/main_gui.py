@@ -4,10 +4,9 @@ import sys
 import os
 import time
 import threading
+import signal
 import platform
-import traceback
-import serial
-import serial.tools.list_ports
+import logging
 
 # Third-Party
 import cv2
@@ -20,33 +19,56 @@ from PySide6.QtWidgets import (
 from PySide6.QtCore import Qt, QThread, Signal, QTimer, Slot
 from PySide6.QtGui import QFont, QImage, QPixmap, QPainter, QPen
 
+logger = logging.getLogger(__name__)
+
 # Local Imports
 try:
     parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     if parent_dir not in sys.path:
         sys.path.append(parent_dir)
-    from avend_api_client.avend_api import AvendAPI
+    from avend_api_client.avend_api import AvendAPI, DispenseQueue
 except ImportError:
-    print("WARNING: avend_api_client not found. Using Mock AvendAPI.")
+    logger.warning("avend_api_client not found. Using Mock AvendAPI.")
     class AvendAPI:
-        def __init__(self, host="127.0.0.1", port=8080):
+        def __init__(self, host="127.0.0.1", port=8080, on_state_change=None):
             self.base_url = f"http://{host}:{port}/avend"
-            print(f"Mock AvendAPI initialized: {self.base_url}")
+            logger.info("Mock AvendAPI initialized: %s", self.base_url)
         def start_session(self): return {"success": True, "response": "Mock session"}
         def dispense(self, code=None): return {"success": True, "response": f"Mock dispense {code}"}
+        def vend(self, code): return {"success": True, "response": f"Mock vend {code}"}
+        def dispense_cart(self, codes): return {"success": True, "response": f"Mock dispense cart {codes}"}
         def start_service_routine(self): return {"success": True, "response": "Mock H1 start"}
         def stop_service_routine(self): return {"success": True, "response": "Mock H1 stop"}
+        def close(self): pass
+    class DispenseQueue:
+        QUEUED, COALESCED, REJECTED = "queued", "coalesced", "rejected"
+        def __init__(self, debounce=1.0, max_in_flight=4): pass
+        def submit(self, key, func, callback=None):
+            if callback: callback(key, func())
+            return self.QUEUED
+        def depth(self): return 0
+        def stop(self): pass
+
+from vending_gui.ppe_state import PPEStateTracker, DETECTED, MISSING
+from vending_gui.metrics import registry, stage_timer, start_exporters_from_env, PIPELINE_STAGES
+from vending_gui.gui_logging import setup_logging
+from vending_gui.profiler import SamplingProfiler
+from vending_gui.esp32_link import ESP32Link, CONNECTED, CONNECTING
 
 try:
-    from vending_gui.camera_opener import run_detection, try_open_camera, get_linux_cameras, print_camera_info
+    from vending_gui.camera_opener import (
+        run_detection, try_open_camera, get_linux_cameras, print_camera_info, predict_frame, postprocess_result
+    )
     HAS_DETECTION_MODEL = True
 except ImportError as e:
-    print(f"WARNING: Failed to import from capstone_model: {e}. Using mock detection.")
+    logger.warning("Failed to import from capstone_model: %s. Using mock detection.", e)
     HAS_DETECTION_MODEL = False
     def run_detection(): return {'model': None}
     def try_open_camera(idx, **kwargs): return None
     def get_linux_cameras(): return []
     def print_camera_info(cap, idx): pass
+    def predict_frame(model, frame, device='cpu', verbose=True): return None
+    def postprocess_result(result, class_names, class_map, state_keys): return {key: False for key in state_keys}, [], []
 
 # === Constants ===
 DEFAULT_AVEND_IP = "192.168.0.3" # This is the Static IP assigned to the Avend Kit One
@@ -56,10 +78,13 @@ CAMERA_FEED_HEIGHT = 300
 DETECTION_RESOLUTION = (640, 480) # Resolution used during model detection
 BUTTON_WIDTH = 150
 BUTTON_HEIGHT = 90
-MISS_THRESHOLD = 50 # Consecutive misses before button turns red
 OVERRIDE_DURATION_MS = 15000 
 STATUS_RESET_DELAY_MS = 3000
 H1_SERVICE_DELAY_MS = 3000
+DISPENSE_DEBOUNCE_S = 2.0 # Repeated taps on the same item within this window are ignored
+MAX_DISPENSES_IN_FLIGHT = 3 # Queued plus running dispense requests
+PROFILE_DURATION_S = 30 # Length of a profile started from Settings or SIGUSR1
+STALE_VERDICT_S = 1.0 # Verdicts based on a frame captured longer ago than this are flagged as stale
 version = "0.25.0" # Internal version at final tech expo May 1 2025 following previous development seen in ROS2 GUI Package
 
 # === Detection Thread ===
@@ -71,14 +96,23 @@ class DetectionThread(QThread):
     via signals to the main GUI thread. Runs predictions in a separate
     sub-thread to avoid blocking the camera feed.
     """
-    detection_signal = Signal(dict) # Emits {'states': dict, 'boxes': list}
+    detection_signal = Signal(dict) # Emits {'states', 'boxes', 'frame_seq', 'captured_at', 'verdict_seq', 'verdict_captured_at'}
     camera_status_signal = Signal(object) # Emits None, True, or False
-    frame_signal = Signal(QImage) # Emits raw camera frames
+    frame_signal = Signal(QImage, int, float) # Emits raw camera frames with their sequence number and capture time (time.perf_counter)
+    inference_time_signal = Signal(float) # Emits seconds taken by each completed prediction
 
-    def __init__(self):
-        """Initializes thread state variables and lock."""
+    def __init__(self, source=None):
+        """
+        Initializes thread state variables and lock.
+
+        Args:
+            source: Optional already opened capture used instead of probing for a camera,
+                e.g. a camera_opener.VideoFileSource playing a recorded clip. Anything with
+                read/isOpened/release works. The loop ends when it runs out of frames.
+        """
         super().__init__()
         self.is_running = True
+        self.source = source
         self.config = None
         self.model = None
         self.cap = None
@@ -90,17 +124,29 @@ class DetectionThread(QThread):
             "earplugs": False, "gloves": False
         }
         self.latest_boxes = []
+        self.latest_verdict_seq = None # Sequence number of the frame latest_states were predicted from
+        self.latest_verdict_captured_at = None # Capture time of that frame
         self.prediction_running = False
         self._initial_camera_status_sent = False
+        # Metrics, exported when METRICS_PORT or METRICS_FILE is set
+        self.stage_timers = {stage: stage_timer(stage) for stage in PIPELINE_STAGES}
+        self.frames_counter = registry.counter("ppe_frames_total", "Frames read from the camera or video source")
+        self.read_failures_counter = registry.counter("ppe_frame_read_failures_total", "Failed frame reads")
+        self.predictions_counter = registry.counter("ppe_predictions_total", "Completed model predictions")
 
-    def _run_prediction(self, frame_copy):
+    def _run_prediction(self, frame_copy, dispatched_at=None, frame_seq=None, captured_at=None):
         """
         Performs YOLO prediction in a background thread.
 
-        Updates shared state (latest_states, latest_boxes) upon completion.
+        Updates shared state (latest_states, latest_boxes and the verdict's frame) upon completion.
         Args:
             frame_copy: A numpy array copy of the frame to predict on.
+            dispatched_at: time.perf_counter() when the prediction was dispatched, for the queue wait metric.
+            frame_seq: Sequence number of the frame.
+            captured_at: time.perf_counter() when the frame was captured.
         """
+        if dispatched_at is not None:
+            self.stage_timers['queue_wait'].observe(time.perf_counter() - dispatched_at)
         # Initialize locals for THIS prediction run
         prediction_states = {key: False for key in self.latest_states}
         prediction_boxes = []
@@ -109,7 +155,7 @@ class DetectionThread(QThread):
 
         try:
             if self.model is None:
-                 print("Prediction skipped: Model not loaded.")
+                 logger.warning("Prediction skipped: Model not loaded.")
                  with self.lock:
                     self.latest_states = prediction_states
                     self.latest_boxes = prediction_boxes
@@ -118,40 +164,30 @@ class DetectionThread(QThread):
             if torch.cuda.is_available():
                 device_to_use = 'cuda:0'
 
-            results = self.model.predict(frame_copy, conf = 0.15, stream=True, device=device_to_use)
-
-            processed_a_result = False
-            for result in results:
-                processed_a_result = True
-                if result.boxes:
-                    for box in result.boxes:
-                        class_index = int(box.cls)
-                        confidence = float(box.conf)
-                        if self.model.names:
-                            class_name = self.model.names[class_index].lower()
-                            if class_name in self.config['class_map']:
-                                button_key = self.config['class_map'][class_name]
-                                prediction_states[button_key] = True
-                                try:
-                                     coords = box.xyxy[0].cpu().numpy().astype(int)
-                                     prediction_boxes.append({'coords': coords.tolist(), 'label': class_name, 'conf': confidence})
-                                     detection_summary.append(f"{class_name} ({confidence:.2f})")
-                                except Exception as e:
-                                     print(f"Error processing box data: {e}")
-                break
+            inference_start = time.perf_counter()
+            result = predict_frame(self.model, frame_copy, device=device_to_use, verbose=logger.isEnabledFor(logging.DEBUG))
+            postprocess_start = time.perf_counter()
+            prediction_states, prediction_boxes, detection_summary = postprocess_result(
+                result, self.model.names, self.config['class_map'], prediction_states
+            )
+            self.stage_timers['inference'].observe(postprocess_start - inference_start)
+            self.stage_timers['postprocess'].observe(time.perf_counter() - postprocess_start)
+            self.predictions_counter.inc()
 
             if detection_summary:
-                 print(f"[Detection] Found: {', '.join(detection_summary)}")
+                 logger.debug("[Detection] Found: %s", ', '.join(detection_summary))
+            self.inference_time_signal.emit(time.perf_counter() - inference_start)
 
             # Update shared state with results from this run
             with self.lock:
                 self.latest_states = prediction_states
                 self.latest_boxes = prediction_boxes
+                self.latest_verdict_seq = frame_seq
+                self.latest_verdict_captured_at = captured_at
 
         except Exception as e:
-            print(f"Error during prediction sub-thread: {e}")
-            traceback.print_exc()
-            print("Clearing detection state due to prediction error.")
+            logger.exception("Error during prediction sub-thread: %s", e)
+            logger.warning("Clearing detection state due to prediction error.")
             with self.lock:
                 self.latest_states = {key: False for key in self.latest_states}
                 self.latest_boxes = []
@@ -161,59 +197,64 @@ class DetectionThread(QThread):
 
     def run(self):
         """Main loop: Reads camera frames, emits them, and dispatches predictions."""
+        threading.current_thread().name = "DetectionThread" # Names its stacks in profiles
         try:
             self.config = run_detection()
             self.model = self.config.get('model')
 
             if self.model is None and HAS_DETECTION_MODEL:
-                print("DetectionThread: Model loaded but is None. Cannot run detection.")
+                logger.error("DetectionThread: Model loaded but is None. Cannot run detection.")
                 self.camera_status_signal.emit(None)
                 self._initial_camera_status_sent = True
                 return
             elif not HAS_DETECTION_MODEL:
-                 print("DetectionThread: Real model not available. Thread will not run detection logic.")
+                 logger.warning("DetectionThread: Real model not available. Thread will not run detection logic.")
                  self.camera_status_signal.emit(None)
                  self._initial_camera_status_sent = True
                  # In a real scenario without a model, maybe loop sending mock data or exit?
                  # For now, just exit if the real model components are missing.
                  return
 
-            print("\nInitializing camera detection system in DetectionThread...")
+            logger.info("Initializing camera detection system in DetectionThread...")
             self.camera_status_signal.emit(None)
             self._initial_camera_status_sent = True
 
             # Open Camera
             self.cap = None
             self.current_camera_index = None # Reset index before trying
-            if platform.system() != "Windows":
+            if self.source is not None:
+                logger.info("Using provided video source instead of a camera")
+                self.cap = self.source
+            elif platform.system() != "Windows":
                 preferred_indices = [1, 2, 0]
                 for index in preferred_indices:
-                    print(f"\n--- Trying camera index {index} (Linux) ---")
+                    logger.info("Trying camera index %s (Linux)", index)
                     self.cap = try_open_camera(index, max_retries=2, retry_delay=1.5)
                     if self.cap:
                         self.current_camera_index = index # Store successful index
-                        print(f"*** Camera successfully opened on index {self.current_camera_index} ***")
+                        logger.info("Camera successfully opened on index %s", self.current_camera_index)
                         break
             else:
-                print("\n--- Trying external camera (index 1 - Windows) ---")
+                logger.info("Trying external camera (index 1 - Windows)")
                 self.cap = try_open_camera(1, max_retries=3, retry_delay=1.5)
                 if self.cap:
                     self.current_camera_index = 1 # Store successful index
-                    print(f"*** Camera successfully opened on index {self.current_camera_index} ***")
+                    logger.info("Camera successfully opened on index %s", self.current_camera_index)
                 else:
-                    print("\n--- External camera failed, trying built-in camera (index 0 - Windows) ---")
+                    logger.warning("External camera failed, trying built-in camera (index 0 - Windows)")
                     self.cap = try_open_camera(0, max_retries=2, retry_delay=1.0)
                     if self.cap:
                         self.current_camera_index = 0 # Store successful index
-                        print(f"*** Camera successfully opened on index {self.current_camera_index} ***")
+                        logger.info("Camera successfully opened on index %s", self.current_camera_index)
 
             if not self.cap or not self.cap.isOpened():
-                print("FATAL: Failed to initialize ANY camera in DetectionThread.")
+                logger.critical("Failed to initialize ANY camera in DetectionThread.")
                 self.camera_status_signal.emit(False)
                 return
             # If we got here, self.current_camera_index should hold the working index
 
-            print(f"\nCamera setup complete using index {self.current_camera_index}. Starting detection loop...")
+            logger.info("Camera setup complete using %s. Starting detection loop...",
+                        "provided source" if self.source is not None else f"index {self.current_camera_index}")
             self.camera_status_signal.emit(True)
 
             frame_count = 0
@@ -227,38 +268,55 @@ class DetectionThread(QThread):
             while self.is_running:
                 loop_start_time = time.time()
                 ret, frame = self.cap.read()
+                captured_at = time.perf_counter()
                 read_time = time.time() - loop_start_time
+                self.stage_timers['capture'].observe(read_time)
 
+                if not ret and self.source is not None:
+                    logger.info("Video source has no more frames. Stopping detection loop.")
+                    break
                 if not ret:
-                    print(f"Error reading frame (read took {read_time:.4f}s). Retrying...")
+                    self.read_failures_counter.inc()
+                    logger.warning("Error reading frame (read took %.4fs). Retrying...", read_time)
                     time.sleep(0.5)
                     continue
 
                 read_frame_count += 1
                 frame_count += 1
                 fps_frame_count += 1
+                self.frames_counter.inc()
 
                 # Emit Raw Frame
                 if frame is not None:
                     try:
+                        convert_start = time.perf_counter()
                         display_frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                         h, w, ch = display_frame_rgb.shape
                         bytes_per_line = ch * w
                         qt_image = QImage(display_frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                        self.frame_signal.emit(qt_image)
+                        emit_start = time.perf_counter()
+                        self.stage_timers['convert'].observe(emit_start - convert_start)
+                        self.frame_signal.emit(qt_image, frame_count, captured_at)
+                        self.stage_timers['emit_frame'].observe(time.perf_counter() - emit_start)
                     except Exception as e:
-                         print(f"Error converting/emitting frame: {e}")
+                         logger.error("Error converting/emitting frame: %s", e)
 
                 # Emit Current State Payload
                 try:
                     with self.lock:
                         payload = {
                             'states': self.latest_states.copy(),
-                            'boxes': self.latest_boxes
+                            'boxes': self.latest_boxes,
+                            'frame_seq': frame_count,
+                            'captured_at': captured_at,
+                            'verdict_seq': self.latest_verdict_seq,
+                            'verdict_captured_at': self.latest_verdict_captured_at
                         }
+                    emit_start = time.perf_counter()
                     self.detection_signal.emit(payload)
+                    self.stage_timers['emit_payload'].observe(time.perf_counter() - emit_start)
                 except Exception as e:
-                    print(f"Error emitting detection payload: {e}")
+                    logger.error("Error emitting detection payload: %s", e)
 
                 # Dispatch Prediction Thread
                 with self.lock:
@@ -268,10 +326,10 @@ class DetectionThread(QThread):
                     try:
                         with self.lock:
                              self.prediction_running = True
-                        predict_thread = threading.Thread(target=self._run_prediction, args=(frame.copy(),), daemon=True)
+                        predict_thread = threading.Thread(target=self._run_prediction, args=(frame.copy(), time.perf_counter(), frame_count, captured_at), name="inference", daemon=True)
                         predict_thread.start()
                     except Exception as e:
-                        print(f"Error starting prediction thread: {e}")
+                        logger.error("Error starting prediction thread: %s", e)
                         with self.lock:
                              self.prediction_running = False
 
@@ -281,21 +339,21 @@ class DetectionThread(QThread):
                     loop_fps = fps_frame_count / (current_time - fps_start_time)
                     actual_read_fps = read_frame_count / (current_time - read_fps_start_time)
                     with self.lock: pred_running_status = self.prediction_running
-                    print(f"Stats (5s avg): Loop FPS: {loop_fps:.2f}, Read FPS: {actual_read_fps:.2f}, Last read: {read_time:.4f}s, Predicting: {pred_running_status}")
+                    logger.info("Stats (5s avg): Loop FPS: %.2f, Read FPS: %.2f, Last read: %.4fs, Predicting: %s", loop_fps, actual_read_fps, read_time, pred_running_status)
 
                     # --- Check Read FPS and attempt restart if low ---
                     if actual_read_fps < 5.0 and self.current_camera_index is not None:
-                        print(f"WARNING: Read FPS ({actual_read_fps:.2f}) below threshold (5 FPS). Attempting camera restart on stored index {self.current_camera_index}...")
+                        logger.warning("Read FPS (%.2f) below threshold (5 FPS). Attempting camera restart on stored index %s...", actual_read_fps, self.current_camera_index)
                         if self.cap:
                             self.cap.release()
                             self.cap = None
                         time.sleep(1.0) # Give some time before retrying
                         self.cap = try_open_camera(self.current_camera_index, max_retries=2, retry_delay=1.0)
                         if self.cap:
-                            print(f"Camera successfully restarted on index {self.current_camera_index}.")
+                            logger.info("Camera successfully restarted on index %s.", self.current_camera_index)
                             self.camera_status_signal.emit(True) # Re-signal connection
                         else:
-                            print(f"ERROR: Failed to restart camera on index {self.current_camera_index}. Will retry check later.")
+                            logger.error("Failed to restart camera on index %s. Will retry check later.", self.current_camera_index)
                             self.camera_status_signal.emit(False) # Signal temporary failure
 
                     # Reset FPS counters and timers
@@ -304,34 +362,31 @@ class DetectionThread(QThread):
                     fps_start_time = current_time
                     read_fps_start_time = current_time
 
-                # Loop Rate Control
-                loop_duration = time.time() - loop_start_time
-                sleep_time = max(0, target_frame_time - loop_duration)
-                if sleep_time > 0:
-                    time.sleep(sleep_time)
+                # Loop Rate Control (sources like VideoFileSource pace themselves)
+                if not getattr(self.cap, 'controls_rate', False):
+                    loop_duration = time.time() - loop_start_time
+                    sleep_time = max(0, target_frame_time - loop_duration)
+                    if sleep_time > 0:
+                        time.sleep(sleep_time)
 
             # --- Cleanup ---
-            print("Exiting detection loop. Cleaning up camera resources...")
+            logger.info("Exiting detection loop. Cleaning up camera resources...")
             if self.cap:
                 self.cap.release()
-            print("DetectionThread cleanup complete.")
+            logger.info("DetectionThread cleanup complete.")
             self.camera_status_signal.emit(False)
 
         except Exception as e:
-            print(f"\n--- CRITICAL ERROR IN DetectionThread RUN METHOD ---")
-            print(f"Error Type: {type(e).__name__}")
-            print(f"Error Message: {str(e)}")
-            traceback.print_exc()
-            print("--------------------------------------------------")
+            logger.critical("CRITICAL ERROR IN DetectionThread RUN METHOD: %s: %s", type(e).__name__, e, exc_info=True)
             status_to_emit = False if self._initial_camera_status_sent else None
             self.camera_status_signal.emit(status_to_emit)
             if self.cap and self.cap.isOpened():
                  self.cap.release()
-                 print("Camera released after error.")
+                 logger.info("Camera released after error.")
 
     def stop(self):
         """Signals the run loop to stop."""
-        print("DetectionThread stop called.")
+        logger.info("DetectionThread stop called.")
         self.is_running = False
 
 # === Main Window ===
@@ -342,12 +397,20 @@ class MainWindow(QMainWindow):
     Handles UI layout, user interactions, communication with the
     DetectionThread and AVend API.
     """
+    avend_state_signal = Signal(str) # Emits AVend circuit breaker state ("closed" / "open")
+    dispense_result_signal = Signal(object, object) # Emits (request key, API response dict) from the dispense queue
+    profile_finished_signal = Signal(object) # Emits the written profile path, or None if writing failed
+
     def __init__(self):
         """Initializes the main window, UI components, and state."""
         super().__init__()
 
         # --- Core Attributes ---
-        self.api = AvendAPI(host=DEFAULT_AVEND_IP, port=DEFAULT_AVEND_PORT)
+        self.avend_state_signal.connect(self.update_avend_status)
+        self.avend_online = True
+        self.api = AvendAPI(host=DEFAULT_AVEND_IP, port=DEFAULT_AVEND_PORT, on_state_change=self.avend_state_signal.emit)
+        self.dispense_queue = DispenseQueue(debounce=DISPENSE_DEBOUNCE_S, max_in_flight=MAX_DISPENSES_IN_FLIGHT)
+        self.dispense_result_signal.connect(self.handle_dispense_result)
         self.avend_codes = {
             "hardhat": "8D1", 
             "glasses": "8C2", 
@@ -374,24 +437,28 @@ class MainWindow(QMainWindow):
         # --- State Tracking --- #
         self.latest_received_boxes = []
         self.detection_resolution = DETECTION_RESOLUTION
-        self.ppe_missing_counters = {key: 0 for key in self.ppe_keys}
-        self.actual_latest_states = {key: False for key in self.ppe_keys}
+        self.ppe_state = PPEStateTracker(self.ppe_keys) # Miss counters behind the green/red buttons
         self.override_active = False
         self.override_seconds_left = 0
         self.is_settings_visible = False
         self.is_help_visible = False
         self.first_dispense_done = False
-
-        # --- Determine Default ESP32 Port based on OS ---
-        if platform.system() == "Windows":
-            self.esp32_port_name = "COM5"
-        elif platform.system() == "Linux":
-            self.esp32_port_name = "/dev/ttyUSB0"
-        else:
-            self.esp32_port_name = None # Or some other default/fallback
-        print(f"Default ESP32 Port for {platform.system()}: {self.esp32_port_name}")
-
-        self.esp32_serial = None    # Serial connection object
+        self.paint_timer = stage_timer('gui_paint') # Scaling, box drawing and setPixmap per frame
+        self.glass_to_glass_timer = registry.histogram("ppe_glass_to_glass_seconds", "Seconds from frame capture until it is painted on screen")
+        self.capture_to_verdict_timer = registry.histogram("ppe_capture_to_verdict_seconds", "Seconds from frame capture until its PPE verdict reaches the buttons")
+        self.stale_verdict_counter = registry.counter("ppe_stale_verdicts_total", f"Times the shown verdict became older than {STALE_VERDICT_S}s")
+        self.last_verdict_seq = None
+        self.verdict_stale = False
+        self.profiler = SamplingProfiler(on_finished=self.profile_finished_signal.emit)
+        self.profile_finished_signal.connect(self.on_profile_finished)
+
+        # --- ESP32 Port, None lets the link find the ESP32 by USB ID and handshake ---
+        self.esp32_port_name = os.getenv('ESP32_PORT') or None
+        self.esp32_probe_all_ports = os.getenv('ESP32_PROBE_ALL_PORTS', "0") == "1" # Also probe USB serial ports with unknown IDs
+        self.esp32_legacy_fallback = os.getenv('ESP32_LEGACY_FALLBACK', "0") == "1" # Take a known-ID port without handshake reply, for old sketches
+        logger.info("ESP32 Port: %s", self.esp32_port_name or "auto-detect")
+
+        self.esp32_link = None    # Serial worker thread, owns the port
 
         # --- Window Setup ---
         self.setWindowTitle(f"PPE Vending Machine {version}")
@@ -436,8 +503,8 @@ class MainWindow(QMainWindow):
         # --- Detection Thread --- #
         self._start_detection_thread()
 
-        # Attempt initial ESP32 connection using the default port
-        self._connect_to_esp32()
+        # Connect to the ESP32 in the background using the default port
+        self._start_esp32_link()
 
     # === Helper Methods for UI Creation ===
 
@@ -497,8 +564,15 @@ class MainWindow(QMainWindow):
         self.dispensing_status.setFont(QFont('Arial', 16))
         self.dispensing_status.setStyleSheet("QLabel { color: #8E8E93; padding: 8px; background-color: #F8F9FA; border-radius: 8px; }")
 
+        # Only shown while the buttons reflect a frame older than STALE_VERDICT_S
+        self.verdict_status = QLabel("")
+        self.verdict_status.setFont(QFont('Arial', 16, QFont.Bold))
+        self.verdict_status.setStyleSheet(f"QLabel {{ color: white; background-color: {self.danger_color}; padding: 8px; border-radius: 8px; }}")
+        self.verdict_status.hide()
+
         layout.addWidget(self.gate_status)
         layout.addStretch(1)
+        layout.addWidget(self.verdict_status)
         layout.addWidget(self.dispensing_status)
         return frame
 
@@ -549,6 +623,13 @@ class MainWindow(QMainWindow):
             grid_layout.addWidget(button, row, col)
             self.ppe_buttons[key] = button
 
+        # Dispenses every red item in one cart transaction
+        self.dispense_all_button = QPushButton("Dispense All Missing")
+        self.dispense_all_button.setFixedSize(BUTTON_WIDTH * 2 + grid_layout.spacing(), BUTTON_HEIGHT)
+        self.dispense_all_button.setStyleSheet(self._get_button_style(self.nav_color, self.nav_hover_color, self.nav_pressed_color))
+        self.dispense_all_button.clicked.connect(self.dispense_all_missing)
+        grid_layout.addWidget(self.dispense_all_button, 3, 0, 1, 2)
+
         container_layout.addStretch(1)
         container_layout.addLayout(grid_layout)
         container_layout.addStretch(1)
@@ -618,16 +699,48 @@ class MainWindow(QMainWindow):
         if self.esp32_port_name:
             self.esp32_port_input.setText(self.esp32_port_name)
         else:
-            self.esp32_port_input.setPlaceholderText("e.g., COM3 or /dev/ttyUSB0")
+            self.esp32_port_input.setPlaceholderText("Auto-detect, or e.g. COM3 or /dev/ttyUSB0")
         self.esp32_port_input.setStyleSheet("QLineEdit { padding: 10px; border: 1px solid #E1E1E1; border-radius: 6px; font-size: 14px; background-color: white; color: #2C3E50; } QLineEdit:focus { border-color: #007AFF; }")
 
         esp32_port_layout.addWidget(esp32_label)
         esp32_port_layout.addWidget(self.esp32_port_input, 1)
         esp32_layout.addWidget(esp32_port_widget)
 
+        self.esp32_status_label = QLabel("Status: Not connected")
+        self.esp32_status_label.setStyleSheet("font-weight: normal;")
+        esp32_layout.addWidget(self.esp32_status_label)
+        self.esp32_command_label = QLabel("Last command: none")
+        self.esp32_command_label.setStyleSheet("font-weight: normal;")
+        esp32_layout.addWidget(self.esp32_command_label)
+
+        # --- Diagnostics ---
+        diagnostics_group_box = QFrame()
+        diagnostics_layout = QVBoxLayout(diagnostics_group_box)
+        diagnostics_layout.setContentsMargins(0, 10, 0, 0)
+        diagnostics_title = QLabel("Diagnostics")
+        diagnostics_title.setStyleSheet("font-weight: bold; font-size: 16px; margin-bottom: 8px;")
+        diagnostics_layout.addWidget(diagnostics_title)
+
+        profile_widget = QWidget()
+        profile_layout = QHBoxLayout(profile_widget)
+        profile_layout.setContentsMargins(0, 0, 0, 0)
+        profile_layout.setSpacing(8)
+
+        self.profile_btn = QPushButton(f"Start Profiling ({PROFILE_DURATION_S}s)")
+        self.profile_btn.setStyleSheet(self._get_button_style_nav())
+        self.profile_btn.clicked.connect(self.toggle_profiler)
+        self.profile_status = QLabel("Not running")
+        self.profile_status.setStyleSheet("font-weight: normal;")
+        self.profile_status.setWordWrap(True)
+
+        profile_layout.addWidget(self.profile_btn)
+        profile_layout.addWidget(self.profile_status, 1)
+        diagnostics_layout.addWidget(profile_widget)
+
         # Add widgets to form container
         form_layout.addWidget(avend_group_box)
         form_layout.addWidget(esp32_group_box)
+        form_layout.addWidget(diagnostics_group_box)
         form_layout.addSpacing(15)
 
         # Save Button
@@ -668,6 +781,7 @@ class MainWindow(QMainWindow):
 
             Dispensing PPE:
             • Click on the PPE item to dispense if you do not have it.
+            • Click "Dispense All Missing" to get every red item at once.
             • The safety gate will remain locked until all required PPE is detected.
 
             Safety Override:
@@ -746,7 +860,7 @@ class MainWindow(QMainWindow):
     # === Threading ===
     def _start_detection_thread(self):
         """Initializes and starts the background detection thread."""
-        print("Starting Detection Thread...")
+        logger.info("Starting Detection Thread...")
         self.detection_thread = DetectionThread()
         # Connect signals to slots
         self.detection_thread.detection_signal.connect(self.update_button_states_and_boxes)
@@ -756,69 +870,20 @@ class MainWindow(QMainWindow):
 
     # === Serial Communication Helpers ===
 
-    def _connect_to_esp32(self):
-        """Attempts to connect to the ESP32 on the configured COM port."""
-        if self.esp32_serial and self.esp32_serial.is_open:
-            print("ESP32 serial port already open.")
-            return True
-
-        if not self.esp32_port_name:
-            print("ESP32 COM port not configured in settings.")
-            return False
-
-        try:
-            print(f"Attempting to connect to ESP32 on {self.esp32_port_name}...")
-            # Close previous connection if it exists but isn't open
-            if self.esp32_serial:
-                self.esp32_serial.close()
-
-            self.esp32_serial = serial.Serial(
-                port=self.esp32_port_name,
-                baudrate=115200, # Match ESP32 code
-                timeout=1,       # Read timeout
-                write_timeout=1  # Write timeout
-            )
-            # Wait briefly for connection to establish
-            time.sleep(2) # Recommended after opening serial
-            if self.esp32_serial.is_open:
-                print(f"Successfully connected to ESP32 on {self.esp32_port_name}.")
-                self._send_to_esp32("lock") # Send initial lock command
-                return True
-            else:
-                print(f"Failed to open ESP32 serial port {self.esp32_port_name} (is_open is False).")
-                self.esp32_serial = None # Clear if connection failed
-                return False
-        except serial.SerialException as e:
-            print(f"ERROR connecting to ESP32 on {self.esp32_port_name}: {e}")
-            QMessageBox.warning(self, "ESP32 Connection Error", f"Could not connect to {self.esp32_port_name}.\nError: {e}\n\nPlease check the port name and ensure the device is paired/connected.")
-            self.esp32_serial = None # Clear if connection failed
-            return False
-        except Exception as e:
-            print(f"Unexpected ERROR during ESP32 connection: {e}")
-            QMessageBox.critical(self, "ESP32 Error", f"An unexpected error occurred during ESP32 connection: {e}")
-            self.esp32_serial = None # Clear if connection failed
-            return False
+    def _start_esp32_link(self):
+        """Starts the serial worker that connects to the ESP32 in the background."""
+        self.esp32_link = ESP32Link(self.esp32_port_name, probe_all_ports=self.esp32_probe_all_ports,
+                                   legacy_fallback=self.esp32_legacy_fallback)
+        self.esp32_link.state_changed.connect(self.update_esp32_status)
+        self.esp32_link.command_acked.connect(self.on_gate_command_acked)
+        self.esp32_link.command_failed.connect(self.on_gate_command_failed)
+        self.esp32_link.command_sent_unacked.connect(self.on_gate_command_sent_unacked)
+        self.esp32_link.start()
+        self.update_esp32_status(self.esp32_link.state)
 
     def _send_to_esp32(self, command):
-        """Sends a command string to the connected ESP32."""
-        if not self.esp32_serial or not self.esp32_serial.is_open:
-            print(f"ESP32 not connected. Cannot send command: '{command}'")
-            return
-
-        try:
-            command_bytes = f"{command}\n".encode('utf-8')
-            print(f"Sending to ESP32: {command_bytes.decode().strip()}")
-            self.esp32_serial.write(command_bytes)
-            self.esp32_serial.flush()
-        except serial.SerialTimeoutException:
-            print(f"ERROR sending '{command}' to ESP32: Write timeout.")
-            QMessageBox.warning(self, "ESP32 Communication Error", "Write timed out while sending command to ESP32.")
-        except serial.SerialException as e:
-            print(f"ERROR sending '{command}' to ESP32: {e}")
-            QMessageBox.warning(self, "ESP32 Communication Error", f"Serial error sending command to ESP32: {e}")
-        except Exception as e:
-            print(f"Unexpected ERROR sending '{command}' to ESP32: {e}")
-            QMessageBox.critical(self, "ESP32 Error", f"An unexpected error occurred sending command to ESP32: {e}")
+        """Queues a command string for the ESP32, never blocks the GUI thread."""
+        self.esp32_link.send(command)
 
     # === Event Handlers / Slots ===
     @Slot(dict)
@@ -828,36 +893,87 @@ class MainWindow(QMainWindow):
         and stores the latest bounding box data.
 
         Args:
-            detection_payload (dict): Dictionary containing 'states' and 'boxes'.
+            detection_payload (dict): Dictionary containing 'states' and 'boxes', plus the frame and verdict timing.
         """
+        self._track_verdict_age(detection_payload)
         if self.override_active: return # Ignore updates during override
 
         if 'states' in detection_payload:
-            latest_states = detection_payload['states']
-            self.actual_latest_states = latest_states
+            verdicts = self.ppe_state.update(detection_payload['states'])
 
-            for key, button in self.ppe_buttons.items():
-                if key == 'override': continue
-                if key not in self.ppe_missing_counters: continue # Should not happen
+            for key, verdict in verdicts.items():
+                button = self.ppe_buttons.get(key)
+                if button is None: continue # Should not happen
 
-                if key in latest_states and latest_states[key]: # Detected
-                    self.ppe_missing_counters[key] = 0
+                if verdict == DETECTED:
                     button.setStyleSheet(self._get_button_style(self.success_color, "#2CB14F", "#248F3F")) # GREEN
-                else: # Not Detected / Key missing
-                    self.ppe_missing_counters[key] += 1
-                    if self.ppe_missing_counters[key] >= MISS_THRESHOLD:
-                        button.setStyleSheet(self._get_button_style(self.danger_color, "#CC2A25", "#B32620")) # RED
+                elif verdict == MISSING:
+                    button.setStyleSheet(self._get_button_style(self.danger_color, "#CC2A25", "#B32620")) # RED
         else:
-            print("Warning: 'states' key missing from detection payload.")
+            logger.warning("'states' key missing from detection payload.")
 
         if 'boxes' in detection_payload:
              self.latest_received_boxes = detection_payload['boxes']
         # else: keep previous boxes if key is missing
 
+    def _track_verdict_age(self, detection_payload):
+        """Records capture-to-verdict latency of new verdicts and flags verdicts older than STALE_VERDICT_S."""
+        verdict_captured_at = detection_payload.get('verdict_captured_at')
+        if verdict_captured_at is None: return # No prediction finished yet
+
+        now = time.perf_counter()
+        verdict_seq = detection_payload.get('verdict_seq')
+        if verdict_seq != self.last_verdict_seq:
+            self.last_verdict_seq = verdict_seq
+            self.capture_to_verdict_timer.observe(now - verdict_captured_at)
+
+        verdict_age = now - verdict_captured_at
+        stale = verdict_age > STALE_VERDICT_S
+        if stale:
+            if not self.verdict_stale:
+                self.stale_verdict_counter.inc()
+                logger.warning("PPE verdict is stale, based on frame %s captured %.2fs ago.", verdict_seq, verdict_age)
+                self.verdict_status.show()
+            self.verdict_status.setText(f"Detection delayed ({verdict_age:.1f}s old)")
+        elif self.verdict_stale:
+            logger.info("PPE verdict is current again.")
+            self.verdict_status.hide()
+        self.verdict_stale = stale
+
+    @Slot(str)
+    def update_esp32_status(self, state):
+        """Shows the ESP32 link state on the Settings page."""
+        port = self.esp32_link.port
+        if state == CONNECTED:
+            detected = "" if port else " (auto-detected)"
+            legacy = ", old sketch without ACKs, reflash it" if self.esp32_link.legacy else ""
+            self.esp32_status_label.setText(f"Status: Connected on {self.esp32_link.connected_port}{detected}{legacy}")
+        elif state == CONNECTING:
+            self.esp32_status_label.setText(f"Status: Connecting to {port}..." if port else "Status: Searching USB serial ports...")
+        elif port:
+            self.esp32_status_label.setText(f"Status: Not connected, retrying {port}")
+        else:
+            self.esp32_status_label.setText("Status: Not connected, waiting for the ESP32 to be plugged in")
+
+    @Slot(str, float, str)
+    def on_gate_command_acked(self, command, rtt, gate_state):
+        """Shows the ESP32's confirmation of the last gate command."""
+        self.esp32_command_label.setText(f"Last command: {command} confirmed in {rtt * 1000:.0f} ms, gate {gate_state or 'state unknown'}")
+
+    @Slot(str, str)
+    def on_gate_command_failed(self, command, reason):
+        """Shows that the ESP32 never confirmed a gate command."""
+        self.esp32_command_label.setText(f"Last command: {command} NOT confirmed ({reason})")
+
+    @Slot(str)
+    def on_gate_command_sent_unacked(self, command):
+        """Shows a command sent to an old sketch, which cannot confirm it."""
+        self.esp32_command_label.setText(f"Last command: {command} sent, the sketch does not confirm commands")
+
     @Slot(object)
     def update_camera_status(self, is_connected):
         """Updates the main title color based on camera connection status."""
-        print(f"\nCamera Status Update: {is_connected}")
+        logger.info("Camera Status Update: %s", is_connected)
         text_to_set = "Camera Feed"
         color_to_set = self.secondary_color
 
@@ -874,9 +990,25 @@ class MainWindow(QMainWindow):
         if self.camera_feed.text() != text_to_set and not (is_connected and not self.camera_feed.text()):
             self.camera_feed.setText(text_to_set)
 
-    @Slot(QImage)
-    def update_camera_feed(self, q_image):
-        """Updates the camera feed display with the latest frame and boxes."""
+    @Slot(str)
+    def update_avend_status(self, state):
+        """Updates the dispensing status label when the AVend connection goes offline or recovers."""
+        was_online = self.avend_online
+        self.avend_online = state != "open"
+        if not self.avend_online:
+            logger.warning("AVend kit unreachable. Dispensing paused while reconnecting.")
+            self.dispensing_status.setText("AVend offline - reconnecting...")
+            self.dispensing_status.setStyleSheet(f"color: {self.danger_color};")
+        elif not was_online:
+            logger.info("AVend kit reachable again.")
+            self.dispensing_status.setText("AVend reconnected")
+            self.dispensing_status.setStyleSheet(f"color: {self.success_color};")
+            QTimer.singleShot(STATUS_RESET_DELAY_MS, self.reset_status)
+
+    @Slot(QImage, int, float)
+    def update_camera_feed(self, q_image, frame_seq=0, captured_at=0.0):
+        """Updates the camera feed display with the latest frame and boxes, and records its glass-to-glass latency."""
+        paint_start = time.perf_counter()
         try:
             if q_image is None or q_image.isNull(): return
 
@@ -931,39 +1063,54 @@ class MainWindow(QMainWindow):
                               label_text = f"{label} ({confidence:.2f})"
                               painter.drawText(scaled_x, scaled_y - 5, label_text)
                           except KeyError as ke:
-                               print(f"Error drawing box: Key missing {ke} in {box_data}")
+                               logger.error("Error drawing box: Key missing %s in %s", ke, box_data)
                           except Exception as draw_e:
-                               print(f"Error drawing box {box_data}: {draw_e}")
+                               logger.error("Error drawing box %s: %s", box_data, draw_e)
                      painter.end()
                  else:
-                      print("Warning: Invalid detection_resolution for scaling boxes.")
+                      logger.warning("Invalid detection_resolution for scaling boxes.")
 
             # --- Display Pixmap --- #
             if self.camera_feed.text():
                 self.camera_feed.setStyleSheet("QLabel { background-color: black; border-radius: 15px; }")
                 self.camera_feed.setText("")
             self.camera_feed.setPixmap(pixmap)
+            painted_at = time.perf_counter()
+            self.paint_timer.observe(painted_at - paint_start)
+            if captured_at:
+                self.glass_to_glass_timer.observe(painted_at - captured_at)
 
         except Exception as e:
-            print(f"\nError in update_camera_feed: {type(e).__name__}: {e}")
-            traceback.print_exc()
+            logger.exception("Error in update_camera_feed: %s: %s", type(e).__name__, e)
 
     def dispense_item(self, item_key):
         """Handles dispensing a specific item."""
         if item_key in self.avend_codes:
             avend_code = self.avend_codes[item_key]
             item_name = self.item_names.get(item_key, item_key)
-            self.dispensing_status.setText(f"Requesting {item_name} ({avend_code})...")
-            self.dispensing_status.setStyleSheet(f"color: {self.secondary_color};")
-            self.dispense_with_code(avend_code)
+            self.dispense_with_code(avend_code, f"{item_name} ({avend_code})")
         else:
             QMessageBox.warning(self, "Dispense Error", f"No AVend code mapped for {item_key}")
 
+    def dispense_all_missing(self):
+        """Handles dispensing every currently missing (red) item in one cart transaction."""
+        if self.override_active: return # Every button shows green and the PPE state is frozen until the override ends
+        missing_keys = [key for key in self.ppe_state.missing_keys() if key in self.avend_codes]
+        if not missing_keys:
+            self.dispensing_status.setText("All PPE detected, nothing to dispense")
+            self.dispensing_status.setStyleSheet(f"color: {self.success_color};")
+            QTimer.singleShot(STATUS_RESET_DELAY_MS, self.reset_status)
+            return
+
+        codes = [self.avend_codes[key] for key in missing_keys]
+        item_names = ", ".join(self.item_names.get(key, key) for key in missing_keys)
+        self.dispense_cart_with_codes(codes, item_names)
+
     def override_dispense(self):
         """Handles the Override button action: temporary unlock and state change."""
         if self.override_active: return
 
-        print("OVERRIDE ACTIVATED")
+        logger.info("OVERRIDE ACTIVATED")
         self._send_to_esp32("unlock")
 
         self.override_active = True
@@ -988,12 +1135,12 @@ class MainWindow(QMainWindow):
             self.override_seconds_left -= 1
         else:
             self.override_timer.stop()
-            print("Override countdown finished. Resetting state.")
+            logger.info("Override countdown finished. Resetting state.")
             self.reset_override_state()
 
     def reset_override_state(self):
         """Resets the UI and state after the override period ends."""
-        print("Resetting override state...")
+        logger.info("Resetting override state...")
         self._send_to_esp32("lock")
 
         self.override_active = False
@@ -1001,29 +1148,56 @@ class MainWindow(QMainWindow):
         self._set_gate_style_locked()
         # Re-apply actual button states
         self.update_button_states_and_boxes({
-            'states': self.actual_latest_states,
+            'states': self.ppe_state.latest_states,
             'boxes': self.latest_received_boxes
         })
 
-    def dispense_with_code(self, code):
-        """Handles the AVend API interaction for dispensing an item."""
-        session_response = self.api.start_session()
-        if not session_response.get("success", False):
-            # Error handling for session start
-            self.dispensing_status.setText(f"Error: Start Session Failed")
+    def dispense_with_code(self, code, description=None):
+        """Queues the AVend session start and dispense for an item."""
+        api = self.api
+        self._submit_dispense(("item", code), lambda: api.vend(code), description or code)
+
+    def dispense_cart_with_codes(self, codes, description=None):
+        """Queues a cart dispense of several items in one session."""
+        api = self.api
+        self._submit_dispense(("cart", tuple(codes)), lambda: api.dispense_cart(codes), description or ", ".join(codes))
+
+    def _submit_dispense(self, key, func, description):
+        """Submits a request to the dispense queue and shows whether it was queued."""
+        result = self.dispense_queue.submit(key, func, self.dispense_result_signal.emit)
+        if result == DispenseQueue.REJECTED:
+            self.dispensing_status.setText("Busy dispensing, please wait...")
             self.dispensing_status.setStyleSheet(f"color: {self.danger_color};")
             QTimer.singleShot(STATUS_RESET_DELAY_MS, self.reset_status)
+        elif result == DispenseQueue.COALESCED:
+            self.dispensing_status.setText(f"Already requested {description}...")
+            self.dispensing_status.setStyleSheet(f"color: {self.secondary_color};")
+        else:
+            ahead = self.dispense_queue.depth() - 1
+            queue_note = f" ({ahead} ahead)" if ahead > 0 else ""
+            self.dispensing_status.setText(f"Requesting {description}...{queue_note}")
+            self.dispensing_status.setStyleSheet(f"color: {self.secondary_color};")
+
+    @Slot(object, object)
+    def handle_dispense_result(self, key, dispense_response):
+        """Updates the status label with the result of a queued dispense request."""
+        kind, codes = key
+        if dispense_response.get("circuit_open"):
+            # Kit is known to be down, fail fast and keep the offline status visible
+            self.update_avend_status("open")
             return
 
-        dispense_response = self.api.dispense(code=code)
         if dispense_response.get("success", False):
-
+            if kind == "cart":
+                self.dispensing_status.setText(f"Dispensed {len(codes)} item(s)")
+                self.dispensing_status.setStyleSheet(f"color: {self.success_color};")
             if not self.first_dispense_done:
                 self.first_dispense_done = True
                 self.call_h1_service()
         else:
             error_msg = dispense_response.get('error', 'Dispense failed')
-            self.dispensing_status.setText(f"Error: {error_msg} ({code})")
+            failed_code = dispense_response.get('failed_code', codes if kind == "item" else None)
+            self.dispensing_status.setText(f"Error: {error_msg}" + (f" ({failed_code})" if failed_code else ""))
             self.dispensing_status.setStyleSheet(f"color: {self.danger_color};")
 
         # Reset status label after a delay in both success/failure cases
@@ -1032,25 +1206,25 @@ class MainWindow(QMainWindow):
     def call_h1_service(self):
         """Initiates the H1 service routine sequence (console log only)."""
         try:
-            print(f"H1 Service routine check will start in {H1_SERVICE_DELAY_MS / 1000}s (console log only)")
+            logger.info("H1 Service routine check will start in %ss (console log only)", H1_SERVICE_DELAY_MS / 1000)
             QTimer.singleShot(H1_SERVICE_DELAY_MS, self._start_h1_service_routine)
         except Exception as e:
-            print(f"Exception setting up H1 Service routine: {str(e)}")
+            logger.error("Exception setting up H1 Service routine: %s", str(e))
 
     def _start_h1_service_routine(self):
         """Calls the AVend API to start the H1 service routine (console log only)."""
         try:
             service_response = self.api.start_service_routine()
             if service_response.get("success", False):
-                print("Successfully started H1 Service routine (running every 20s - console log only)")
+                logger.info("Successfully started H1 Service routine (running every 20s - console log only)")
             else:
-                 print(f"Error starting H1 Service routine: {service_response.get('error', 'Unknown error')}")
+                 logger.error("Error starting H1 Service routine: %s", service_response.get('error', 'Unknown error'))
         except Exception as e:
-            print(f"Exception running H1 Service routine: {str(e)}")
+            logger.error("Exception running H1 Service routine: %s", str(e))
 
     def reset_status(self):
-        """Resets the dispensing status label to default, avoiding override."""
-        if not self.override_active:
+        """Resets the dispensing status label to default, avoiding override and offline states."""
+        if not self.override_active and self.avend_online:
              self.dispensing_status.setText("Ready to dispense...")
              self.dispensing_status.setStyleSheet("QLabel { color: #8E8E93; padding: 8px; background-color: #F8F9FA; border-radius: 8px; }")
 
@@ -1100,8 +1274,13 @@ class MainWindow(QMainWindow):
             port = int(port_str)
             if not (0 < port < 65536):
                  raise ValueError("Port number out of range")
-            self.api = AvendAPI(host=host, port=port)
-            print(f"AVend API settings saved and reinitialized: {host}:{port}")
+            h1_running = getattr(self.api, "service_running", False)
+            self.api.close()
+            self.api = AvendAPI(host=host, port=port, on_state_change=self.avend_state_signal.emit)
+            self.update_avend_status("closed")
+            if h1_running:
+                self._start_h1_service_routine() # close() stopped the kit's keep-alive on the old client
+            logger.info("AVend API settings saved and reinitialized: %s:%s", host, port)
             avend_saved = True
         except ValueError as ve:
             QMessageBox.warning(self, "Settings Error", f"Invalid AVend port number: {port_str}. {ve}")
@@ -1110,73 +1289,89 @@ class MainWindow(QMainWindow):
 
         # ESP32 Settings
         esp32_port = self.esp32_port_input.text().strip()
-        esp32_connected = False
-        if esp32_port:
-            self.esp32_port_name = esp32_port
-            print(f"ESP32 COM Port set to: {self.esp32_port_name}")
-            # Attempt to connect immediately after saving
-            esp32_connected = self._connect_to_esp32()
-        else:
-            print("ESP32 COM Port cleared.")
-            self.esp32_port_name = None
-            if self.esp32_serial and self.esp32_serial.is_open:
-                self.esp32_serial.close()
-                print("Closed existing ESP32 serial connection.")
-            self.esp32_serial = None
+        if esp32_port != (self.esp32_port_name or ""):
+            self.esp32_port_name = esp32_port or None
+            logger.info("ESP32 COM Port set to: %s", self.esp32_port_name)
+            self.esp32_link.set_port(self.esp32_port_name) # Reconnects in the background
+            self.update_esp32_status(self.esp32_link.state)
 
         # Feedback and close settings view
         if avend_saved:
-             if esp32_port and not esp32_connected:
-                  QMessageBox.information(self, "Settings Saved", f"AVend settings saved for {host}:{port}.\nFailed to connect to ESP32 on {esp32_port}.")
-             elif esp32_port and esp32_connected:
-                  QMessageBox.information(self, "Settings Saved", f"AVend settings saved for {host}:{port}.\nSuccessfully connected to ESP32 on {esp32_port}.")
+             if esp32_port and self.esp32_link.is_connected():
+                  QMessageBox.information(self, "Settings Saved", f"AVend settings saved for {host}:{port}.\nConnected to ESP32 on {esp32_port}.")
+             elif esp32_port:
+                  QMessageBox.information(self, "Settings Saved", f"AVend settings saved for {host}:{port}.\nConnecting to ESP32 on {esp32_port} in the background.")
              else:
-                  QMessageBox.information(self, "Settings Saved", f"AVend settings saved for {host}:{port}. ESP32 port not set.")
+                  QMessageBox.information(self, "Settings Saved", f"AVend settings saved for {host}:{port}.\nThe ESP32 is detected automatically.")
              self.toggle_settings() # Return to main view only if AVend settings were valid
         # else: Keep settings view open if AVend settings were invalid
 
+    @Slot()
+    def toggle_profiler(self):
+        """Starts a sampling profile of all threads, or stops the running one early."""
+        if self.profiler.toggle(PROFILE_DURATION_S):
+            logger.info("Profiling started for %ss", PROFILE_DURATION_S)
+            self.profile_btn.setText("Stop Profiling")
+            self.profile_status.setText(f"Profiling all threads for {PROFILE_DURATION_S}s...")
+        else:
+            self.profile_status.setText("Stopping, writing profile...")
+
+    @Slot(object)
+    def on_profile_finished(self, path):
+        """Shows where the finished profile was written."""
+        self.profile_btn.setText(f"Start Profiling ({PROFILE_DURATION_S}s)")
+        self.profile_status.setText(f"Saved to {path}" if path else "Failed to write profile, see log")
+
     def closeEvent(self, event):
         """Handles the window close event, ensuring threads and connections are stopped."""
-        print("Close event triggered. Stopping threads and connections...")
+        logger.info("Close event triggered. Stopping threads and connections...")
         # Stop Detection Thread
         if hasattr(self, 'detection_thread') and self.detection_thread.isRunning():
             self.detection_thread.stop()
             if not self.detection_thread.wait(5000):
-                 print("Warning: Detection thread did not stop gracefully. Terminating.")
+                 logger.warning("Detection thread did not stop gracefully. Terminating.")
                  self.detection_thread.terminate()
                  self.detection_thread.wait()
-            print("Detection thread stopped.")
+            logger.info("Detection thread stopped.")
+
+        # Drop queued dispense requests
+        if hasattr(self, 'dispense_queue'):
+            self.dispense_queue.stop()
 
         # Stop Override Timer
         if hasattr(self, 'override_timer') and self.override_timer.isActive():
             self.override_timer.stop()
-            print("Override timer stopped.")
+            logger.info("Override timer stopped.")
 
-        # Stop H1 Service (if applicable)
-        if hasattr(self, 'api') and hasattr(self.api, 'stop_service_routine'):
+        # Stop the H1 Service routine and the health probe
+        if hasattr(self, 'api'):
             try:
-                 if callable(self.api.stop_service_routine):
-                     self.api.stop_service_routine()
-                     print("H1 Service routine stopped.")
+                self.api.close()
+                logger.info("AVend client closed, H1 Service routine and health probe stopped.")
             except Exception as e:
-                print(f"Error stopping H1 Service routine: {str(e)}")
+                logger.error("Error closing the AVend client: %s", str(e))
 
-        # Close Serial Port
-        if hasattr(self, 'esp32_serial') and self.esp32_serial and self.esp32_serial.is_open:
-            try:
-                print(f"Closing ESP32 serial port {self.esp32_port_name}...")
-                self.esp32_serial.close()
-                print("ESP32 serial port closed.")
-            except serial.SerialException as e:
-                print(f"Error closing ESP32 serial port: {e}")
-            except Exception as e:
-                print(f"Unexpected error closing ESP32 serial port: {e}")
+        # Stop the ESP32 link, it closes the serial port
+        if self.esp32_link and self.esp32_link.isRunning():
+            self.esp32_link.stop()
+            if not self.esp32_link.wait(2000):
+                logger.warning("ESP32 link did not stop gracefully.")
+            else:
+                logger.info("ESP32 link stopped.")
 
         super().closeEvent(event)
 
 # === Main Execution ===
 if __name__ == '__main__':
+    setup_logging()
+    start_exporters_from_env()
     app = QApplication(sys.argv)
     window = MainWindow()
+    if hasattr(signal, 'SIGUSR1'): # `kill -USR1 <pid>` toggles profiling without touching the kiosk
+        signal.signal(signal.SIGUSR1, lambda signum, frame: window.toggle_profiler())
+        # Python only runs signal handlers between bytecodes, wake it up even when no frames arrive
+        signal_timer = QTimer()
+        signal_timer.timeout.connect(lambda: None)
+        signal_timer.start(500)
     window.showMaximized()
     sys.exit(app.exec()) 
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""
+Low-overhead pipeline metrics for the PPE vending GUI.
+
+Histograms and counters are recorded in memory (one bisect and a locked
+increment per observation) and exported in the Prometheus text format, either
+over a local HTTP endpoint or to a file a node_exporter textfile collector can
+pick up. Nothing is exported unless METRICS_PORT or METRICS_FILE is set.
+
+percentile() and latency_summary() are shared by the offline tools (headless
+runner, benchmark, ESP32 simulator) for their reports. The AVend load generator
+keeps its own copy so the API client does not depend on the GUI package.
+"""
+
+import os
+import time
+import bisect
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds in seconds, from sub-millisecond conversions up to slow CPU inference
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Stages timed by DetectionThread and MainWindow
+PIPELINE_STAGES = ("capture", "convert", "emit_frame", "emit_payload", "queue_wait", "inference", "postprocess", "gui_paint")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Histogram:
+    """Cumulative-bucket histogram, safe to observe from several threads."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1) # Last slot counts values above every bucket
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Context manager observing the seconds spent in its block."""
+        return _Timer(self)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Counter:
+    """Monotonic counter, safe to increment from several threads."""
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class MetricsRegistry:
+    """Named metrics with optional labels, rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = {} # name -> {'type', 'help', 'series': {labels tuple: metric}}
+        self.lock = threading.Lock()
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(name, "histogram", help_text, labels, lambda: Histogram(buckets))
+
+    def counter(self, name, help_text, **labels):
+        return self._get(name, "counter", help_text, labels, Counter)
+
+    def _get(self, name, metric_type, help_text, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            family = self.metrics.setdefault(name, {'type': metric_type, 'help': help_text, 'series': {}})
+            if family['type'] != metric_type:
+                raise ValueError(f"Metric {name} is already registered as a {family['type']}")
+            if key not in family['series']:
+                family['series'][key] = factory()
+            return family['series'][key]
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self.lock:
+            families = [(name, family['type'], family['help'], list(family['series'].items()))
+                        for name, family in sorted(self.metrics.items())]
+        lines = []
+        for name, metric_type, help_text, series in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, metric in series:
+                if metric_type == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+                    continue
+                counts, total, count = metric.snapshot()
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    bucket_labels = labels + (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        """Writes the metrics to path atomically, so a collector never reads a partial file."""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(self.render())
+        os.replace(temp_path, path)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def latency_summary(seconds, digits=2):
+    """Count, mean, p50/p95/p99 and max in milliseconds (rounded to digits) of a list of durations in seconds"""
+    values = sorted(seconds)
+    summary = {"count": len(values)}
+    summary["mean_ms"] = round(sum(values) / len(values) * 1000, digits) if values else None
+    for pct in (50, 95, 99):
+        value = percentile(values, pct)
+        summary[f"p{pct}_ms"] = round(value * 1000, digits) if value is not None else None
+    summary["max_ms"] = round(values[-1] * 1000, digits) if values else None
+    return summary
+
+
+# Shared registry and the pipeline's stage timers
+registry = MetricsRegistry()
+
+
+def stage_timer(stage):
+    """Histogram of the seconds spent in one pipeline stage."""
+    return registry.histogram("ppe_pipeline_stage_seconds", "Seconds spent in each stage of the detection pipeline", stage=stage)
+
+
+def start_http_server(port, host="127.0.0.1", metrics_registry=registry):
+    """Serves the metrics at http://host:port/metrics from a daemon thread, returns the server."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics_registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Scrapes every few seconds would flood the console
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Metrics available at http://%s:%s/metrics", host, port)
+    return server
+
+
+def start_file_writer(path, interval=15.0, metrics_registry=registry):
+    """Rewrites the metrics file every interval seconds from a daemon thread, returns a stop event."""
+    stop_event = threading.Event()
+
+    def write_loop():
+        while not stop_event.wait(interval):
+            try:
+                metrics_registry.write_file(path)
+            except OSError as e:
+                logger.error("Error writing metrics file %s: %s", path, e)
+
+    threading.Thread(target=write_loop, name="metrics-file", daemon=True).start()
+    logger.info("Writing metrics to %s every %ss", path, interval)
+    return stop_event
+
+
+def start_exporters_from_env():
+    """Starts the exporters configured by METRICS_PORT / METRICS_HOST and METRICS_FILE, if any."""
+    port = os.getenv('METRICS_PORT')
+    path = os.getenv('METRICS_FILE')
+    if port:
+        try:
+            start_http_server(int(port), host=os.getenv('METRICS_HOST', "127.0.0.1"))
+        except (OSError, ValueError) as e:
+            logger.error("Could not start metrics endpoint on port %s: %s", port, e)
+    if path:
+        start_file_writer(path)
@@ -0,0 +1,62 @@
+"""
+PPE detection state machine shared by the GUI and the headless runner.
+
+Keeps the per-item miss counters that decide when a PPE button turns green
+(detected) or red (missing), without any Qt dependency.
+"""
+
+MISS_THRESHOLD = 50 # Consecutive misses before button turns red
+
+# Verdicts returned by PPEStateTracker.update() for each item
+DETECTED = "detected"
+MISSING = "missing"
+
+
+class PPEStateTracker:
+    """
+    Tracks detection persistence for each PPE item.
+
+    An item is detected as soon as one detection payload contains it, and only
+    becomes missing after miss_threshold consecutive payloads without it, so a
+    single dropped detection does not flip the button red.
+    """
+
+    def __init__(self, keys, miss_threshold=MISS_THRESHOLD):
+        self.keys = list(keys)
+        self.miss_threshold = miss_threshold
+        self.missing_counters = {key: 0 for key in self.keys}
+        self.missing = {key: True for key in self.keys} # True while the button is red
+        self.latest_states = {key: False for key in self.keys}
+
+    def update(self, states):
+        """
+        Applies one detection payload's states.
+
+        Args:
+            states (dict): Item key -> True if detected in the latest prediction.
+        Returns:
+            dict: Item key -> DETECTED, MISSING, or None while still within the miss threshold.
+        """
+        self.latest_states = states
+        verdicts = {}
+        for key in self.keys:
+            if states.get(key): # Detected
+                self.missing_counters[key] = 0
+                self.missing[key] = False
+                verdicts[key] = DETECTED
+            else: # Not Detected / Key missing
+                self.missing_counters[key] += 1
+                if self.missing_counters[key] >= self.miss_threshold:
+                    self.missing[key] = True
+                    verdicts[key] = MISSING
+                else:
+                    verdicts[key] = None
+        return verdicts
+
+    def missing_keys(self):
+        """Items currently shown as missing (red)."""
+        return [key for key in self.keys if self.missing[key]]
+
+    def all_detected(self):
+        """True when no item is missing."""
+        return not self.missing_keys()
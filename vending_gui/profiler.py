@@ -0,0 +1,109 @@
+"""
+In-process sampling profiler for the PPE vending GUI.
+
+While running, a background thread snapshots the stack of every Python thread
+(the GUI thread, DetectionThread, inference workers, dispense queue) with
+sys._current_frames() at a fixed interval, then writes the counts in the folded
+stack format read by flamegraph.pl, speedscope and inferno:
+
+    MainThread;<module> (main_gui.py:1360);update_camera_feed (main_gui.py:1010) 42
+
+Nothing runs while it is stopped, so it can stay in the kiosk build.
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+DEFAULT_INTERVAL = 0.01 # Seconds between samples (100 Hz)
+DEFAULT_DURATION = 30.0 # Seconds sampled before the profile is written
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples all threads for a fixed window and writes a .folded file.
+
+    on_finished, if given, is called from the sampling thread with the path of the
+    written file (or None if writing failed).
+    """
+
+    def __init__(self, output_dir=PROFILE_DIR, interval=DEFAULT_INTERVAL, on_finished=None):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.on_finished = on_finished
+        self.stacks = Counter()
+        self.samples = 0
+        self.last_path = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration=DEFAULT_DURATION):
+        """Starts sampling for duration seconds. Returns False if a profile is already running."""
+        with self._lock:
+            if self.is_running():
+                return False
+            self.stacks = Counter()
+            self.samples = 0
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, args=(duration,), name="profiler", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        """Ends the current profile early, it is still written."""
+        self._stop_event.set()
+
+    def toggle(self, duration=DEFAULT_DURATION):
+        """Starts a profile, or stops the running one. Returns True if a profile was started."""
+        if self.is_running():
+            self.stop()
+            return False
+        return self.start(duration)
+
+    def _run(self, duration):
+        started = time.monotonic()
+        own_ident = threading.get_ident()
+        while not self._stop_event.is_set() and time.monotonic() - started < duration:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            self._stop_event.wait(self.interval)
+        self.last_path = self._write(time.monotonic() - started)
+        if self.on_finished:
+            self.on_finished(self.last_path)
+
+    def _write(self, elapsed):
+        path = os.path.join(self.output_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(path, "w") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.error("Error writing profile %s: %s", path, e)
+            return None
+        logger.info("Profile written to %s (%d samples over %.1fs)", path, self.samples, elapsed)
+        return path